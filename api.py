@@ -0,0 +1,302 @@
+"""Versioned JSON API for timelines and follow lists.
+
+    GET /api/v1/timeline                 the logged-in user's home timeline
+    GET /api/v1/users/<id>/messages      a user's messages
+    GET /api/v1/users/<id>/liked         messages a user has liked
+    GET /api/v1/users/<id>/followers     (logged in)
+    GET /api/v1/users/<id>/following     (logged in)
+    GET /api/v1/suggestions              who the logged-in user might follow
+    GET /api/v1/trending                 the most liked recent messages
+
+Responses look like {"data": [...], "paging": {"older": ..., "newer": ...}};
+pass a cursor back as `before` (older) or `after` (newer) for the next page,
+and `limit` for its size (at most MAX_LIMIT). Suggestions come as a single
+page, best first, as do trending messages (`period` is hour, day or week).
+
+`fields` picks what each item contains, e.g. `?fields=id,text,user.username`.
+Only those columns are selected, rows are serialized straight from the
+column tuples (with orjson when it's installed), and the body is streamed
+an item at a time.
+"""
+
+import json
+
+from flask import Blueprint, Response, abort, g, jsonify, request
+from werkzeug.exceptions import HTTPException
+
+from models import db, Follows, Like, Message, User
+from pagination import PER_PAGE, Page, cursor_args, paginate
+import suggestions
+import timeline
+import trending
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+MAX_LIMIT = 100
+
+MESSAGE_FIELDS = {
+    'id': Message.id,
+    'text': Message.text,
+    'timestamp': Message.timestamp,
+    'like_count': Message.like_count,
+    'user.id': User.id,
+    'user.username': User.username,
+    'user.image_url': User.image_url,
+}
+
+USER_FIELDS = {
+    'id': User.id,
+    'username': User.username,
+    'image_url': User.image_url,
+    'header_image_url': User.header_image_url,
+    'bio': User.bio,
+    'location': User.location,
+    'messages_count': User.messages_count,
+    'followers_count': User.followers_count,
+    'following_count': User.following_count,
+    'likes_count': User.likes_count,
+}
+
+MESSAGE_KEYS = [Message.timestamp, Message.id]
+USER_KEYS = [User.id]
+
+v1 = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+
+
+##############################################################################
+# Encoding
+
+
+_encoder = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False,
+                            default=lambda value: value.isoformat())
+
+
+def dumps(value):
+    """`value` as compact JSON bytes; datetimes become ISO 8601 strings."""
+
+    if orjson is not None:
+        return orjson.dumps(value)
+    return _encoder.encode(value).encode()
+
+
+##############################################################################
+# Field selection
+
+
+def requested_fields(available):
+    """Field names from the `fields` arg (default: all), or a 400."""
+
+    raw = request.args.get('fields')
+    if not raw:
+        return list(available)
+
+    fields = list(dict.fromkeys(
+        name.strip() for name in raw.split(',') if name.strip()))
+    unknown = [name for name in fields if name not in available]
+    if unknown or not fields:
+        abort(400, f"Unknown fields: {', '.join(unknown)}. "
+                   f"Available: {', '.join(available)}.")
+    return fields
+
+
+def field_query(fields, available, keys):
+    """Query selecting `fields`, then the sort `keys`, as plain tuples.
+
+    Returns the query and a function giving a row's key values.
+    """
+
+    columns = ([available[name].label(f"f{i}")
+                for i, name in enumerate(fields)]
+               + [key.label(f"k{i}") for i, key in enumerate(keys)])
+    n = len(fields)
+
+    return db.session.query(*columns), lambda row: tuple(row[n:])
+
+
+def message_rows(fields):
+    query, key = field_query(fields, MESSAGE_FIELDS, MESSAGE_KEYS)
+    query = query.select_from(Message).filter(Message.deleted_at.is_(None))
+    if any(name.startswith('user.') for name in fields):
+        query = query.join(User, User.id == Message.user_id)
+    return query, key
+
+
+def user_rows(fields):
+    query, key = field_query(fields, USER_FIELDS, USER_KEYS)
+    return query.select_from(User).filter(User.deleted_at.is_(None)), key
+
+
+##############################################################################
+# Responses
+
+
+def limit_arg():
+    limit = request.args.get('limit', PER_PAGE, type=int)
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def stream_page(page, fields):
+    """Stream `page` as JSON, building each item from its row tuple."""
+
+    paths = [name.split('.') for name in fields]
+    paging = dict(older=page.older_cursor, newer=page.newer_cursor)
+
+    def item(row):
+        out = {}
+        for path, value in zip(paths, row):
+            target = out
+            for part in path[:-1]:
+                target = target.setdefault(part, {})
+            target[path[-1]] = value
+        return out
+
+    def generate():
+        yield b'{"data":['
+        for i, row in enumerate(page.items):
+            if i:
+                yield b','
+            yield dumps(item(row))
+        yield b'],"paging":' + dumps(paging) + b'}'
+
+    return Response(generate(), mimetype='application/json')
+
+
+def require_login():
+    if not g.user:
+        abort(401, "Access unauthorized.")
+
+
+def require_user(user_id):
+    if not (db.session
+            .query(User.id)
+            .filter(User.id == user_id, User.deleted_at.is_(None))
+            .scalar()):
+        abort(404)
+
+
+@v1.errorhandler(HTTPException)
+def json_error(error):
+    response = jsonify(error=error.description)
+    response.status_code = error.code
+    return response
+
+
+##############################################################################
+# Endpoints
+
+
+@v1.route('/timeline')
+def home_timeline():
+    """The logged-in user's home timeline."""
+
+    require_login()
+    fields = requested_fields(MESSAGE_FIELDS)
+    messages, key = message_rows(fields)
+    before, after = cursor_args(MESSAGE_KEYS)
+
+    page = timeline.home_timeline(g.user.id, before, after, limit_arg(),
+                                  messages=messages, key=key)
+
+    return stream_page(page, fields)
+
+
+@v1.route('/users/<int:user_id>/messages')
+def user_messages(user_id):
+    """A user's messages, newest first."""
+
+    require_user(user_id)
+    fields = requested_fields(MESSAGE_FIELDS)
+    messages, key = message_rows(fields)
+
+    page = paginate(messages.filter(Message.user_id == user_id),
+                    MESSAGE_KEYS, key, limit_arg())
+
+    return stream_page(page, fields)
+
+
+@v1.route('/users/<int:user_id>/liked')
+def user_liked(user_id):
+    """Messages a user has liked, newest first."""
+
+    require_user(user_id)
+    fields = requested_fields(MESSAGE_FIELDS)
+    messages, key = message_rows(fields)
+
+    page = paginate(messages
+                        .join(Like, Like.msg_id == Message.id)
+                        .filter(Like.user_liked_id == user_id),
+                    MESSAGE_KEYS, key, limit_arg())
+
+    return stream_page(page, fields)
+
+
+@v1.route('/users/<int:user_id>/followers')
+def user_followers(user_id):
+    """Users following a user."""
+
+    require_login()
+    require_user(user_id)
+    fields = requested_fields(USER_FIELDS)
+    users, key = user_rows(fields)
+
+    page = paginate(users
+                        .join(Follows, Follows.user_following_id == User.id)
+                        .filter(Follows.user_being_followed_id == user_id),
+                    USER_KEYS, key, limit_arg())
+
+    return stream_page(page, fields)
+
+
+@v1.route('/users/<int:user_id>/following')
+def user_following(user_id):
+    """Users a user follows."""
+
+    require_login()
+    require_user(user_id)
+    fields = requested_fields(USER_FIELDS)
+    users, key = user_rows(fields)
+
+    page = paginate(users
+                        .join(Follows, Follows.user_being_followed_id == User.id)
+                        .filter(Follows.user_following_id == user_id),
+                    USER_KEYS, key, limit_arg())
+
+    return stream_page(page, fields)
+
+
+@v1.route('/suggestions')
+def suggested_users():
+    """Accounts the logged-in user might want to follow, best first."""
+
+    require_login()
+    fields = requested_fields(USER_FIELDS)
+    users, _ = user_rows(fields)
+
+    rows = (suggestions
+            .for_user(users, g.user.id)
+            .limit(limit_arg())
+            .all())
+
+    return stream_page(Page(rows), fields)
+
+
+@v1.route('/trending')
+def trending_messages():
+    """The most liked messages of the last hour, day or week, best first."""
+
+    period = request.args.get('period', trending.DEFAULT_PERIOD)
+    if period not in trending.PERIODS:
+        abort(400, f"Unknown period: {period}. "
+                   f"Available: {', '.join(trending.PERIODS)}.")
+    fields = requested_fields(MESSAGE_FIELDS)
+    messages, _ = message_rows(fields)
+
+    rows = (trending
+            .ranked(messages, period)
+            .limit(limit_arg())
+            .all())
+
+    return stream_page(Page(rows), fields)
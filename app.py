@@ -1,14 +1,46 @@
+import json
 import os
+import time
+from datetime import datetime
 
-from flask import Flask, render_template, request, flash, redirect, session, g
+import click
+from flask import Flask, render_template, request, flash, redirect, session, g, jsonify, abort
 from flask_debugtoolbar import DebugToolbarExtension
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import undefer
 
+from api import v1 as api_v1
+from cache import RedisBackend
 from forms import UserAddForm, LoginForm, MessageForm, UserEditForm
-from models import db, connect_db, User, Message, Like
+from models import (db, connect_db, User, Message, Like, Follows, TimelineEntry,
+                    MessageTag, Mention)
+from loading import message_query, user_query
+from pagination import paginate, cursor_args
+import counters
+import current_user
+import follows
+import fragments
+import fulltext
+import graphindex
+import hashing
+import httpcache
+import jobs
+import likes
+import migrations
+import purge  # registers the purge jobs
+import search
+import sqlstats
+import suggestions
+import tags
+import timeline
+import trending
+from viewer import ViewerContext
 
 CURR_USER_KEY = "curr_user"
 
+# seconds a "too busy" answer asks the client to wait before retrying
+HASHING_RETRY_AFTER = 5
+
 app = Flask(__name__)
 
 # Get DB_URI from environ variable (useful for production/testing) or,
@@ -16,13 +48,61 @@ app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = (
     os.environ.get('DATABASE_URL', 'postgres:///warbler'))
 
+# optional read replicas for GET requests, comma-separated (see routing.py)
+app.config['SQLALCHEMY_REPLICA_URIS'] = [
+    uri for uri in os.environ.get('DATABASE_REPLICA_URLS', '').split(',')
+    if uri]
+app.config['SQLALCHEMY_REPLICA_STRATEGY'] = os.environ.get(
+    'DATABASE_REPLICA_STRATEGY', 'round_robin')
+
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SQLALCHEMY_ECHO'] = False
 app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = False
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', "it's a secret")
+
+# bcrypt cost, and how many hashes may run / wait at once per process. A
+# web process serves WEB_THREADS requests at once (gunicorn.conf.py); by
+# default a quarter of them may hash and a quarter more wait, so logins
+# past that are turned away while the rest keep serving pages.
+app.config['BCRYPT_LOG_ROUNDS'] = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+app.config['WEB_THREADS'] = int(os.environ.get('WEB_THREADS', 8))
+app.config['HASH_WORKERS'] = int(os.environ.get(
+    'HASH_WORKERS', max(1, app.config['WEB_THREADS'] // 4)))
+app.config['HASH_QUEUE_SIZE'] = int(os.environ.get(
+    'HASH_QUEUE_SIZE', max(1, app.config['WEB_THREADS'] // 4)))
+
+# share of requests to collect SQL statistics for (see sqlstats.py), and
+# whether to send them back as response headers
+app.config['SQL_STATS_SAMPLE_RATE'] = float(
+    os.environ.get('SQL_STATS_SAMPLE_RATE', 0.01))
+app.config['SQL_STATS_SLOW_MS'] = int(os.environ.get('SQL_STATS_SLOW_MS', 500))
+app.config['SQL_STATS_HEADERS'] = bool(os.environ.get('SQL_STATS_HEADERS'))
+
+# answer "does the viewer follow X?" from an in-process copy of the follow
+# graph, rebuilt from the database every GRAPH_INDEX_MAX_AGE seconds (see
+# graphindex.py)
+app.config['GRAPH_INDEX'] = bool(os.environ.get('GRAPH_INDEX'))
+app.config['GRAPH_INDEX_MAX_AGE'] = int(
+    os.environ.get('GRAPH_INDEX_MAX_AGE', 60))
 toolbar = DebugToolbarExtension(app)
 
 connect_db(app)
+sqlstats.init_app(app)
+httpcache.init_app(app)
+fragments.init_app(app)
+app.register_blueprint(api_v1)
+
+hashing.configure(rounds=app.config['BCRYPT_LOG_ROUNDS'],
+                  workers=app.config['HASH_WORKERS'],
+                  queue_size=app.config['HASH_QUEUE_SIZE'])
+
+# share current-user snapshots and rendered fragments between workers when
+# a redis is configured
+if os.environ.get('REDIS_URL'):
+    import redis
+    shared_cache = RedisBackend(redis.from_url(os.environ['REDIS_URL']))
+    current_user.snapshots.shared = shared_cache
+    fragments.fragments.shared = shared_cache
 
 
 ##############################################################################
@@ -35,13 +115,21 @@ def add_user_to_g():
 
     # store user instance as a key in the global (g) dictionary provided by Flask
     # also useful for authenticate user in forms that only contain button
+    # g.user is a cached snapshot (see current_user.py); use g.user.record
+    # for the full User when a route needs to change it
     if CURR_USER_KEY in session:
-        g.user = User.query.get(session[CURR_USER_KEY])
+        g.user = current_user.load(session[CURR_USER_KEY])
+        if g.user is None:
+            # the account is gone
+            do_logout()
     # g.user will always refer to the instance of the user who is making requests
     else:
         g.user = None
     # abstraction helps with working with bigger teams 
 
+    # liked/following state for whatever this request renders
+    g.viewer = ViewerContext(g.user.id if g.user else None)
+
 
 def do_login(user):
     """Log in user."""
@@ -79,6 +167,7 @@ def signup():
                 image_url=form.image_url.data or User.image_url.default.arg,
             )
             db.session.commit()
+            search.ngram_index.add(user.id, user.username)
 
         except IntegrityError:
             flash("Username already taken", 'danger')
@@ -103,6 +192,8 @@ def login():
                                  form.password.data)
 
         if user:
+            # saves the password hash if authenticate upgraded its cost
+            db.session.commit()
             do_login(user)
             flash(f"Hello, {user.username}!", "success")
             return redirect("/")
@@ -112,6 +203,16 @@ def login():
     return render_template('users/login.html', form=form)
 
 
+@app.errorhandler(hashing.HashingBusy)
+def hashing_busy(error):
+    """Too many logins/signups are hashing passwords; ask to retry."""
+
+    flash("Warbler is very busy right now. Please try again in a moment.",
+          'danger')
+    return (render_template('base.html'), 503,
+            {'Retry-After': str(HASHING_RETRY_AFTER)})
+
+
 @app.route('/logout')
 def logout():
     """Handle logout of user."""
@@ -135,26 +236,116 @@ def list_users():
     Can take a 'q' param in querystring to search by that username.
     """
 
-    search = request.args.get('q')
+    term = request.args.get('q')
 
-    if not search:
-        users = User.query.all()
+    if not term:
+        page = paginate(user_query('card'), [User.id])
     else:
-        users = User.query.filter(User.username.like(f"%{search}%")).all()
+        page = search.search_page(term)
+
+    g.viewer.load(users=page.items)
+
+    return render_template('users/index.html', users=page.items, page=page)
+
+
+@app.route('/users/typeahead')
+def users_typeahead():
+    """JSON list of users whose username starts with the 'q' param."""
+
+    term = request.args.get('q', '')
+    if not term:
+        return jsonify(users=[])
+
+    users = [dict(id=id, username=username, image_url=image_url)
+             for id, username, image_url in search.typeahead(term)]
+
+    return jsonify(users=users)
+
+
+def user_updated_at(user_id):
+    return (db.session
+              .query(User.updated_at)
+              .filter(User.id == user_id)
+              .scalar())
+
+
+def user_version(user_id):
+    """Cache validator for pages about one user (see httpcache.py)."""
+
+    updated_at = user_updated_at(user_id)
+    if updated_at is None:
+        return None
+
+    return ('user', user_id, updated_at), updated_at
+
+
+def follow_list_page(user_id, listed, owner):
+    """The requested page of users in one of `user_id`'s follow lists.
+
+    Kept on `g`, so the cache validator and the view share one query.
+    """
+
+    if 'follow_page' not in g:
+        g.follow_page = paginate(user_query('card')
+                                     .options(undefer(User.updated_at))
+                                     .join(Follows, listed == User.id)
+                                     .filter(owner == user_id),
+                                 [User.id])
+    return g.follow_page
+
+
+def following_page(user_id):
+    return follow_list_page(user_id, Follows.user_being_followed_id,
+                            Follows.user_following_id)
+
+
+def followers_page(user_id):
+    return follow_list_page(user_id, Follows.user_following_id,
+                            Follows.user_being_followed_id)
+
+
+def follow_list_version(user_id, page_of):
+    """Cache validator for a page of a user's followers / followed users.
+
+    Covers the user and each listed user on the requested page, so a
+    listed user changing their profile changes it too. The page's rows are
+    the ones the view then renders.
+    """
+
+    updated_at = user_updated_at(user_id) if g.user else None
+    if updated_at is None:
+        return None
+
+    rows = [(listed.id, listed.updated_at) for listed in page_of(user_id)]
+    newest = max([updated_at] + [row_updated for _, row_updated in rows])
 
-    return render_template('users/index.html', users=users)
+    return ('follows', user_id, updated_at, rows), newest
+
+
+def following_version(user_id):
+    return follow_list_version(user_id, following_page)
+
+
+def followers_version(user_id):
+    return follow_list_version(user_id, followers_page)
 
 
 @app.route('/users/<int:user_id>')
+@httpcache.conditional(user_version)
 def users_show(user_id):
     """Show user profile."""
 
-    user = User.query.get_or_404(user_id)
+    user = user_query('profile').filter(User.id == user_id).first_or_404()
+    page = paginate(message_query('profile').filter(Message.user_id == user_id),
+                    [Message.timestamp, Message.id])
+    g.viewer.load(messages=page.items, users=[user])
 
-    return render_template('users/show.html', user=user)
+    return render_template('users/show.html', user=user,
+                           messages=page.items, page=page)
 
 
 @app.route('/users/<int:user_id>/following')
+@httpcache.conditional(following_version)
 def show_following(user_id):
     """Show list of people this user is following."""
 
@@ -162,11 +353,16 @@ def show_following(user_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    user = User.query.get_or_404(user_id)
-    return render_template('users/following.html', user=user)
+    user = user_query('profile').filter(User.id == user_id).first_or_404()
+    page = following_page(user_id)
+    g.viewer.load(users=page.items + [user])
+
+    return render_template('users/following.html', user=user,
+                           users=page.items, page=page)
 
 
 @app.route('/users/<int:user_id>/followers')
+@httpcache.conditional(followers_version)
 def users_followers(user_id):
     """Show list of followers of this user."""
 
@@ -174,8 +370,12 @@ def users_followers(user_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    user = User.query.get_or_404(user_id)
-    return render_template('users/followers.html', user=user)
+    user = user_query('profile').filter(User.id == user_id).first_or_404()
+    page = followers_page(user_id)
+    g.viewer.load(users=page.items + [user])
+
+    return render_template('users/followers.html', user=user,
+                           users=page.items, page=page)
 
 
 @app.route('/users/follow/<int:follow_id>', methods=['POST'])
@@ -186,8 +386,9 @@ def add_follow(follow_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    followed_user = User.query.get_or_404(follow_id)
-    g.user.following.append(followed_user)
+    if not follows.follow(g.user.id, follow_id):
+        # already followed, or no such user
+        user_query('card').filter(User.id == follow_id).first_or_404()
     db.session.commit()
 
     return redirect(f"/users/{g.user.id}/following")
@@ -201,13 +402,53 @@ def stop_following(follow_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    followed_user = User.query.get(follow_id)
-    g.user.following.remove(followed_user)
+    follows.unfollow(g.user.id, follow_id)
     db.session.commit()
 
     return redirect(f"/users/{g.user.id}/following")
 
 
+def bulk_follow_ids():
+    """The "user_ids" list of a bulk follow request, or a 400 error."""
+
+    user_ids = (request.get_json(silent=True) or {}).get('user_ids')
+    if (not isinstance(user_ids, list)
+            or not all(isinstance(id, int) for id in user_ids)):
+        abort(400, "Expected JSON like {\"user_ids\": [1, 2, 3]}.")
+    if len(user_ids) > follows.MAX_BULK_FOLLOWS:
+        abort(400, f"At most {follows.MAX_BULK_FOLLOWS} users at once.")
+    return user_ids
+
+
+@app.route('/users/follow', methods=['POST'])
+def add_follows():
+    """Follow many users at once; JSON in and out.
+
+    Takes {"user_ids": [...]} and answers with the ids newly followed.
+    """
+
+    if not g.user:
+        return jsonify(error="Access unauthorized."), 401
+
+    followed = follows.follow_many(g.user.id, bulk_follow_ids())
+    db.session.commit()
+
+    return jsonify(followed=sorted(followed))
+
+
+@app.route('/users/stop-following', methods=['POST'])
+def stop_following_many():
+    """Unfollow many users at once; JSON in and out."""
+
+    if not g.user:
+        return jsonify(error="Access unauthorized."), 401
+
+    unfollowed = follows.unfollow_many(g.user.id, bulk_follow_ids())
+    db.session.commit()
+
+    return jsonify(unfollowed=sorted(unfollowed))
+
+
 @app.route('/users/profile', methods=["GET", "POST"])
 def profile():
     """Update profile for current user."""
@@ -234,13 +475,15 @@ def profile():
             header_image_url = form.image_url.data or g.user.header_image_url
             location = form.location.data or g.user.location
 
-            g.user.username = username
-            g.user.email = email
-            g.user.image_url = image_url
-            g.user.bio = bio
-            g.user.header_image_url = header_image_url
-            g.user.location = location
+            user.username = username
+            user.email = email
+            user.image_url = image_url
+            user.bio = bio
+            user.header_image_url = header_image_url
+            user.location = location
+            current_user.mark_stale(user.id)
             db.session.commit()
+            search.ngram_index.add(user.id, user.username)
             
             # TODO: write a list comprehension function for previous block:  g.user.FIELD.append(FIELD)
                 # saving to work on later
@@ -260,7 +503,11 @@ def profile():
 
 @app.route('/users/delete', methods=["POST"])
 def delete_user():
-    """Delete user."""
+    """Delete user.
+
+    The account and its messages are hidden at once; their rows are purged
+    in the background.
+    """
 
     if not g.user:
         flash("Access unauthorized.", "danger")
@@ -268,8 +515,18 @@ def delete_user():
 
     do_logout()
 
-    db.session.delete(g.user)
+    now = datetime.utcnow()
+    g.user.record.deleted_at = now
+    # one indexed UPDATE, so every message page drops them right away
+    (Message
+        .query
+        .filter(Message.user_id == g.user.id, Message.deleted_at.is_(None))
+        .update({Message.deleted_at: now}, synchronize_session=False))
+    current_user.mark_stale(g.user.id)
+    graphindex.record('delete', g.user.id)
+    jobs.enqueue('purge_user', user_id=g.user.id)
     db.session.commit()
+    search.ngram_index.remove(g.user.id)
 
     return redirect("/signup")
 
@@ -278,17 +535,31 @@ def users_liked_show(user_id):
     """Show list of messages that the user has liked """
     
     # user (not current user)
-    user = User.query.get(user_id)
-    liked_messages = [message.id for message in user.liked_messages]
-
-    messages = (Message
-                .query 
-                .filter(Message.id.in_(liked_messages))
-                .order_by(Message.timestamp.desc())
-                .limit(100)
-                .all())
-    
-    return render_template('/users/liked.html', messages=messages, user=user)
+    user = user_query('profile').filter(User.id == user_id).first_or_404()
+    page = paginate(message_query('feed')
+                        .join(Like, Like.msg_id == Message.id)
+                        .filter(Like.user_liked_id == user_id),
+                    [Message.timestamp, Message.id])
+    g.viewer.load(messages=page.items)
+
+    return render_template('/users/liked.html', messages=page.items,
+                           user=user, page=page)
+
+
+@app.route("/users/<int:user_id>/mentions")
+def users_mentions(user_id):
+    """Show messages that @mention the user, newest first."""
+
+    user = user_query('profile').filter(User.id == user_id).first_or_404()
+    page = paginate(message_query('feed')
+                        .join(Mention, Mention.message_id == Message.id)
+                        .filter(Mention.user_id == user_id),
+                    [Mention.timestamp, Mention.message_id],
+                    key=lambda msg: (msg.timestamp, msg.id))
+    g.viewer.load(messages=page.items)
+
+    return render_template('/users/mentions.html', messages=page.items,
+                           user=user, page=page)
 
 
     # if g.user:
@@ -327,8 +598,12 @@ def messages_add():
     form = MessageForm()
 
     if form.validate_on_submit():
-        msg = Message(text=form.text.data)
-        g.user.messages.append(msg)
+        msg = Message(text=form.text.data, user_id=g.user.id)
+        db.session.add(msg)
+        db.session.flush()
+        counters.message_posted(msg)
+        timeline.fan_out_message(msg)
+        tags.index_message(msg)
         db.session.commit()
 
         return redirect(f"/users/{g.user.id}")
@@ -336,11 +611,28 @@ def messages_add():
     return render_template('messages/new.html', form=form)
 
 
+def message_version(message_id):
+    """Cache validator for a message page: the message and its author."""
+
+    author_updated_at = (db.session
+                           .query(User.updated_at)
+                           .join(Message, Message.user_id == User.id)
+                           .filter(Message.id == message_id)
+                           .scalar())
+    if author_updated_at is None:
+        return None
+
+    return ('message', message_id, author_updated_at), author_updated_at
+
+
 @app.route('/messages/<int:message_id>', methods=["GET"])
+@httpcache.conditional(message_version)
 def messages_show(message_id):
     """Show a message."""
 
-    msg = Message.query.get(message_id)
+    msg = message_query('feed').filter(Message.id == message_id).first_or_404()
+    g.viewer.load(messages=[msg])
+
     return render_template('messages/show.html', message=msg)
 
 
@@ -352,47 +644,114 @@ def messages_destroy(message_id):
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    msg = Message.query.get(message_id)
-    db.session.delete(msg)
+    msg = message_query('profile').filter(Message.id == message_id).first_or_404()
+    msg.deleted_at = datetime.utcnow()
+    counters.message_deleted(msg)
+    # timeline entries and likes go in the background
+    jobs.enqueue('purge_message', message_id=msg.id)
     db.session.commit()
+    fragments.forget_message(message_id)
 
     return redirect(f"/users/{g.user.id}")
 
+@app.route('/search/messages')
+def search_messages():
+    """Search messages by their text; best and newest matches first."""
+
+    q = request.args.get('q', '').strip()
+    page = fulltext.search_page(q, message_query('feed'))
+    messages = [row.Message for row in page.items] if page else []
+    g.viewer.load(messages=messages)
+
+    return render_template('messages/search.html', q=q, messages=messages,
+                           page=page)
+
+
+@app.route('/tags/<tag>')
+def tags_show(tag):
+    """Show messages with a hashtag, newest first."""
+
+    tag = tags.normalize(tag)
+    page = paginate(message_query('feed')
+                        .join(MessageTag, MessageTag.message_id == Message.id)
+                        .filter(MessageTag.tag == tag),
+                    [MessageTag.timestamp, MessageTag.message_id],
+                    key=lambda msg: (msg.timestamp, msg.id))
+    g.viewer.load(messages=page.items)
+
+    return render_template('tags/show.html', messages=page.items, tag=tag,
+                           page=page)
+
+
+@app.route('/trending')
+def messages_trending():
+    """Show the most liked messages of the last hour, day or week."""
+
+    period = request.args.get('period', trending.DEFAULT_PERIOD)
+    if period not in trending.PERIODS:
+        abort(404)
+
+    messages = (trending
+                .ranked(message_query('feed'), period)
+                .limit(trending.TRENDING_SIZE)
+                .all())
+    g.viewer.load(messages=messages)
+
+    return render_template('messages/trending.html', messages=messages,
+                           period=period, periods=trending.PERIODS)
+
 ##############################################################################
 # Like messages route
 
 
+def wants_json():
+    """Did the client ask for JSON rather than a page (e.g. via fetch)?"""
+
+    accept = request.accept_mimetypes
+    return accept.accept_json and not accept.accept_html
+
+
+def like_response(message_id, liked):
+    """Commit a like/unlike; answer with its new state, or redirect back."""
+
+    like_count = likes.like_count(message_id)
+    if like_count is None:
+        db.session.rollback()
+        abort(404)
+    db.session.commit()
+
+    if wants_json():
+        return jsonify(message_id=message_id, liked=liked,
+                       like_count=like_count)
+
+    return redirect(request.referrer or f"/messages/{message_id}")
+
+
 @app.route("/messages/<int:message_id>/like", methods=["POST"])
 def handle_message_like(message_id):
-    """Add a like to the current user liked_messages list."""
-
-    message = Message.query.get(message_id)
+    """Like a message; liking it again does nothing."""
 
     if not g.user:
+        if wants_json():
+            return jsonify(error="Access unauthorized."), 401
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    g.user.liked_messages.append(message)
-    # print(f"{g.user.liked_messages}")
-    db.session.commit()
-
-    return redirect(request.referrer) 
+    likes.like(g.user.id, message_id)
+    return like_response(message_id, liked=True)
 
 @app.route("/messages/<int:message_id>/unlike", methods=["POST"])
 def handle_message_unlike(message_id):
-    """Remove a like from the current user liked_messages list."""
-
-    message = Message.query.get(message_id)
+    """Unlike a message; unliking one that isn't liked does nothing."""
 
     if not g.user:
+        if wants_json():
+            return jsonify(error="Access unauthorized."), 401
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    g.user.liked_messages.remove(message)
-    # print(f"{g.user.liked_messages}")
-    db.session.commit()
-
-    return redirect(request.referrer)
+    likes.unlike(g.user.id, message_id)
+    return like_response(message_id, liked=False)
 
 
 ##############################################################################
@@ -404,38 +763,146 @@ def homepage():
     """Show homepage:
 
     - anon users: no messages
-    - logged in: 100 most recent messages of followed_users
+    - logged in: most recent messages of followed_users, a page at a time,
+      read from their materialized timeline
     """
 
     if g.user:
-        following = g.user.following
-        following_ids = [follower.id for follower in following]
-        
-        messages = (Message
-                    .query
-                    .filter(Message.user_id.in_(following_ids))
-                    .order_by(Message.timestamp.desc())
-                    .limit(100)
-                    .all())
-        print(f'{g.user.password}')
+        before, after = cursor_args([TimelineEntry.timestamp,
+                                     TimelineEntry.message_id])
+        page = timeline.home_timeline(g.user.id, before, after)
+        g.viewer.load(messages=page.items)
 
-        return render_template('home.html', messages=messages)
+        return render_template('home.html', messages=page.items, page=page)
 
     else:
         return render_template('home-anon.html')
 
 
 ##############################################################################
-# Turn off all caching in Flask
-#   (useful for dev; in production, this kind of stuff is typically
-#   handled elsewhere)
+# Maintenance commands
+
+
+@app.cli.command('rebuild-timelines')
+def rebuild_timelines():
+    """Recompute every user's home timeline from the follows table."""
+
+    for (user_id,) in db.session.query(User.id).all():
+        timeline.rebuild(user_id)
+        db.session.commit()
+
+
+@app.cli.command('trim-timelines')
+def trim_timelines():
+    """Cut every home timeline to its newest entries; run daily."""
+
+    print(f"trimmed {timeline.trim_all()} timeline entries")
+    db.session.commit()
+
+
+@app.cli.command('rebuild-search')
+def rebuild_search():
+    """Rebuild the full-text message search index (see fulltext.py)."""
+
+    fulltext.rebuild()
+
+
+@app.cli.command('backfill-tags')
+@click.option('--after', type=int, default=0,
+              help="Start after this message id, to resume a backfill.")
+def backfill_tags(after):
+    """Index hashtags and mentions of existing messages (see tags.py)."""
+
+    for last_id, written in tags.backfill(after):
+        print(f"indexed through message {last_id}: {written} postings")
+
+
+@app.cli.command('refresh-suggestions')
+@click.option('--full', is_flag=True,
+              help="Recompute every user, not just those whose follows changed.")
+@click.option('--workers', type=int, default=os.cpu_count())
+def refresh_suggestions(full, workers):
+    """Recompute "who to follow" suggestions."""
+
+    count = suggestions.refresh(full=full, workers=workers)
+    print(f"refreshed suggestions for {count} users")
+
+
+@app.cli.command('refresh-trending')
+def refresh_trending():
+    """Bring trending scores up to date; run every few minutes."""
+
+    for period, count in trending.refresh().items():
+        print(f"{period}: rescored {count} messages")
+
+
+@app.cli.command('graph-index-stats')
+def graph_index_stats():
+    """Build the follow graph index and report its size."""
+
+    start = time.perf_counter()
+    graphindex.graph_index.rebuild()
+    seconds = time.perf_counter() - start
+
+    stats = graphindex.graph_index.footprint()
+    print(f"{stats['users']} users, {stats['edges']} follows, "
+          f"{stats['bytes'] / 2**20:.1f} MiB, built in {seconds:.2f}s")
+
+
+@app.cli.command('run-jobs')
+@click.option('--workers', type=int, default=1)
+@click.option('--burst', is_flag=True,
+              help="Exit once no jobs are due instead of waiting for more.")
+def run_jobs(workers, burst):
+    """Run background jobs (see jobs.py)."""
+
+    jobs.run_workers(app, workers, burst)
+
+
+@app.cli.command('job-stats')
+def job_stats():
+    """Print queue depth and recent throughput per job kind, as JSON."""
+
+    print(json.dumps(jobs.stats(), indent=2, sort_keys=True))
+
+
+@app.cli.command('migrate')
+def migrate():
+    """Apply pending schema migrations (see migrations.py)."""
+
+    if not migrations.upgrade():
+        print("schema is up to date")
+
+
+@app.cli.command('migration-status')
+def migration_status():
+    """List schema migrations and whether each has been applied."""
+
+    applied = migrations.applied_versions()
+    for m in migrations.MIGRATIONS:
+        state = "applied" if m.version in applied else "pending"
+        print(f"{m.version}  {state:<8} {m.name}")
+
+
+@app.cli.command('reconcile-counters')
+def reconcile_counters():
+    """Recompute the denormalized user and message counters."""
+
+    counters.reconcile()
+    db.session.commit()
+
+
+##############################################################################
+# Caching defaults
 #
-# https://stackoverflow.com/questions/34066804/disabling-caching-in-flask
+# Pages with a cache policy of their own (see httpcache.py), and static
+# files, keep it; anything else must not be stored by browsers or proxies.
 
 @app.after_request
 def add_header(response):
-    """Add non-caching headers on every request."""
+    """Add non-caching headers to responses without a cache policy."""
 
     # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Cache-Control
-    response.cache_control.no_store = True
+    if request.endpoint != 'static' and 'Cache-Control' not in response.headers:
+        response.cache_control.no_store = True
     return response
@@ -0,0 +1,68 @@
+"""Measure bcrypt throughput at several costs.
+
+Run from the project root:
+
+    python -m benchmarks.bcrypt_costs --costs 10 11 12 13 --workers 4
+
+For each cost, reports hashes/sec on a single thread and through a
+HashingPool with `--workers` threads, to help pick BCRYPT_LOG_ROUNDS and
+HASH_WORKERS for a machine.
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from hashing import HashingPool
+
+PASSWORD = "correct horse battery staple"
+
+
+def hashes_per_second(hash_fn, seconds, threads=1):
+    """Run `hash_fn` from `threads` threads for ~`seconds`; return rate."""
+
+    deadline = time.perf_counter() + seconds
+
+    def work():
+        done = 0
+        while time.perf_counter() < deadline:
+            hash_fn(PASSWORD)
+            done += 1
+        return done
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        total = sum(executor.map(lambda _: work(), range(threads)))
+    elapsed = time.perf_counter() - start
+
+    return total / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--costs', type=int, nargs='+',
+                        default=[10, 11, 12, 13])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=3.0,
+                        help="how long to measure each cost")
+    args = parser.parse_args()
+
+    print(f"{'cost':>4}  {'ms/hash':>8}  {'1 thread/s':>10}  "
+          f"{f'pool x{args.workers}/s':>12}")
+
+    for cost in args.costs:
+        pool = HashingPool(rounds=cost, workers=args.workers,
+                           queue_size=args.workers)
+        try:
+            single = hashes_per_second(pool.hash_password, args.seconds)
+            pooled = hashes_per_second(pool.hash_password, args.seconds,
+                                       threads=args.workers)
+        finally:
+            pool.shutdown()
+
+        print(f"{cost:>4}  {1000 / single:>8.1f}  {single:>10.1f}  "
+              f"{pooled:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Measure the follow graph index's build time, memory and lookup rate.
+
+Run from the project root:
+
+    python -m benchmarks.graph_index --users 100000 --edges 1000000
+
+Builds graphindex.GraphIndex from a random power-law follow graph (the
+same one benchmarks/suggestions.py uses) and reports its footprint and how
+many is_following checks per second it answers. The database isn't
+involved; `flask graph-index-stats` reports the footprint for real data.
+"""
+
+import argparse
+import random
+import time
+
+from benchmarks.suggestions import random_edges
+from graphindex import GraphIndex
+
+LOOKUPS = 1000000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--edges', type=int, default=1000000)
+    parser.add_argument('--lookups', type=int, default=LOOKUPS)
+    parser.add_argument('--seed', default='graph-index')
+    args = parser.parse_args()
+
+    edges = list(random_edges(args.users, args.edges, args.seed))
+
+    index = GraphIndex()
+    start = time.perf_counter()
+    index.rebuild(edges)
+    build_seconds = time.perf_counter() - start
+
+    stats = index.footprint()
+    print(f"{stats['users']} users, {stats['edges']} follows: "
+          f"built in {build_seconds:.2f}s, "
+          f"{stats['bytes'] / 2**20:.1f} MiB "
+          f"({stats['bytes'] / stats['edges']:.1f} bytes/follow)")
+
+    # half the pairs are real follows
+    rng = random.Random(args.seed)
+    pairs = rng.sample(edges, args.lookups // 2) + [
+        (rng.randint(1, args.users), rng.randint(1, args.users))
+        for _ in range(args.lookups - args.lookups // 2)]
+
+    start = time.perf_counter()
+    found = sum(index.is_following(a, b) for a, b in pairs)
+    seconds = time.perf_counter() - start
+    print(f"{len(pairs)} is_following checks ({found} true): "
+          f"{len(pairs) / seconds:,.0f}/s")
+
+
+if __name__ == '__main__':
+    main()
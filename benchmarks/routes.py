@@ -0,0 +1,271 @@
+"""Benchmark the main read routes end to end.
+
+Run from the project root:
+
+    python -m benchmarks.routes --scale 100k --save benchmarks/baseline.json
+    python -m benchmarks.routes --scale 100k --compare benchmarks/baseline.json
+
+The first run for a scale generates a dataset with generator/create_csvs.py
+and bulk-loads it with loader.py into --database (by default an SQLite file
+next to this one; pass a postgresql:// URL to use a local Postgres). Later
+runs reuse it; --reseed starts over.
+
+Each route is driven through the Flask test client, anonymously and as a
+logged-in user, and reports p50/p95/p99 latency, requests/sec and SQL
+statements per request. --save writes the results as a JSON baseline;
+--compare prints the difference from one and exits non-zero if any route
+got slower than --tolerance allows or runs more queries than before.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import loader
+from models import db, User
+from querycount import count_queries
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+GENERATOR = os.path.join(HERE, '..', 'generator', 'create_csvs.py')
+
+# dataset sizes; follows and likes are approximate
+SCALES = {
+    '1k': dict(users=100, messages=1000, follows=2000, likes=2000),
+    '100k': dict(users=5000, messages=100000, follows=100000, likes=50000),
+    '1m': dict(users=50000, messages=1000000, follows=1000000,
+               likes=500000),
+}
+
+# newest generated message, fixed so every run sees the same data
+DATA_END = '2025-01-01'
+DATA_SEED = 'benchmark'
+
+# name, URL template, and who requests it
+ROUTES = [
+    ('home', '/', ('anon', 'user')),
+    ('profile', '/users/{popular_id}', ('anon', 'user')),
+    ('search', '/users?q={term}', ('anon', 'user')),
+    ('liked', '/users/{liker_id}/liked', ('anon', 'user')),
+]
+
+SEARCH_TERM = 'sun'
+
+# p95 changes smaller than this are noise, whatever the percentage
+MIN_SLOWDOWN_MS = 1.0
+
+
+##############################################################################
+# Statistics and baselines
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list."""
+
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def summarize(timings, queries):
+    """Latency (ms), throughput and query counts for one route."""
+
+    ms = [t * 1000 for t in timings]
+    return dict(
+        p50_ms=round(percentile(ms, 50), 3),
+        p95_ms=round(percentile(ms, 95), 3),
+        p99_ms=round(percentile(ms, 99), 3),
+        requests_per_sec=round(len(timings) / sum(timings), 1),
+        queries=max(queries),
+    )
+
+
+def compare(baseline, current, tolerance):
+    """Regressions of `current` results against `baseline`, as strings.
+
+    A route regresses if its p95 grew by more than `tolerance` (a fraction)
+    and by more than MIN_SLOWDOWN_MS, or if it runs more SQL statements.
+    """
+
+    problems = []
+
+    for key in ('scale', 'dialect'):
+        if baseline.get(key) != current.get(key):
+            problems.append(f"baseline {key} is {baseline.get(key)!r}, "
+                            f"this run is {current.get(key)!r}")
+    if problems:
+        return problems
+
+    for name, before in baseline['routes'].items():
+        after = current['routes'].get(name)
+        if after is None:
+            problems.append(f"{name}: not measured in this run")
+            continue
+
+        slower = after['p95_ms'] - before['p95_ms']
+        if (slower > MIN_SLOWDOWN_MS
+                and after['p95_ms'] > before['p95_ms'] * (1 + tolerance)):
+            problems.append(f"{name}: p95 {before['p95_ms']:.1f}ms -> "
+                            f"{after['p95_ms']:.1f}ms")
+        if after['queries'] > before['queries']:
+            problems.append(f"{name}: queries {before['queries']} -> "
+                            f"{after['queries']}")
+
+    return problems
+
+
+def print_results(results, baseline=None):
+    print(f"{results['scale']} on {results['dialect']}")
+    print(f"{'route':<14} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'req/s':>8} {'queries':>7}"
+          + (f" {'base p95':>9} {'change':>7}" if baseline else ""))
+
+    for name, stats in results['routes'].items():
+        line = (f"{name:<14} {stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} "
+                f"{stats['p99_ms']:>8.1f} {stats['requests_per_sec']:>8.1f} "
+                f"{stats['queries']:>7}")
+        before = baseline and baseline['routes'].get(name)
+        if before:
+            change = stats['p95_ms'] / before['p95_ms'] - 1
+            line += f" {before['p95_ms']:>9.1f} {change:>+7.0%}"
+        print(line)
+
+
+##############################################################################
+# Dataset
+
+
+def seed(scale):
+    """Generate a dataset of `scale` and bulk-load it into the database."""
+
+    db.drop_all()
+    db.create_all()
+
+    sizes = SCALES[scale]
+    with tempfile.TemporaryDirectory() as out:
+        subprocess.run(
+            [sys.executable, GENERATOR, '--out', out,
+             '--seed', DATA_SEED, '--end', DATA_END]
+            + [arg for kind, count in sizes.items()
+               for arg in (f'--{kind}', str(count))],
+            check=True)
+        loader.main([f'{kind}={os.path.join(out, kind)}.csv'
+                     for kind in sizes] + ['--drop-indexes'])
+
+
+def pick_params():
+    """The users and search term the routes are requested with.
+
+    The worst realistic cases: the viewer follows the most accounts, the
+    profile has the most followers, the liked page has the most likes.
+    """
+
+    def top(column):
+        return User.query.order_by(column.desc(), User.id).first().id
+
+    return dict(viewer_id=top(User.following_count),
+                popular_id=top(User.followers_count),
+                liker_id=top(User.likes_count),
+                term=SEARCH_TERM)
+
+
+##############################################################################
+# Measuring
+
+
+def measure(client, url, requests, warmup):
+    """Request `url` repeatedly; return per-request seconds and queries."""
+
+    for _ in range(warmup):
+        client.get(url)
+
+    timings, queries = [], []
+    for _ in range(requests):
+        with count_queries(db.engine) as statements:
+            start = time.perf_counter()
+            response = client.get(url)
+            timings.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            raise SystemExit(f"GET {url} returned {response.status_code}")
+        queries.append(len(statements))
+
+    return timings, queries
+
+
+def run(app, params, requests, warmup):
+    from app import CURR_USER_KEY
+
+    clients = dict(anon=app.test_client(), user=app.test_client())
+    with clients['user'].session_transaction() as session:
+        session[CURR_USER_KEY] = params['viewer_id']
+
+    routes = {}
+    for name, template, who in ROUTES:
+        url = template.format(**params)
+        for auth in who:
+            timings, queries = measure(clients[auth], url, requests, warmup)
+            routes[f"{name}:{auth}"] = summarize(timings, queries)
+
+    return routes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', choices=SCALES, default='1k')
+    parser.add_argument('--database',
+                        help="database URL (default: an SQLite file per scale)")
+    parser.add_argument('--reseed', action='store_true',
+                        help="regenerate and reload the dataset")
+    parser.add_argument('--requests', type=int, default=200,
+                        help="timed requests per route")
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--save', metavar='PATH',
+                        help="write the results as a baseline")
+    parser.add_argument('--compare', metavar='PATH',
+                        help="fail on regressions against a baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="allowed p95 slowdown, as a fraction")
+    args = parser.parse_args()
+
+    database = args.database or (
+        f"sqlite:///{os.path.join(HERE, f'warbler-{args.scale}.db')}")
+
+    # the app reads its database from the environment at import time
+    os.environ['DATABASE_URL'] = database
+    from app import app
+
+    app.config['DEBUG_TB_ENABLED'] = False
+
+    db.create_all()
+    if args.reseed or not User.query.first():
+        seed(args.scale)
+
+    results = dict(scale=args.scale, dialect=db.engine.dialect.name,
+                   requests=args.requests,
+                   routes=run(app, pick_params(), args.requests, args.warmup))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    print_results(results, baseline)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+
+    if baseline:
+        problems = compare(baseline, results, args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION {problem}", file=sys.stderr)
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
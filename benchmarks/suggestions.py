@@ -0,0 +1,81 @@
+"""Time the follow suggestions job on a synthetic graph.
+
+Run from the project root:
+
+    python -m benchmarks.suggestions --users 100000 --edges 1000000 --workers 4
+
+Builds a random follow graph in memory (how many followers an account has
+follows a power law, like the generator's data) and reports how long it
+takes to build the adjacency list and to score every user, on one process
+and on `--workers`. The database isn't involved.
+"""
+
+import argparse
+import os
+import random
+import time
+from itertools import accumulate
+
+import suggestions
+from suggestions import Graph
+
+# power-law exponent for how often an account is followed
+POPULARITY_EXPONENT = 1.1
+
+
+def random_edges(users, edges, seed):
+    """About `edges` distinct (follower_id, followed_id) pairs."""
+
+    rng = random.Random(seed)
+    weights = list(accumulate(1 / rank ** POPULARITY_EXPONENT
+                              for rank in range(1, users + 1)))
+    ids = list(range(1, users + 1))
+    rng.shuffle(ids)
+
+    pairs = set()
+    followers = [rng.randint(1, users) for _ in range(edges)]
+    followed = rng.choices(ids, cum_weights=weights, k=edges)
+    for follower_id, followed_id in zip(followers, followed):
+        if follower_id != followed_id:
+            pairs.add((follower_id, followed_id))
+
+    return pairs
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--edges', type=int, default=1000000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--sample', type=int,
+                        help="score only this many users (default: all)")
+    parser.add_argument('--seed', default='suggestions')
+    args = parser.parse_args()
+
+    edges = random_edges(args.users, args.edges, args.seed)
+    graph, build_seconds = timed(
+        lambda: Graph.from_edges(range(1, args.users + 1), edges))
+    print(f"{len(graph)} users, {graph.edge_count} follows: "
+          f"graph built in {build_seconds:.2f}s")
+
+    user_ids = None
+    if args.sample:
+        user_ids = random.Random(args.seed).sample(list(graph.ids),
+                                                   args.sample)
+    scored = args.sample or len(graph)
+
+    for workers in sorted({1, args.workers}):
+        _, seconds = timed(lambda: sum(
+            1 for _ in suggestions.compute(graph, user_ids, workers)))
+        print(f"{workers:>3} worker(s): {seconds:.2f}s, "
+              f"{scored / seconds:,.0f} users/s")
+
+
+if __name__ == '__main__':
+    main()
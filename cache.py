@@ -0,0 +1,127 @@
+"""Small caches used by Warbler.
+
+`LRUCache` is a process-local cache with a size bound and a time-to-live.
+`TieredCache` puts one in front of an optional shared backend (anything
+with the `CacheBackend` interface, e.g. `RedisBackend`), so the common case
+is a dict lookup and a miss in one worker can still be a hit in the shared
+store.
+
+Entries in other workers' local caches are only dropped when they expire,
+so keep local TTLs short for data that changes.
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread-safe in-process cache with LRU eviction and a TTL."""
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Value for `key`, or None if it is missing or expired."""
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Store `value` under `key` for `ttl` seconds (default: self.ttl)."""
+
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class CacheBackend:
+    """Interface for a shared cache store. Values must be JSON-serializable."""
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+
+class RedisBackend(CacheBackend):
+    """Shared backend for a redis-py style client (get / setex / delete)."""
+
+    def __init__(self, client, prefix="warbler:"):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key, value, ttl):
+        self.client.setex(self.prefix + key, ttl, json.dumps(value))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+
+class TieredCache:
+    """A local `LRUCache` in front of an optional shared `CacheBackend`."""
+
+    def __init__(self, local, shared=None, shared_ttl=300):
+        self.local = local
+        self.shared = shared
+        self.shared_ttl = shared_ttl
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.local.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.local.set(key, value)
+        if self.shared is not None:
+            self.shared.set(key, value, self.shared_ttl)
+
+    def delete(self, key):
+        self.local.delete(key)
+        if self.shared is not None:
+            self.shared.delete(key)
+
+    def clear(self):
+        """Clear the local cache (the shared store is left alone)."""
+
+        self.local.clear()
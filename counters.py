@@ -0,0 +1,142 @@
+"""Denormalized counters for users and messages.
+
+`User.messages_count`, `following_count`, `followers_count`, `likes_count`
+and `Message.like_count` are updated with `UPDATE ... SET n = n + 1` in the
+same transaction as the write they count, so concurrent requests can't lose
+increments. `reconcile()` recomputes all of them from the source tables if
+they ever drift.
+
+Follow changes also stamp the follower's `User.following_changed_at`, for
+the incremental suggestions refresh.
+"""
+
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from sqlalchemy import func, select
+
+from models import Follows, Like, Message, User
+import current_user
+
+
+def _bump(model, row_ids, stamp=None, **deltas):
+    """Add `deltas` to counter columns of the `model` rows in `row_ids`.
+
+    The column named by `stamp`, if any, is set to the current time.
+    """
+
+    if not row_ids:
+        return
+
+    values = {getattr(model, column): getattr(model, column) + delta
+              for column, delta in deltas.items()}
+    if stamp:
+        values[getattr(model, stamp)] = datetime.utcnow()
+
+    (model
+        .query
+        .filter(model.id.in_(row_ids))
+        .update(values, synchronize_session=False))
+
+    if model is User:
+        current_user.mark_stale(*row_ids)
+
+
+def message_posted(message):
+    """Count a new message for its author."""
+
+    _bump(User, [message.user_id], messages_count=1)
+
+
+def message_deleted(message):
+    """Uncount a message for its author.
+
+    Its likes are uncounted as purge.py deletes them.
+    """
+
+    _bump(User, [message.user_id], messages_count=-1)
+
+
+def followed(follower_id, followed_id, delta=1):
+    """Count (or with delta=-1, uncount) one follow."""
+
+    followed_many(follower_id, [followed_id], delta)
+
+
+def followed_many(follower_id, followed_ids, delta=1):
+    """Count (or uncount) `follower_id` following each of `followed_ids`."""
+
+    if not followed_ids:
+        return
+
+    _bump(User, [follower_id], stamp='following_changed_at',
+          following_count=delta * len(followed_ids))
+    _bump(User, followed_ids, followers_count=delta)
+
+
+def liked(user_id, message_id, delta=1):
+    """Count (or with delta=-1, uncount) one like."""
+
+    _bump(User, [user_id], likes_count=delta)
+    _bump(Message, [message_id], like_count=delta)
+
+
+def _uncount(model, column, row_ids, stamp=None):
+    """Subtract from `column` how many times each row appears in `row_ids`.
+
+    One UPDATE per distinct amount, which is usually just one.
+    """
+
+    ids_by_amount = defaultdict(list)
+    for row_id, amount in Counter(row_ids).items():
+        ids_by_amount[amount].append(row_id)
+
+    for amount, ids in ids_by_amount.items():
+        _bump(model, ids, stamp=stamp, **{column: -amount})
+
+
+def likes_deleted(likes):
+    """Uncount (user_id, message_id) likes deleted in bulk."""
+
+    _uncount(User, 'likes_count', [user_id for user_id, _ in likes])
+    _uncount(Message, 'like_count', [message_id for _, message_id in likes])
+
+
+def follows_deleted(follows):
+    """Uncount (followed_id, follower_id) follows deleted in bulk."""
+
+    _uncount(User, 'followers_count',
+             [followed_id for followed_id, _ in follows])
+    _uncount(User, 'following_count',
+             [follower_id for _, follower_id in follows],
+             stamp='following_changed_at')
+
+
+def reconcile():
+    """Recompute every counter from the follows, likes and messages tables."""
+
+    def count_of(column, where):
+        return (select([func.count()])
+                .select_from(column.table)
+                .where(where)
+                .as_scalar())
+
+    (User
+        .query
+        .update({
+            User.messages_count: count_of(Message.id,
+                                          Message.user_id == User.id),
+            User.following_count: count_of(Follows.user_following_id,
+                                           Follows.user_following_id == User.id),
+            User.followers_count: count_of(Follows.user_being_followed_id,
+                                           Follows.user_being_followed_id == User.id),
+            User.likes_count: count_of(Like.user_liked_id,
+                                       Like.user_liked_id == User.id),
+        }, synchronize_session=False))
+
+    (Message
+        .query
+        .update({
+            Message.like_count: count_of(Like.msg_id,
+                                         Like.msg_id == Message.id),
+        }, synchronize_session=False))
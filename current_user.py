@@ -0,0 +1,103 @@
+"""A cached snapshot of the logged-in user.
+
+Every request needs to know who is logged in, but most only render the
+user's id, username, picture and counters. Rather than loading the whole
+`User` row before each request, `load()` returns a `CurrentUser` snapshot
+from a cache, falling back to one narrow SELECT on a miss.
+
+Routes that change the user work with `CurrentUser.record`, which loads the
+ORM `User` on first use. Anything that changes a snapshot field must call
+`mark_stale()`; the snapshot is evicted when the transaction commits.
+"""
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from cache import LRUCache, TieredCache
+from models import db, User
+
+SNAPSHOT_FIELDS = (
+    'id',
+    'username',
+    'image_url',
+    'header_image_url',
+    'messages_count',
+    'following_count',
+    'followers_count',
+    'likes_count',
+)
+
+# seconds a snapshot may live in a worker's local cache
+SNAPSHOT_TTL = 30
+
+snapshots = TieredCache(LRUCache(maxsize=10000, ttl=SNAPSHOT_TTL))
+
+
+class CurrentUser:
+    """Read-only snapshot of the logged-in user.
+
+    Snapshot fields are plain attributes. Any other attribute (email, bio,
+    relationships, ...) is read from the full ORM `User`, loaded on demand.
+    """
+
+    def __init__(self, fields):
+        self.__dict__.update(fields)
+        self._record = None
+
+    @property
+    def record(self):
+        """The ORM `User` for this snapshot, loaded on first use."""
+
+        if self._record is None:
+            self._record = User.query.get(self.id)
+        return self._record
+
+    def __getattr__(self, name):
+        # only called for attributes that aren't in the snapshot
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.record, name)
+
+    def __repr__(self):
+        return f"<CurrentUser #{self.id}: {self.username}>"
+
+
+def _cache_key(user_id):
+    return f"current-user:{user_id}"
+
+
+def load(user_id):
+    """`CurrentUser` snapshot for `user_id`, or None if there's no such user."""
+
+    fields = snapshots.get(_cache_key(user_id))
+
+    if fields is None:
+        columns = [getattr(User, name) for name in SNAPSHOT_FIELDS]
+        row = (db.session
+               .query(*columns)
+               .filter(User.id == user_id, User.deleted_at.is_(None))
+               .first())
+        if row is None:
+            return None
+
+        fields = dict(zip(SNAPSHOT_FIELDS, row))
+        snapshots.set(_cache_key(user_id), fields)
+
+    return CurrentUser(fields)
+
+
+def mark_stale(*user_ids):
+    """Evict these users' snapshots once the current transaction commits."""
+
+    db.session.info.setdefault('stale_users', set()).update(user_ids)
+
+
+@event.listens_for(Session, 'after_commit')
+def _evict_stale_snapshots(session):
+    for user_id in session.info.pop('stale_users', ()):
+        snapshots.delete(_cache_key(user_id))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_stale_snapshots(session):
+    session.info.pop('stale_users', None)
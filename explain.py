@@ -0,0 +1,49 @@
+"""Read query plans, to catch queries that stop using their indexes.
+
+Used by the tests on a large seeded dataset:
+
+    assert not full_scans(query)
+
+`plan()` runs EXPLAIN (EXPLAIN QUERY PLAN on SQLite) for a Query or
+statement and returns its lines. `full_scans()` returns the lines where a
+table is read from start to end rather than through an index.
+"""
+
+import re
+
+from models import db
+
+# SQLite: "SCAN messages", "SCAN TABLE messages AS m"; not "SCAN ... USING
+# INDEX", which walks an index in order
+_SQLITE_FULL_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$")
+
+# Postgres: "Seq Scan on messages", "Parallel Seq Scan on messages m"
+_POSTGRES_FULL_SCAN = re.compile(r"Seq Scan on (\w+)")
+
+
+def plan(query):
+    """The lines of the database's plan for `query`."""
+
+    statement = getattr(query, 'statement', query)
+    conn = db.session.connection()
+    compiled = statement.compile(dialect=conn.dialect)
+
+    params = compiled.params
+    if conn.dialect.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+
+    if conn.dialect.name == 'sqlite':
+        rows = conn.execute(f"EXPLAIN QUERY PLAN {compiled}", params)
+        return [row[-1] for row in rows]
+
+    rows = conn.execute(f"EXPLAIN {compiled}", params)
+    return [row[0] for row in rows]
+
+
+def full_scans(query):
+    """Lines of `query`'s plan that read a whole table."""
+
+    pattern = (_SQLITE_FULL_SCAN if db.session.get_bind().dialect.name == 'sqlite'
+               else _POSTGRES_FULL_SCAN)
+
+    return [line for line in plan(query) if pattern.search(line.strip())]
@@ -0,0 +1,110 @@
+"""Following and unfollowing users.
+
+Follows rows are written and deleted directly, never through the
+`User.following` collection, so following one account doesn't load
+everyone already followed. Both work on many accounts at once in one
+statement (e.g. "follow these 500 accounts" during onboarding) and are
+idempotent: following someone twice, or unfollowing someone not followed,
+changes nothing. Counters, home timelines and the graph index are updated
+for exactly the rows that changed.
+"""
+
+from sqlalchemy import and_, exists, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from models import db, insert_ignoring_duplicates, Follows, User
+import counters
+import graphindex
+import timeline
+
+# most accounts one bulk request may follow or unfollow
+MAX_BULK_FOLLOWS = 1000
+
+
+def _on_postgres():
+    return db.session.get_bind().dialect.name == 'postgresql'
+
+
+def follow_many(follower_id, user_ids):
+    """Follow every existing user in `user_ids`; return the newly followed.
+
+    On Postgres this is a single INSERT ... ON CONFLICT DO NOTHING
+    RETURNING. SQLite has no RETURNING, so each id gets its own INSERT OR
+    IGNORE and counts as new if that inserted a row.
+    """
+
+    user_ids = set(user_ids) - {follower_id}
+    if not user_ids:
+        return []
+
+    already_following = exists().where(and_(
+        Follows.user_following_id == follower_id,
+        Follows.user_being_followed_id == User.id,
+    ))
+    new = (select([User.id, db.literal(follower_id)])
+           .where(and_(User.id.in_(user_ids),
+                       User.deleted_at.is_(None),
+                       ~already_following)))
+    columns = ['user_being_followed_id', 'user_following_id']
+
+    if _on_postgres():
+        stmt = (pg_insert(Follows.__table__)
+                .from_select(columns, new)
+                .on_conflict_do_nothing()
+                .returning(Follows.user_being_followed_id))
+        followed_ids = [user_id for (user_id,) in db.session.execute(stmt)]
+    else:
+        followed_ids = [
+            user_id for user_id in sorted(user_ids)
+            if insert_ignoring_duplicates(Follows.__table__, columns,
+                                          new.where(User.id == user_id))]
+
+    counters.followed_many(follower_id, followed_ids)
+    timeline.backfill_follows(follower_id, followed_ids)
+    if followed_ids:
+        graphindex.record('follow', follower_id, followed_ids)
+
+    return followed_ids
+
+
+def unfollow_many(follower_id, user_ids):
+    """Stop following any of `user_ids`; return those actually unfollowed."""
+
+    user_ids = set(user_ids)
+    if not user_ids:
+        return []
+
+    follows = Follows.__table__
+    matching = and_(follows.c.user_following_id == follower_id,
+                    follows.c.user_being_followed_id.in_(user_ids))
+
+    if _on_postgres():
+        stmt = (follows.delete()
+                .where(matching)
+                .returning(follows.c.user_being_followed_id))
+        unfollowed_ids = [user_id for (user_id,) in db.session.execute(stmt)]
+    else:
+        unfollowed_ids = [
+            user_id for user_id in sorted(user_ids)
+            if db.session.execute(follows.delete().where(and_(
+                follows.c.user_following_id == follower_id,
+                follows.c.user_being_followed_id == user_id))).rowcount]
+
+    counters.followed_many(follower_id, unfollowed_ids, delta=-1)
+    timeline.trim_unfollows(follower_id, unfollowed_ids)
+    if unfollowed_ids:
+        graphindex.record('unfollow', follower_id, unfollowed_ids)
+
+    return unfollowed_ids
+
+
+def follow(follower_id, user_id):
+    """Follow one user; True if they weren't followed (and exist)."""
+
+    return bool(follow_many(follower_id, [user_id]))
+
+
+def unfollow(follower_id, user_id):
+    """Unfollow one user; True if they were followed."""
+
+    return bool(unfollow_many(follower_id, [user_id]))
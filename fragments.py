@@ -0,0 +1,70 @@
+"""Cache rendered template fragments.
+
+Adds a `{% cache key, version %}...{% endcache %}` tag to Jinja. The body
+is rendered once and kept in `fragments` (a local LRU, plus a shared
+backend when one is configured); later renders with the same key and
+version reuse the HTML. A different version re-renders and replaces it, so
+put whatever the fragment shows that can change into the version.
+
+Fragments must not depend on who is viewing: keep per-viewer parts (like
+buttons) outside the tag.
+"""
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+from cache import LRUCache, TieredCache
+
+# seconds a fragment may stay cached
+FRAGMENT_TTL = 60 * 60
+
+fragments = TieredCache(LRUCache(maxsize=50000, ttl=FRAGMENT_TTL),
+                        shared_ttl=FRAGMENT_TTL)
+
+
+class FragmentCacheExtension(Extension):
+    """The `{% cache %}` tag."""
+
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+
+        args = [parser.parse_expression()]
+        if parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(None))
+
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+
+        return nodes.CallBlock(self.call_method('_cached', args),
+                               [], [], body).set_lineno(lineno)
+
+    def _cached(self, key, version, caller):
+        # versions are compared as strings so they survive a JSON backend
+        version = str(version)
+
+        hit = fragments.get(key)
+        if hit is not None and hit[0] == version:
+            return Markup(hit[1])
+
+        html = caller()
+        fragments.set(key, [version, str(html)])
+        return html
+
+
+def message_key(message_id):
+    return f"fragment:message:{message_id}"
+
+
+def forget_message(message_id):
+    """Drop the cached list item of a deleted message."""
+
+    fragments.delete(message_key(message_id))
+
+
+def init_app(app):
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.globals['message_key'] = message_key
@@ -0,0 +1,195 @@
+"""Full-text message search.
+
+`LIKE '%word%'` over every message can't use an index, so each database
+gets a real full-text index, behind one interface (`backend()`):
+
+- Postgres: a GIN index on `to_tsvector('english', text)`. Postgres keeps
+  it up to date on insert and delete itself.
+- SQLite (development): an FTS5 table, messages_fts, over messages.text,
+  kept up to date by triggers.
+
+Both are created with the messages table, and for existing databases by
+migration 0005. `flask rebuild-search` rebuilds them in bulk.
+
+Every word of the search must match (English stemming on Postgres,
+Porter stemming on SQLite). Results are ordered by
+
+    relevance + days since 1970 / RECENCY_DAYS
+
+where relevance, from ts_rank_cd or bm25, is scaled to between 0 and 1.
+So the best possible match counts as much as being RECENCY_DAYS newer.
+Pages use the usual keyset cursors on (score, id). On Postgres that is
+exact: ts_rank_cd looks only at the message itself, so its score never
+changes. SQLite's bm25 depends on statistics of the whole table (how many
+messages have each word, the average length), so every new or deleted
+message shifts the scores of the rest a little, and a page fetched after
+that can skip or repeat a result near the cursor. That is accepted for
+development.
+"""
+
+import re
+
+from sqlalchemy import event, func, literal_column, type_coerce
+from sqlalchemy.sql import column, table
+
+from models import db, Message
+from pagination import paginate
+
+# how many days newer a message must be to beat a perfect match
+RECENCY_DAYS = 7
+
+# words of a search beyond this are ignored
+MAX_TERMS = 10
+
+# Postgres text search configuration; the index and queries must agree
+CONFIG = literal_column("'english'::regconfig")
+
+FTS_INDEX = 'ix_messages_text_fts'
+
+
+def terms(q):
+    """The lowercased words of the search `q`."""
+
+    return re.findall(r"\w+", q.lower())[:MAX_TERMS]
+
+
+def _scaled(relevance):
+    return relevance / (relevance + 1)
+
+
+class PostgresBackend:
+    """tsvector search over a GIN expression index."""
+
+    vector = func.to_tsvector(CONFIG, Message.text)
+
+    def create(self, conn, concurrently=False):
+        how = "CONCURRENTLY IF NOT EXISTS" if concurrently else "IF NOT EXISTS"
+        conn.execute(f"CREATE INDEX {how} {FTS_INDEX} ON messages "
+                     "USING gin (to_tsvector('english'::regconfig, text))")
+
+    def rebuild(self, conn):
+        conn.execute(f"REINDEX INDEX {FTS_INDEX}")
+
+    def matching(self, query, words):
+        """`query` narrowed to matches, and an SQL relevance score."""
+
+        tsquery = func.plainto_tsquery(CONFIG, ' '.join(words))
+        relevance = _scaled(func.ts_rank_cd(self.vector, tsquery))
+
+        return query.filter(self.vector.op('@@')(tsquery)), relevance
+
+    def days(self):
+        return func.extract('epoch', Message.timestamp) / 86400.0
+
+
+class SqliteBackend:
+    """FTS5 search over an external-content table synced by triggers."""
+
+    fts = table('messages_fts', column('rowid'), column('messages_fts'))
+
+    DDL = [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+        "text, content='messages', content_rowid='id', "
+        "tokenize='porter unicode61')",
+
+        "CREATE TRIGGER IF NOT EXISTS messages_fts_insert "
+        "AFTER INSERT ON messages BEGIN "
+        "INSERT INTO messages_fts (rowid, text) VALUES (new.id, new.text); "
+        "END",
+
+        "CREATE TRIGGER IF NOT EXISTS messages_fts_delete "
+        "AFTER DELETE ON messages BEGIN "
+        "INSERT INTO messages_fts (messages_fts, rowid, text) "
+        "VALUES ('delete', old.id, old.text); "
+        "END",
+
+        "CREATE TRIGGER IF NOT EXISTS messages_fts_update "
+        "AFTER UPDATE OF text ON messages BEGIN "
+        "INSERT INTO messages_fts (messages_fts, rowid, text) "
+        "VALUES ('delete', old.id, old.text); "
+        "INSERT INTO messages_fts (rowid, text) VALUES (new.id, new.text); "
+        "END",
+    ]
+
+    def create(self, conn, concurrently=False):
+        for statement in self.DDL:
+            conn.execute(statement)
+
+    def rebuild(self, conn):
+        conn.execute("INSERT INTO messages_fts (messages_fts) "
+                     "VALUES ('rebuild')")
+
+    def matching(self, query, words):
+        """`query` narrowed to matches, and an SQL relevance score."""
+
+        fts = self.fts
+        # each word quoted, so nothing in it is taken as FTS5 syntax
+        phrase = ' '.join(f'"{word}"' for word in words)
+        # bm25 is more negative for better matches
+        relevance = _scaled(-func.bm25(literal_column('messages_fts')))
+
+        return (query
+                .join(fts, fts.c.rowid == Message.id)
+                .filter(fts.c.messages_fts.match(phrase))), relevance
+
+    def days(self):
+        # julian day of 1970-01-01
+        return func.julianday(Message.timestamp) - 2440587.5
+
+
+BACKENDS = {
+    'postgresql': PostgresBackend(),
+    'sqlite': SqliteBackend(),
+}
+
+
+def backend(dialect=None):
+    """The search backend for `dialect` (default: the app's database)."""
+
+    return BACKENDS[dialect or db.engine.dialect.name]
+
+
+@event.listens_for(Message.__table__, 'after_create')
+def _create_index(target, connection, **kw):
+    if connection.dialect.name in BACKENDS:
+        backend(connection.dialect.name).create(connection)
+
+
+def rebuild():
+    """Rebuild the search index from the messages table."""
+
+    with db.engine.begin() as conn:
+        backend(conn.dialect.name).rebuild(conn)
+
+
+def search_query(q, messages):
+    """`messages` (a query over Message) narrowed to matches for `q`.
+
+    Returns the query, selecting (Message, score), and the score
+    expression; None if `q` has no words.
+    """
+
+    words = terms(q)
+    if not words:
+        return None
+
+    search = backend()
+    query, relevance = search.matching(messages, words)
+    score = type_coerce(relevance + search.days() / RECENCY_DAYS, db.Float)
+
+    return query.add_columns(score.label('score')), score
+
+
+def search_page(q, messages):
+    """One page of `messages` matching `q`, best first; None if no words.
+
+    Items are (Message, score) rows.
+    """
+
+    found = search_query(q, messages)
+    if found is None:
+        return None
+
+    query, score = found
+    return paginate(query, [score, Message.id],
+                    key=lambda row: (row.score, row.Message.id))
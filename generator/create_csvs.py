@@ -1,77 +1,272 @@
-"""Generate CSVs of random data for Warbler.
+"""Generate random Warbler data as CSV (or NDJSON) files for loader.py.
 
-Students won't need to run this for the exercise; they will just use the CSV
-files that this generates. You should only need to run this if you wanted to
-tweak the CSV formats or generate fewer/more rows.
+Works offline and in bounded memory, so it can produce capacity-testing
+datasets with millions of rows:
+
+    python generator/create_csvs.py --users 1000000 --messages 20000000 \
+        --follows 50000000 --likes 30000000 --workers 8 --out /data/warbler
+
+then load them with
+
+    python loader.py users=/data/warbler/users.csv ... --drop-indexes
+
+The shape is meant to look like a real social network: follower counts
+follow a power law (a few accounts have most of the followers), so do how
+many accounts each user follows and how much each user posts; posts lean
+towards the recent past and the evening; likes pile up on a few messages.
+
+Output is deterministic for a given --seed, --end and --chunk-size,
+whatever --workers is. Rows are produced in chunks by a process pool and
+written in order; user ids and message ids are their 1-based line numbers,
+matching the serial ids the loader assigns to an empty database.
 """
 
+import argparse
 import csv
-from random import choice, randint, sample
-from itertools import permutations
-import requests
-from faker import Faker
-from helpers import get_random_datetime
+import io
+import json
+import os
+import random
+from array import array
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+
+from helpers import (CITIES, WORDS, cumulative, power_law_weights, sentence,
+                     skewed_timestamp, weighted_index)
 
 MAX_WARBLER_LENGTH = 140
 
 USERS_CSV_HEADERS = ['email', 'username', 'image_url', 'password', 'bio', 'header_image_url', 'location']
 MESSAGES_CSV_HEADERS = ['text', 'timestamp', 'user_id']
 FOLLOWS_CSV_HEADERS = ['user_being_followed_id', 'user_following_id']
+LIKES_CSV_HEADERS = ['user_liked_id', 'msg_id']
 
 NUM_USERS = 300
 NUM_MESSAGES = 1000
 NUM_FOLLWERS = 5000
+NUM_LIKES = 2000
+
+CHUNK_SIZE = 10000
 
-fake = Faker()
+# every generated user's password is "password"
+PASSWORD_HASH = '$2b$12$Q1PUFjhN/AWRQ21LbGYvjeLpZZB6lfZ1BPwifHALGO6oIbyC3CmJe'
 
-# Generate random profile image URLs to use for users
+# Pareto exponents: smaller means more skewed
+POPULARITY_EXPONENT = 1.1
+ACTIVITY_EXPONENT = 1.3
+OUT_DEGREE_EXPONENT = 1.5
 
+# profile image URLs to use for users (strings only; nothing is fetched)
 image_urls = [
     f"https://randomuser.me/api/portraits/{kind}/{i}.jpg"
     for kind, count in [("lego", 10), ("men", 100), ("women", 100)]
     for i in range(count)
 ]
 
-# Generate random header image URLs to use for users
+header_image_urls = ["/static/images/warbler-hero.jpg"]
+
+
+##############################################################################
+# Worker state: the same per-user weights in every process, rebuilt from
+# the seed instead of being pickled across.
+
+settings = None
+popularity = None
+activity = None
+
+
+def init_worker(worker_settings):
+    """Build the weight tables a worker needs from the shared settings."""
+
+    global settings, popularity, activity
+
+    settings = worker_settings
+    users = settings['users']
+
+    rng = random.Random(f"{settings['seed']}:popularity")
+    popularity = array('d', cumulative(
+        power_law_weights(rng, users, POPULARITY_EXPONENT)))
+
+    rng = random.Random(f"{settings['seed']}:activity")
+    activity = array('d', cumulative(
+        power_law_weights(rng, users, ACTIVITY_EXPONENT)))
+
+
+def out_degree(rng, mean, limit):
+    """Heavy-tailed number of edges for one user, averaging about `mean`."""
+
+    # a Pareto variate with exponent a has mean a / (a - 1)
+    scale = mean * (OUT_DEGREE_EXPONENT - 1) / OUT_DEGREE_EXPONENT
+    return min(limit, int(scale * rng.paretovariate(OUT_DEGREE_EXPONENT)))
+
+
+def distinct_draws(rng, count, draw, exclude=()):
+    """Up to `count` distinct values from `draw()`, skipping `exclude`."""
+
+    chosen = set()
+    for _ in range(count * 3):
+        if len(chosen) == count:
+            break
+        value = draw()
+        if value not in exclude:
+            chosen.add(value)
+    return sorted(chosen)
+
+
+def scattered(index, total):
+    """Spread small indexes across 0..total-1 so "popular" isn't "oldest"."""
+
+    # 2654435761 is prime, so this is a permutation unless it divides total
+    step = 2654435761 if total % 2654435761 else 1
+    return (index * step) % total
+
+
+##############################################################################
+# Row generators, one chunk at a time
+
+
+def user_rows(rng, start, count):
+    for user_id in range(start, start + count):
+        username = f"{rng.choice(WORDS)}_{rng.choice(WORDS)}{user_id}"
+        yield dict(
+            email=f"{username}@example.com",
+            username=username,
+            image_url=rng.choice(image_urls),
+            password=PASSWORD_HASH,
+            bio=sentence(rng),
+            header_image_url=rng.choice(header_image_urls),
+            location=rng.choice(CITIES),
+        )
+
+
+def message_rows(rng, start, count):
+    end = datetime.fromisoformat(settings['end'])
+    begin = end - timedelta(days=settings['days'])
+
+    for _ in range(count):
+        yield dict(
+            text=sentence(rng, max_length=MAX_WARBLER_LENGTH),
+            timestamp=skewed_timestamp(rng, begin, end).isoformat(sep=' '),
+            user_id=weighted_index(rng, activity) + 1,
+        )
+
+
+def follow_rows(rng, start, count):
+    users = settings['users']
+    mean = settings['follows'] / users
+
+    for follower in range(start, start + count):
+        followed = distinct_draws(
+            rng,
+            out_degree(rng, mean, users - 1),
+            lambda: weighted_index(rng, popularity) + 1,
+            exclude={follower},
+        )
+        for user_id in followed:
+            yield dict(user_being_followed_id=user_id,
+                       user_following_id=follower)
+
+
+def like_rows(rng, start, count):
+    users, messages = settings['users'], settings['messages']
+    mean = settings['likes'] / users
+
+    def popular_message():
+        # a steep power law over message ids, scattered across the table
+        rank = int(messages * rng.random() ** 4)
+        return scattered(rank, messages) + 1
+
+    for liker in range(start, start + count):
+        liked = distinct_draws(rng, out_degree(rng, mean, messages),
+                               popular_message)
+        for msg_id in liked:
+            yield dict(user_liked_id=liker, msg_id=msg_id)
+
+
+KINDS = {
+    'users': (user_rows, USERS_CSV_HEADERS),
+    'messages': (message_rows, MESSAGES_CSV_HEADERS),
+    'follows': (follow_rows, FOLLOWS_CSV_HEADERS),
+    'likes': (like_rows, LIKES_CSV_HEADERS),
+}
+
+
+def render_chunk(task):
+    """Generate one chunk of rows and return it as file text."""
+
+    kind, index, start, count = task
+    make_rows, headers = KINDS[kind]
+    rng = random.Random(f"{settings['seed']}:{kind}:{index}")
+    rows = make_rows(rng, start, count)
+
+    buffer = io.StringIO()
+    if settings['format'] == 'ndjson':
+        for row in rows:
+            buffer.write(json.dumps(row))
+            buffer.write("\n")
+    else:
+        writer = csv.DictWriter(buffer, fieldnames=headers)
+        writer.writerows(rows)
+
+    return buffer.getvalue()
+
+
+def tasks_for(kind, total, chunk_size):
+    """Chunks of 1-based ids (users for follows/likes) to generate."""
+
+    for index, offset in enumerate(range(0, total, chunk_size)):
+        yield kind, index, offset + 1, min(chunk_size, total - offset)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate random Warbler data for loader.py.")
+    parser.add_argument('--users', type=int, default=NUM_USERS)
+    parser.add_argument('--messages', type=int, default=NUM_MESSAGES)
+    parser.add_argument('--follows', type=int, default=NUM_FOLLWERS,
+                        help="approximate number of follows")
+    parser.add_argument('--likes', type=int, default=NUM_LIKES,
+                        help="approximate number of likes")
+    parser.add_argument('--days', type=int, default=730,
+                        help="how far back messages go")
+    parser.add_argument('--end', default=datetime.now().date().isoformat(),
+                        help="date of the newest messages (YYYY-MM-DD)")
+    parser.add_argument('--seed', default='warbler')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--format', choices=['csv', 'ndjson'], default='csv')
+    parser.add_argument('--out', default='generator')
+    args = parser.parse_args()
+
+    worker_settings = dict(
+        seed=args.seed,
+        users=args.users,
+        messages=args.messages,
+        follows=args.follows,
+        likes=args.likes,
+        days=args.days,
+        end=args.end,
+        format=args.format,
+    )
+
+    # follows and likes are generated per user; the rest per row
+    totals = dict(users=args.users, messages=args.messages,
+                  follows=args.users, likes=args.users if args.messages else 0)
+
+    extension = 'ndjson' if args.format == 'ndjson' else 'csv'
+
+    with Pool(args.workers, initializer=init_worker,
+              initargs=(worker_settings,)) as pool:
+        for kind, (_, headers) in KINDS.items():
+            path = os.path.join(args.out, f"{kind}.{extension}")
+            with open(path, 'w', newline='') as out:
+                if args.format == 'csv':
+                    csv.DictWriter(out, fieldnames=headers).writeheader()
+                tasks = tasks_for(kind, totals[kind], args.chunk_size)
+                for text in pool.imap(render_chunk, tasks):
+                    out.write(text)
+            print(f"wrote {path}")
 
-header_image_urls = [
-    requests.get(f"http://www.splashbase.co/api/v1/images/{i}").json()['url']
-    for i in range(1, 46)
-]
 
-with open('generator/users.csv', 'w') as users_csv:
-    users_writer = csv.DictWriter(users_csv, fieldnames=USERS_CSV_HEADERS)
-    users_writer.writeheader()
-
-    for i in range(NUM_USERS):
-        users_writer.writerow(dict(
-            email=fake.email(),
-            username=fake.user_name(),
-            image_url=choice(image_urls),
-            password='$2b$12$Q1PUFjhN/AWRQ21LbGYvjeLpZZB6lfZ1BPwifHALGO6oIbyC3CmJe',
-            bio=fake.sentence(),
-            header_image_url=choice(header_image_urls),
-            location=fake.city()
-        ))
-
-with open('generator/messages.csv', 'w') as messages_csv:
-    messages_writer = csv.DictWriter(messages_csv, fieldnames=MESSAGES_CSV_HEADERS)
-    messages_writer.writeheader()
-
-    for i in range(NUM_MESSAGES):
-        messages_writer.writerow(dict(
-            text=fake.paragraph()[:MAX_WARBLER_LENGTH],
-            timestamp=get_random_datetime(),
-            user_id=randint(1, NUM_USERS)
-        ))
-
-# Generate follows.csv from random pairings of users
-
-with open('generator/follows.csv', 'w') as follows_csv:
-    all_pairs = list(permutations(range(1, NUM_USERS + 1), 2))
-
-    users_writer = csv.DictWriter(follows_csv, fieldnames=FOLLOWS_CSV_HEADERS)
-    users_writer.writeheader()
-
-    for followed_user, follower in sample(all_pairs, NUM_FOLLWERS):
-        users_writer.writerow(dict(user_being_followed_id=followed_user, user_following_id=follower))
+if __name__ == '__main__':
+    main()
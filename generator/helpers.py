@@ -1,8 +1,58 @@
 """Support functions for CSV generation."""
 
+import math
+from bisect import bisect
 from datetime import datetime
 from random import uniform
 
+WORDS = """
+    able about above across after again air all almost along also always
+    among animal answer area arm around art ask back bad bank base bear
+    beat bed before begin behind believe best better between big bird black
+    blue board boat body book both box boy bring brother build business
+    call camp car card care carry case cat catch cause cell center certain
+    chair chance change charge check child choose city class clear close
+    cloud coast cold color come common cook corner cost could country course
+    cover cross cup cut dance dark data day deal deep design detail develop
+    dinner direction dog door down draw dream dress drink drive drop dry
+    during early earth east easy eat edge effect egg end energy enjoy enough
+    even evening event every face fact fall family far farm fast father
+    field fight fill film final find fine fire first fish floor flower fly
+    follow food foot force forest form free fresh friend front fruit full
+    game garden gas gather girl give glass go gold good great green ground
+    group grow guess hair half hand happy hard hat head hear heart heat help
+    high hill history hold home hope horse hot hour house huge idea image
+    island job join jump just keep key kid kind king kitchen know lake land
+    large last late laugh lead learn leave left less letter level life
+    light line list listen little live long look lose loud love low machine
+    main make man many map mark market matter may meet memory middle might
+    mind minute miss moment money moon morning mother mountain move music
+    name nation nature near need never new news next night noise north note
+    nothing notice number ocean offer office often oil old open order other
+    page paint paper park part party pass past path pay people perhaps
+    person pick picture piece place plan plant play point pool poor power
+    present pretty pull push question quick quiet race rain reach read
+    ready real reason record red remember rest rich ride right river road
+    rock room round rule run safe sail salt same sand save say school science
+    sea season seat second see seed sell send sense serve set shape share
+    ship shore short show side sign silver simple sing sister sit size skill
+    sky sleep slow small smile snow soft soil song soon sound south space
+    speak special spring square stand star start state station stay step
+    stone stop store storm story street strong student study summer sun
+    sure surface sweet swim table take talk tall teach team tell test thank
+    thing think through tiny together tomorrow tonight town track trade
+    train travel tree trip true try turn type under until use valley visit
+    voice wait walk wall want warm wash watch water wave way wear weather
+    week west wheel white whole wild wind window winter wish wood word work
+    world write yard year yellow young
+""".split()
+
+CITIES = """
+    Springfield Riverside Fairview Franklin Greenville Bristol Clinton
+    Georgetown Salem Madison Arlington Ashland Burlington Manchester Oxford
+    Milton Newport Dayton Lexington Jackson Kingston Marion Dover Hudson
+""".split()
+
 
 def get_random_datetime(year_gap=2):
     """Get a random datetime within the last few years."""
@@ -12,3 +62,62 @@ def get_random_datetime(year_gap=2):
     random_timestamp = uniform(then.timestamp(), now.timestamp())
 
     return datetime.fromtimestamp(random_timestamp)
+
+
+def sentence(rng, min_words=4, max_words=14, max_length=None):
+    """A random capitalized sentence of lowercase words."""
+
+    words = rng.choices(WORDS, k=rng.randint(min_words, max_words))
+    text = " ".join(words).capitalize() + "."
+
+    return text if max_length is None else text[:max_length]
+
+
+def power_law_weights(rng, count, exponent):
+    """`count` weights following a Pareto distribution, in random order.
+
+    A few items get most of the weight, like follower counts on a real
+    social network.
+    """
+
+    return [rng.paretovariate(exponent) for _ in range(count)]
+
+
+def cumulative(weights):
+    """Running totals of `weights`, for `weighted_index`."""
+
+    totals = []
+    running = 0.0
+    for weight in weights:
+        running += weight
+        totals.append(running)
+    return totals
+
+
+def weighted_index(rng, cum_weights):
+    """Random index into `cum_weights` in proportion to the weights.
+
+    O(log n), unlike random.choices, which re-scans for every call with
+    plain weights.
+    """
+
+    return bisect(cum_weights, rng.random() * cum_weights[-1])
+
+
+def skewed_timestamp(rng, start, end, recency=2.0):
+    """Random datetime between `start` and `end`, skewed towards `end`.
+
+    Posting also follows a daily cycle: fewer posts overnight.
+    """
+
+    span = (end - start).total_seconds()
+
+    while True:
+        # recency > 1 piles timestamps up near the end of the range
+        offset = span * (1 - rng.random() ** recency)
+        moment = datetime.fromtimestamp(start.timestamp() + offset)
+        hour = moment.hour + moment.minute / 60
+        # busiest around 20:00, quietest around 08:00
+        activity = 0.55 + 0.45 * math.cos((hour - 20) / 24 * 2 * math.pi)
+        if rng.random() < activity:
+            return moment
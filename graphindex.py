@@ -0,0 +1,264 @@
+"""In-process index of the follow graph.
+
+Keeps who follows whom as two sorted int arrays per user (the accounts they
+follow, and their followers), so relationship checks are a binary search
+instead of a query:
+
+    graph_index.is_following(a, b)      does a follow b?
+    graph_index.is_followed_by(a, b)    does b follow a?
+    graph_index.mutuals(a)              accounts a follows that follow a back
+    graph_index.counts(a)               (following, followers)
+
+Pages use it, through ViewerContext, when GRAPH_INDEX is on. It is built
+from the follows table on first use, leaving out deleted accounts.
+follows.py records every change on the session, and the changes are
+applied when the transaction commits, so this process's own follows show
+up at once. Other workers' changes show up when the index is rebuilt in
+the background, once it is GRAPH_INDEX_MAX_AGE seconds old. Until then,
+with several workers, a Follow button can be briefly out of date.
+
+`footprint()` reports how many users and edges it holds and roughly how
+much memory that takes.
+"""
+
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session, aliased
+
+from models import db, Follows, User
+
+# rows fetched at a time while building
+LOAD_BATCH = 10000
+
+EMPTY = array('i')
+
+
+def _find(ids, user_id):
+    """Position of `user_id` in the sorted array `ids`, or -1."""
+
+    i = bisect_left(ids, user_id)
+    return i if i < len(ids) and ids[i] == user_id else -1
+
+
+def _insert(lists, key, user_id):
+    ids = lists.get(key)
+    if ids is None:
+        lists[key] = array('i', [user_id])
+        return
+    i = bisect_left(ids, user_id)
+    if i == len(ids) or ids[i] != user_id:
+        ids.insert(i, user_id)
+
+
+def _delete(lists, key, user_id):
+    ids = lists.get(key)
+    if ids is not None:
+        i = _find(ids, user_id)
+        if i >= 0:
+            del ids[i]
+
+
+def _apply(following, followers, change):
+    kind, user_id, other_ids = change
+
+    if kind == 'follow':
+        for other_id in other_ids:
+            _insert(following, user_id, other_id)
+            _insert(followers, other_id, user_id)
+    elif kind == 'unfollow':
+        for other_id in other_ids:
+            _delete(following, user_id, other_id)
+            _delete(followers, other_id, user_id)
+    elif kind == 'delete':
+        for other_id in following.pop(user_id, EMPTY):
+            _delete(followers, other_id, user_id)
+        for other_id in followers.pop(user_id, EMPTY):
+            _delete(following, other_id, user_id)
+
+
+class GraphIndex:
+    """Sorted per-user following / follower id arrays."""
+
+    def __init__(self):
+        self._following = {}
+        self._followers = {}
+        self._built_at = None
+        # changes applied while a rebuild is reading the table, to replay
+        # onto the rebuilt index
+        self._replay = None
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+
+    # Building
+
+    def rebuild(self, rows=None):
+        """Reload from the follows table, or `rows` of (follower, followed)."""
+
+        with self._lock:
+            self._replay = []
+
+        try:
+            if rows is None:
+                # follows of deleted accounts wait for purge.py; leave them out
+                follower, followed = aliased(User), aliased(User)
+                rows = (db.session
+                        .query(Follows.user_following_id,
+                               Follows.user_being_followed_id)
+                        .join(follower,
+                              follower.id == Follows.user_following_id)
+                        .join(followed,
+                              followed.id == Follows.user_being_followed_id)
+                        .filter(follower.deleted_at.is_(None),
+                                followed.deleted_at.is_(None))
+                        .yield_per(LOAD_BATCH))
+
+            following = {}
+            followers = {}
+            for follower_id, followed_id in rows:
+                following.setdefault(follower_id,
+                                     array('i')).append(followed_id)
+                followers.setdefault(followed_id,
+                                     array('i')).append(follower_id)
+            for lists in (following, followers):
+                for user_id, ids in lists.items():
+                    lists[user_id] = array('i', sorted(ids))
+        except Exception:
+            with self._lock:
+                self._replay = None
+            raise
+
+        with self._lock:
+            for change in self._replay:
+                _apply(following, followers, change)
+            self._replay = None
+            self._following, self._followers = following, followers
+            self._built_at = time.monotonic()
+
+    def clear(self):
+        with self._lock:
+            self._following, self._followers = {}, {}
+            self._built_at = None
+
+    def _rebuild_in_background(self, app):
+        try:
+            with app.app_context():
+                self.rebuild()
+                db.session.remove()
+        finally:
+            self._rebuild_lock.release()
+
+    def _fresh(self):
+        """Build on first use; start a background rebuild once too old."""
+
+        if self._built_at is None:
+            with self._rebuild_lock:
+                if self._built_at is None:
+                    self.rebuild()
+            return
+
+        if not has_app_context():
+            return
+        max_age = current_app.config.get('GRAPH_INDEX_MAX_AGE', 60)
+        if (time.monotonic() - self._built_at > max_age
+                and self._rebuild_lock.acquire(blocking=False)):
+            threading.Thread(target=self._rebuild_in_background,
+                             args=(current_app._get_current_object(),),
+                             daemon=True).start()
+
+    def apply(self, change):
+        """Apply a committed ('follow' | 'unfollow' | 'delete', id, ids)."""
+
+        with self._lock:
+            if self._replay is not None:
+                self._replay.append(change)
+            elif self._built_at is None:
+                # not built yet; the build will read the change from the table
+                return
+            _apply(self._following, self._followers, change)
+
+    # Queries
+
+    def following(self, user_id):
+        """Sorted ids of the accounts `user_id` follows."""
+
+        self._fresh()
+        return self._following.get(user_id, EMPTY)
+
+    def followers(self, user_id):
+        """Sorted ids of the accounts following `user_id`."""
+
+        self._fresh()
+        return self._followers.get(user_id, EMPTY)
+
+    def is_following(self, user_id, other_id):
+        """Does `user_id` follow `other_id`?"""
+
+        return _find(self.following(user_id), other_id) >= 0
+
+    def is_followed_by(self, user_id, other_id):
+        """Does `other_id` follow `user_id`?"""
+
+        return _find(self.followers(user_id), other_id) >= 0
+
+    def mutuals(self, user_id):
+        """Ids `user_id` follows that follow them back, ascending."""
+
+        following = self.following(user_id)
+        followers = self.followers(user_id)
+        if len(following) > len(followers):
+            following, followers = followers, following
+
+        return [other_id for other_id in following
+                if _find(followers, other_id) >= 0]
+
+    def counts(self, user_id):
+        """(following, followers) counts for `user_id`."""
+
+        return len(self.following(user_id)), len(self.followers(user_id))
+
+    def footprint(self):
+        """Users, edges and approximate bytes held by the index."""
+
+        with self._lock:
+            lists = (self._following, self._followers)
+            size = sum(sys.getsizeof(ids) + sys.getsizeof(user_id)
+                       for ids_by_user in lists
+                       for user_id, ids in ids_by_user.items())
+            size += sum(sys.getsizeof(ids_by_user) for ids_by_user in lists)
+
+            return dict(
+                users=len(self._following.keys() | self._followers.keys()),
+                edges=sum(len(ids) for ids in self._following.values()),
+                bytes=size,
+            )
+
+
+graph_index = GraphIndex()
+
+
+def enabled():
+    return has_app_context() and current_app.config.get('GRAPH_INDEX', False)
+
+
+def record(kind, user_id, other_ids=()):
+    """Apply a follow change to the index once the transaction commits."""
+
+    db.session.info.setdefault('graph_changes', []).append(
+        (kind, user_id, list(other_ids)))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changes(session):
+    for change in session.info.pop('graph_changes', ()):
+        graph_index.apply(change)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_changes(session):
+    session.info.pop('graph_changes', None)
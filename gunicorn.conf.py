@@ -0,0 +1,12 @@
+"""gunicorn settings for the web process (see the Procfile).
+
+Threaded workers, so one process serves several requests at once; the
+password hashing pool in each process is sized against WEB_THREADS (see
+app.py and hashing.py).
+"""
+
+import os
+
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 8))
@@ -0,0 +1,121 @@
+"""Password hashing on a bounded worker pool.
+
+bcrypt is deliberately slow. Run inline, a burst of logins ties up every
+web worker hashing while page views queue behind them. Instead, hashes run
+on a small thread pool (bcrypt releases the GIL while it works) that only
+accepts `workers + queue_size` jobs at a time; past that, `HashingBusy` is
+raised at once so the route can answer "try again" instead of piling up.
+A hash that isn't done within `timeout` seconds raises it too.
+
+The pool is per process, so it only limits anything if a process serves
+several requests at once: the web process runs threaded gunicorn workers
+(gunicorn.conf.py), and app.py sizes the pool below their thread count.
+
+The bcrypt cost is configurable. Hashes made at a different cost are
+upgraded the next time their owner logs in (see `needs_rehash`).
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import bcrypt
+
+DEFAULT_ROUNDS = 12
+DEFAULT_WORKERS = 4
+DEFAULT_QUEUE_SIZE = 16
+
+# how long a request waits for a hash before giving up, in seconds
+DEFAULT_TIMEOUT = 10
+
+
+class HashingBusy(Exception):
+    """The hashing pool is full; ask the user to try again shortly."""
+
+
+class HashingPool:
+    """Thread pool that rejects work once `workers + queue_size` are pending."""
+
+    def __init__(self, rounds=DEFAULT_ROUNDS, workers=DEFAULT_WORKERS,
+                 queue_size=DEFAULT_QUEUE_SIZE, timeout=DEFAULT_TIMEOUT):
+        self.rounds = rounds
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers,
+                                            thread_name_prefix='bcrypt')
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy()
+
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            # still queued: don't run it for nobody
+            future.cancel()
+            raise HashingBusy()
+
+    def hash_password(self, password):
+        """bcrypt hash of `password` at the configured cost, as text."""
+
+        salt = bcrypt.gensalt(rounds=self.rounds)
+        hashed = self._run(bcrypt.hashpw, password.encode('utf-8'), salt)
+        return hashed.decode('utf-8')
+
+    def check_password(self, hashed, password):
+        """Does `password` match the bcrypt hash `hashed`?"""
+
+        return self._run(bcrypt.checkpw,
+                         password.encode('utf-8'),
+                         hashed.encode('utf-8'))
+
+    def needs_rehash(self, hashed):
+        """Was `hashed` made at a different cost than the configured one?"""
+
+        return cost_of(hashed) != self.rounds
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+def cost_of(hashed):
+    """The cost (log2 rounds) a bcrypt hash was made with, e.g. 12."""
+
+    # $2b$12$<salt+hash>
+    try:
+        return int(hashed.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+
+pool = HashingPool()
+
+
+def configure(rounds=DEFAULT_ROUNDS, workers=DEFAULT_WORKERS,
+              queue_size=DEFAULT_QUEUE_SIZE, timeout=DEFAULT_TIMEOUT):
+    """Replace the module's pool with one using these settings."""
+
+    global pool
+
+    old = pool
+    pool = HashingPool(rounds, workers, queue_size, timeout)
+    old.shutdown()
+
+
+def hash_password(password):
+    return pool.hash_password(password)
+
+
+def check_password(hashed, password):
+    return pool.check_password(hashed, password)
+
+
+def needs_rehash(hashed):
+    return pool.needs_rehash(hashed)
@@ -0,0 +1,149 @@
+"""HTTP caching: conditional GETs for pages, long-lived static assets.
+
+Pages decorated with `conditional` get an ETag built from a cheap "version"
+of what they show (row `updated_at`s, which also move whenever a counter
+does), the logged-in user's own version, and the URL. A browser coming
+back with a matching If-None-Match gets a 304 without the page's queries
+or template ever running. Anonymous pages also carry Last-Modified.
+
+`static_url()` gives asset URLs with a hash of the file's content; those
+are served with a year-long, immutable Cache-Control, since a changed file
+gets a new URL.
+"""
+
+import functools
+import hashlib
+import os
+from datetime import timezone
+
+from flask import g, make_response, request, session, url_for
+
+from models import db, User
+
+# seconds a content-hashed static asset may be cached
+STATIC_MAX_AGE = 365 * 24 * 60 * 60
+
+
+##############################################################################
+# Conditional GET for pages
+
+
+def _viewer_version():
+    if g.user is None:
+        return None
+
+    # the viewer's counters move with every like and follow they make, which
+    # is what changes their like / follow buttons on other pages
+    updated_at = (db.session
+                    .query(User.updated_at)
+                    .filter(User.id == g.user.id)
+                    .scalar())
+    return g.user.id, updated_at
+
+
+def page_etag(version):
+    """ETag for the current URL showing `version` to the current viewer."""
+
+    key = repr((version, _viewer_version(), request.full_path))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def _is_fresh(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+
+    # a date can't tell viewers apart, so only anonymous pages use one
+    if g.user is None and last_modified and request.if_modified_since:
+        last_modified = last_modified.replace(microsecond=0,
+                                              tzinfo=timezone.utc)
+        return last_modified <= request.if_modified_since
+
+    return False
+
+
+def conditional(version):
+    """Answer conditional GETs for a view from `version(**view_args)`.
+
+    `version` returns (something identifying what the page shows, the UTC
+    datetime it last changed), or None to just run the view -- e.g. when
+    the row doesn't exist and the view will 404.
+    """
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(**view_args):
+            found = version(**view_args)
+            # pending flash messages would be lost in a 304
+            if found is None or session.get('_flashes'):
+                return view(**view_args)
+
+            what, last_modified = found
+            etag = page_etag(what)
+
+            if _is_fresh(etag, last_modified):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(**view_args))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            response.vary.add('Cookie')
+            response.cache_control.no_cache = True
+            if g.user is None:
+                response.cache_control.public = True
+                response.last_modified = last_modified
+            else:
+                response.cache_control.private = True
+
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+##############################################################################
+# Content-hashed static assets
+
+
+@functools.lru_cache(maxsize=None)
+def _file_digest(path, mtime):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()[:12]
+
+
+def static_digest(app, filename):
+    """Short hash of a static file's content, or None if it doesn't exist."""
+
+    path = os.path.join(app.static_folder, filename)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    return _file_digest(path, mtime)
+
+
+def init_app(app):
+    """Add `static_url()` to templates and cache hashed assets for long."""
+
+    def static_url(filename):
+        """URL of a static file that changes whenever its content does."""
+
+        return url_for('static', filename=filename,
+                       v=static_digest(app, filename))
+
+    app.jinja_env.globals['static_url'] = static_url
+
+    @app.after_request
+    def cache_static(response):
+        if (request.endpoint == 'static'
+                and response.status_code == 200
+                and request.args.get('v')
+                and request.args['v'] == static_digest(
+                    app, request.view_args['filename'])):
+            response.cache_control.public = True
+            response.cache_control.max_age = STATIC_MAX_AGE
+            response.cache_control.immutable = True
+            response.cache_control.no_cache = None
+        return response
@@ -0,0 +1,257 @@
+"""A job queue backed by the jobs table.
+
+Requests enqueue work they shouldn't wait for, in the same transaction as
+the change that needs it, so a job exists exactly when its change was
+committed:
+
+    jobs.enqueue('purge_user', user_id=user.id)
+
+`flask run-jobs` starts worker processes that claim due jobs and run their
+handlers, registered with `@jobs.handler('kind')`. A handler does one
+bounded batch of work and returns how many rows it handled. If that was
+more than none, the job goes back in the queue to run the next batch, with
+other jobs taking turns in between. It is done once a batch finds nothing
+left to do. Each batch commits together with the job's progress, so it
+happens entirely or not at all.
+
+Handlers must be idempotent: a batch that raises is rolled back and retried
+after a growing delay, up to MAX_ATTEMPTS times. A job whose worker died
+can be claimed again after LOCK_TIMEOUT seconds.
+
+`stats()` (and `flask job-stats`) report queue depth, lag and recent
+throughput per kind, and every finished job is logged as a JSON line.
+"""
+
+import json
+import time
+import traceback
+from collections import defaultdict
+from datetime import datetime, timedelta
+from multiprocessing import Process
+
+from flask import current_app
+from sqlalchemy import and_, func, or_
+
+from models import db, Job
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# failed runs before a job is given up on
+MAX_ATTEMPTS = 5
+
+# seconds before the first retry; doubled for each one after that
+RETRY_DELAY = 10
+
+# seconds a running job may go without finishing a batch before another
+# worker may take it over
+LOCK_TIMEOUT = 300
+
+# seconds an idle worker waits before looking for jobs again
+POLL_SECONDS = 1.0
+
+# due jobs a worker tries to claim before giving up for this poll
+CLAIM_CANDIDATES = 10
+
+# how far back stats() counts finished jobs, in seconds
+STATS_WINDOW = 3600
+
+HANDLERS = {}
+
+
+def handler(kind):
+    """Register the decorated function to run jobs of `kind`."""
+
+    def register(fn):
+        HANDLERS[kind] = fn
+        return fn
+
+    return register
+
+
+def enqueue(kind, **payload):
+    """Add a job to the session; it is queued when the session commits."""
+
+    job = Job(kind=kind, payload=json.dumps(payload))
+    db.session.add(job)
+    return job
+
+
+def _due(now):
+    stale = now - timedelta(seconds=LOCK_TIMEOUT)
+    return or_(and_(Job.status == QUEUED, Job.run_at <= now),
+               and_(Job.status == RUNNING, Job.locked_at < stale))
+
+
+def claim():
+    """Mark a due job as running for this worker and return it, or None.
+
+    The claim is an UPDATE conditional on the job still being due, so when
+    workers race for a job only one of them gets it.
+    """
+
+    now = datetime.utcnow()
+    candidates = (db.session
+                  .query(Job.id)
+                  .filter(_due(now))
+                  .order_by(Job.run_at, Job.id)
+                  .limit(CLAIM_CANDIDATES)
+                  .all())
+    db.session.commit()
+
+    for (job_id,) in candidates:
+        claimed = (Job
+                   .query
+                   .filter(Job.id == job_id, _due(now))
+                   .update({Job.status: RUNNING, Job.locked_at: now},
+                           synchronize_session=False))
+        db.session.commit()
+        if claimed:
+            return Job.query.get(job_id)
+
+    return None
+
+
+def run_one():
+    """Claim and run one batch of a due job; False if none was due."""
+
+    job = claim()
+    if job is None:
+        return False
+
+    job_id, kind = job.id, job.kind
+    started = time.perf_counter()
+
+    try:
+        processed = HANDLERS[kind](**json.loads(job.payload))
+    except Exception:
+        db.session.rollback()
+        _failed(job_id, traceback.format_exc(),
+                time.perf_counter() - started)
+        return True
+
+    job.processed += processed
+    job.seconds += time.perf_counter() - started
+    job.locked_at = None
+    if processed:
+        # more to do; back of the queue
+        job.status = QUEUED
+        job.run_at = datetime.utcnow()
+    else:
+        job.status = DONE
+        job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+    if job.status == DONE:
+        _log(job)
+    return True
+
+
+def _failed(job_id, error, seconds):
+    job = Job.query.get(job_id)
+    job.attempts += 1
+    job.seconds += seconds
+    job.last_error = error
+    job.locked_at = None
+
+    if job.attempts >= MAX_ATTEMPTS:
+        job.status = FAILED
+        job.finished_at = datetime.utcnow()
+    else:
+        job.status = QUEUED
+        job.run_at = datetime.utcnow() + timedelta(
+            seconds=RETRY_DELAY * 2 ** (job.attempts - 1))
+    db.session.commit()
+
+    _log(job)
+
+
+def _log(job):
+    line = json.dumps(dict(
+        event='job',
+        id=job.id,
+        kind=job.kind,
+        status=job.status,
+        attempts=job.attempts,
+        processed=job.processed,
+        seconds=round(job.seconds, 3),
+    ))
+    if job.status == DONE:
+        current_app.logger.info(line)
+    else:
+        current_app.logger.warning(line)
+
+
+def work(burst=False, poll_seconds=POLL_SECONDS):
+    """Run jobs until stopped, or with `burst` until none are due."""
+
+    while True:
+        if not run_one():
+            if burst:
+                return
+            time.sleep(poll_seconds)
+
+
+def _worker_main(app, burst):
+    with app.app_context():
+        # connections inherited from the parent process can't be shared
+        db.engine.dispose()
+        work(burst)
+
+
+def run_workers(app, workers=1, burst=False):
+    """Run `workers` worker processes (or with 1, work in this one)."""
+
+    if workers <= 1:
+        work(burst)
+        return
+
+    processes = [Process(target=_worker_main, args=(app, burst))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+def stats(window=STATS_WINDOW):
+    """{kind: metrics} for the queue and jobs finished in the last `window`.
+
+    Metrics are how many jobs are queued, running and failed, how old the
+    oldest queued job is (seconds), and for recently finished jobs how many
+    there were, rows handled, and rows and jobs per second of work.
+    """
+
+    now = datetime.utcnow()
+    since = now - timedelta(seconds=window)
+    metrics = defaultdict(lambda: dict(queued=0, running=0, failed=0,
+                                       oldest_queued_seconds=0, done=0,
+                                       rows=0, rows_per_second=0.0,
+                                       jobs_per_second=0.0))
+
+    waiting = (db.session
+               .query(Job.kind, Job.status, func.count(),
+                      func.min(Job.created_at))
+               .filter(Job.status.in_([QUEUED, RUNNING, FAILED]))
+               .group_by(Job.kind, Job.status))
+    for kind, status, count, oldest in waiting:
+        metrics[kind][status] = count
+        if status == QUEUED:
+            metrics[kind]['oldest_queued_seconds'] = round(
+                (now - oldest).total_seconds(), 1)
+
+    finished = (db.session
+                .query(Job.kind, func.count(), func.sum(Job.processed),
+                       func.sum(Job.seconds))
+                .filter(Job.status == DONE, Job.finished_at >= since)
+                .group_by(Job.kind))
+    for kind, count, rows, seconds in finished:
+        metrics[kind].update(done=count, rows=rows)
+        if seconds:
+            metrics[kind].update(
+                rows_per_second=round(rows / seconds, 1),
+                jobs_per_second=round(count / seconds, 3))
+
+    return dict(metrics)
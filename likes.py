@@ -0,0 +1,51 @@
+"""Liking and unliking messages.
+
+Each is one statement against the (user_liked_id, msg_id) primary key:
+liking twice, or unliking something not liked, changes nothing. Counters
+only move when a row was actually inserted or deleted, as do the like
+buckets trending.py ranks messages by.
+"""
+
+from sqlalchemy import and_, select
+
+from models import db, insert_ignoring_duplicates, Like, Message
+import counters
+import trending
+
+
+def like(user_id, message_id):
+    """Like a message; True if it wasn't liked (and exists)."""
+
+    row = select([db.literal(user_id), Message.id]).where(and_(
+        Message.id == message_id, Message.deleted_at.is_(None)))
+    inserted = insert_ignoring_duplicates(
+        Like.__table__, ['user_liked_id', 'msg_id'], row)
+
+    if inserted:
+        counters.liked(user_id, message_id)
+        trending.count_like(message_id)
+    return bool(inserted)
+
+
+def unlike(user_id, message_id):
+    """Remove a like; True if there was one."""
+
+    deleted = (Like
+                .query
+                .filter_by(user_liked_id=user_id, msg_id=message_id)
+                .delete(synchronize_session=False))
+
+    if deleted:
+        counters.liked(user_id, message_id, delta=-1)
+        trending.count_like(message_id, delta=-1)
+    return bool(deleted)
+
+
+def like_count(message_id):
+    """How many users like a message, or None if there is no such message."""
+
+    return (db.session
+              .query(Message.like_count)
+              .filter(Message.id == message_id,
+                      Message.deleted_at.is_(None))
+              .scalar())
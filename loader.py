@@ -0,0 +1,246 @@
+"""Stream CSV / NDJSON files into the Warbler database.
+
+    python loader.py users=generator/users.csv messages=generator/messages.csv \
+        follows=generator/follows.csv likes=generator/likes.csv
+
+Each TABLE=PATH is loaded in the order given. Files are read a chunk at a
+time (--chunk-size rows), never all at once. On Postgres each chunk goes in
+with COPY; elsewhere with one executemany INSERT. Every chunk commits
+together with a checkpoint row in load_checkpoints, so if a load dies,
+running the same command again carries on after the last committed chunk
+(--restart ignores the checkpoints).
+
+With --drop-indexes, the tables' secondary indexes are dropped before the
+load and rebuilt once at the end, which is much faster than maintaining
+them row by row. After loading, the counters, home timelines and
+hashtag/mention postings are recomputed in bulk (skip with --no-derived).
+"""
+
+import argparse
+import csv
+import io
+import itertools
+import json
+import sys
+import time
+from datetime import datetime
+
+from sqlalchemy import DateTime, Integer, inspect
+
+from models import db, LoadCheckpoint
+
+DEFAULT_CHUNK_SIZE = 10000
+
+
+def read_rows(path):
+    """Yield each row of a .csv (with header) or .ndjson file as a dict."""
+
+    with open(path, newline='') as f:
+        if path.endswith(('.ndjson', '.jsonl')):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+
+def chunked(rows, size):
+    """Split an iterator of rows into lists of at most `size`."""
+
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _converter(column):
+    """Function turning a text field into a value for `column`."""
+
+    if isinstance(column.type, Integer):
+        convert = int
+    elif isinstance(column.type, DateTime):
+        convert = datetime.fromisoformat
+    else:
+        convert = str
+
+    def to_value(field):
+        if field is None or (field == '' and column.nullable):
+            return None
+        return field if not isinstance(field, str) else convert(field)
+
+    return to_value
+
+
+class Loader:
+    """Loads files into tables in checkpointed chunks."""
+
+    def __init__(self, engine, chunk_size=DEFAULT_CHUNK_SIZE, out=sys.stderr):
+        self.engine = engine
+        self.chunk_size = chunk_size
+        self.out = out
+        self.use_copy = engine.dialect.name == 'postgresql'
+
+    # checkpoints
+
+    def rows_done(self, source):
+        checkpoint = LoadCheckpoint.query.get(source)
+        return checkpoint.rows_loaded if checkpoint else 0
+
+    def forget(self, source):
+        LoadCheckpoint.query.filter_by(source=source).delete()
+        db.session.commit()
+
+    def _save_checkpoint(self, conn, source, rows_loaded):
+        table = LoadCheckpoint.__table__
+        updated = conn.execute(
+            table.update()
+                 .where(table.c.source == source)
+                 .values(rows_loaded=rows_loaded,
+                         updated_at=datetime.utcnow()))
+        if updated.rowcount == 0:
+            conn.execute(table.insert().values(source=source,
+                                               rows_loaded=rows_loaded,
+                                               updated_at=datetime.utcnow()))
+
+    # indexes
+
+    def drop_indexes(self, table):
+        for index in table.indexes:
+            self.engine.execute(f"DROP INDEX IF EXISTS {index.name}")
+
+    def create_indexes(self, table):
+        existing = {index['name']
+                    for index in inspect(self.engine).get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                self._log(f"{table.name}: building index {index.name}")
+                index.create(self.engine)
+
+    # loading
+
+    def _insert_chunk(self, conn, table, columns, chunk):
+        if self.use_copy:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for row in chunk:
+                writer.writerow('' if row.get(name) is None else row[name]
+                                for name in columns)
+            buffer.seek(0)
+
+            cursor = conn.connection.cursor()
+            cursor.copy_expert(
+                f"COPY {table.name} ({', '.join(columns)}) "
+                f"FROM STDIN WITH (FORMAT csv)", buffer)
+        else:
+            converters = {name: _converter(table.c[name]) for name in columns}
+            conn.execute(table.insert(), [
+                {name: converters[name](row.get(name)) for name in columns}
+                for row in chunk
+            ])
+
+    def load(self, table, path):
+        """Load `path` into `table`, resuming after its last checkpoint."""
+
+        source = f"{table.name}:{path}"
+        skip = self.rows_done(source)
+        rows = read_rows(path)
+
+        if skip:
+            self._log(f"{table.name}: resuming after row {skip:,}")
+            rows = itertools.islice(rows, skip, None)
+
+        loaded = skip
+        columns = None
+        start = time.perf_counter()
+
+        for chunk in chunked(rows, self.chunk_size):
+            if columns is None:
+                columns = [name for name in chunk[0] if name in table.c]
+
+            with self.engine.begin() as conn:
+                self._insert_chunk(conn, table, columns, chunk)
+                loaded += len(chunk)
+                self._save_checkpoint(conn, source, loaded)
+
+            elapsed = time.perf_counter() - start
+            rate = (loaded - skip) / elapsed if elapsed else 0
+            self._log(f"{table.name}: {loaded:,} rows ({rate:,.0f} rows/sec)")
+
+        if columns and 'id' in columns and self.use_copy:
+            # explicit ids don't advance the serial; catch it up
+            self.engine.execute(
+                f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                f"(SELECT max(id) FROM {table.name}))")
+
+        return loaded - skip
+
+    def _log(self, message):
+        print(message, file=self.out, flush=True)
+
+
+def rebuild_derived():
+    """Recompute counters, home timelines and postings after a bulk load."""
+
+    import counters
+    import tags
+    import timeline
+
+    counters.reconcile()
+    db.session.commit()
+    timeline.rebuild_all()
+    db.session.commit()
+    # commits a batch of messages at a time
+    for _ in tags.backfill():
+        pass
+
+
+def parse_spec(spec):
+    table_name, sep, path = spec.partition('=')
+    if not sep or table_name not in db.metadata.tables:
+        raise argparse.ArgumentTypeError(
+            f"expected TABLE=PATH with a known table, got {spec!r}")
+    return db.metadata.tables[table_name], path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Stream CSV/NDJSON files into the Warbler database.")
+    parser.add_argument('specs', nargs='+', metavar='TABLE=PATH',
+                        type=parse_spec)
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--drop-indexes', action='store_true',
+                        help="drop secondary indexes during the load")
+    parser.add_argument('--restart', action='store_true',
+                        help="ignore checkpoints from earlier runs")
+    parser.add_argument('--no-derived', action='store_true',
+                        help="don't recompute counters and timelines")
+    args = parser.parse_args(argv)
+
+    db.create_all()
+    loader = Loader(db.engine, chunk_size=args.chunk_size)
+    tables = [table for table, _ in args.specs]
+
+    if args.drop_indexes:
+        for table in tables:
+            loader.drop_indexes(table)
+
+    for table, path in args.specs:
+        if args.restart:
+            loader.forget(f"{table.name}:{path}")
+        loader.load(table, path)
+
+    if args.drop_indexes:
+        for table in tables:
+            loader.create_indexes(table)
+
+    if not args.no_derived:
+        loader._log("recomputing counters, timelines and postings")
+        rebuild_derived()
+
+
+if __name__ == '__main__':
+    # importing the app configures the database connection
+    from app import app  # noqa: F401
+    main()
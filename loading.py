@@ -0,0 +1,73 @@
+"""Named loading profiles for Message and User queries.
+
+Each profile says which columns a kind of page actually renders and how to
+load related rows, so a page costs a fixed number of SELECTs however many
+items it shows:
+
+- messages "feed": message columns plus the author's card, joined in the
+  same SELECT (home timeline, liked messages, single message)
+- messages "profile": message columns only, for pages where the author is
+  already known (a user's own profile)
+- users "card": what a user card in a list shows
+- users "profile": what a profile header shows, including counters
+
+Columns left out of a profile are deferred, not missing; touching one costs
+an extra SELECT, so add it to the profile instead.
+
+Both queries leave out deleted users and messages, which stay in their
+tables until purge.py's background jobs get to them. Use
+`.filter(Model.id == id).first_or_404()` on them, not `.get()`.
+"""
+
+from sqlalchemy.orm import joinedload, load_only
+
+from models import Message, User
+
+MESSAGE_COLUMNS = ('id', 'text', 'timestamp', 'user_id', 'like_count')
+
+USER_CARD_COLUMNS = ('id', 'username', 'image_url', 'header_image_url', 'bio',
+                     'followers_count')
+
+USER_PROFILE_COLUMNS = USER_CARD_COLUMNS + (
+    'location',
+    'messages_count',
+    'following_count',
+    'likes_count',
+)
+
+MESSAGE_PROFILES = {
+    'feed': lambda: (
+        load_only(*MESSAGE_COLUMNS),
+        joinedload(Message.user).load_only(*USER_CARD_COLUMNS),
+    ),
+    'profile': lambda: (
+        load_only(*MESSAGE_COLUMNS),
+    ),
+}
+
+USER_PROFILES = {
+    'card': lambda: (
+        load_only(*USER_CARD_COLUMNS),
+    ),
+    'profile': lambda: (
+        load_only(*USER_PROFILE_COLUMNS),
+    ),
+}
+
+
+def message_query(profile):
+    """Undeleted messages, with the loader options for `profile`."""
+
+    return (Message
+            .query
+            .options(*MESSAGE_PROFILES[profile]())
+            .filter(Message.deleted_at.is_(None)))
+
+
+def user_query(profile):
+    """Undeleted users, with the loader options for `profile`."""
+
+    return (User
+            .query
+            .options(*USER_PROFILES[profile]())
+            .filter(User.deleted_at.is_(None)))
@@ -0,0 +1,352 @@
+"""Versioned schema migrations.
+
+models.py describes the latest schema, and `db.create_all()` builds it for
+a new database. It can't change an existing one, so each change an existing
+database needs is a migration here, applied in version order by
+`flask migrate` and recorded in the schema_migrations table.
+`flask migration-status` lists them.
+
+    @migration('0003', "add foo to bar")
+    def add_foo(conn):
+        conn.execute("ALTER TABLE bar ADD COLUMN foo TEXT")
+
+A migration runs in its own transaction unless it is registered with
+transactional=False. That is needed for CREATE INDEX CONCURRENTLY on
+Postgres, which builds an index without blocking writes to the table but
+can't run in a transaction. Such migrations must be safe to rerun, since
+a failure halfway leaves them half done. The transaction is db.session's,
+so a migration may also change data through models and the helpers in
+other modules.
+
+To bring an existing deployment up to date, run `flask migrate` before
+starting the new code. It is safe to run when there is nothing to do.
+Besides the schema, it fills in data that code relies on and that older
+databases lack: the denormalized counters and the home timelines
+(migration 0007). That one reads every follow, like and message, so on
+a large database expect it to take a while.
+"""
+
+import re
+import time
+
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateColumn, CreateIndex, CreateTable
+
+from models import (db, Follows, Like, LikeBucket, Mention, Message,
+                    MessageTag, SchemaMigration, TimelineEntry,
+                    TrendingPeriod, TrendingScore)
+import counters
+import fulltext
+import search
+import timeline
+
+MIGRATIONS = []
+
+
+class Migration:
+    def __init__(self, version, name, upgrade, transactional):
+        self.version = version
+        self.name = name
+        self.upgrade = upgrade
+        self.transactional = transactional
+
+    def __repr__(self):
+        return f"<Migration {self.version}: {self.name}>"
+
+
+def migration(version, name, transactional=True):
+    """Register the decorated function(conn) as migration `version`."""
+
+    def register(fn):
+        MIGRATIONS.append(Migration(version, name, fn, transactional))
+        MIGRATIONS.sort(key=lambda m: m.version)
+        return fn
+
+    return register
+
+
+def applied_versions():
+    SchemaMigration.__table__.create(db.engine, checkfirst=True)
+    return {version for (version,) in
+            db.session.query(SchemaMigration.version).all()}
+
+
+def pending():
+    """Migrations not yet applied to the database, in order."""
+
+    applied = applied_versions()
+    db.session.commit()
+    return [m for m in MIGRATIONS if m.version not in applied]
+
+
+def upgrade(log=print):
+    """Apply every pending migration; returns how many were applied."""
+
+    todo = pending()
+
+    for m in todo:
+        log(f"applying {m.version}: {m.name}")
+        start = time.perf_counter()
+
+        if m.transactional:
+            try:
+                conn = db.session.connection()
+                m.upgrade(conn)
+                conn.execute(SchemaMigration.__table__.insert(),
+                             version=m.version, name=m.name)
+                db.session.commit()
+            except BaseException:
+                db.session.rollback()
+                raise
+        else:
+            with db.engine.connect() as conn:
+                m.upgrade(conn.execution_options(isolation_level='AUTOCOMMIT'))
+                conn.execute(SchemaMigration.__table__.insert(),
+                             version=m.version, name=m.name)
+
+        log(f"applied {m.version} in {time.perf_counter() - start:.1f}s")
+
+    return len(todo)
+
+
+##############################################################################
+# Helpers
+
+
+def drop_invalid_index(conn, name):
+    """Drop index `name` if a failed concurrent build left it invalid."""
+
+    invalid = conn.execute(
+        "SELECT 1 FROM pg_index JOIN pg_class ON pg_class.oid = indexrelid "
+        "WHERE relname = %s AND NOT indisvalid", (name,)).scalar()
+    if invalid:
+        conn.execute(f"DROP INDEX CONCURRENTLY {name}")
+
+
+def create_index(conn, index):
+    """Create `index` if it's missing; concurrently on Postgres."""
+
+    create_index_sql(conn, index.name,
+                     str(CreateIndex(index).compile(dialect=conn.dialect)))
+
+
+def create_index_sql(conn, name, sql):
+    """Run `sql`, a CREATE [UNIQUE] INDEX of index `name`, if it's missing.
+
+    For indexes that aren't in models.py. Concurrently on Postgres.
+    """
+
+    if conn.dialect.name == 'postgresql':
+        drop_invalid_index(conn, name)
+        sql = re.sub(r"^CREATE (UNIQUE )?INDEX ",
+                     r"CREATE \1INDEX CONCURRENTLY IF NOT EXISTS ", sql)
+    else:
+        sql = re.sub(r"^CREATE (UNIQUE )?INDEX ",
+                     r"CREATE \1INDEX IF NOT EXISTS ", sql)
+
+    conn.execute(sql)
+
+
+def _index(model, name):
+    (index,) = [i for i in model.__table__.indexes if i.name == name]
+    return index
+
+
+def _likes_keyed_by_user_message(conn):
+    """Is likes' primary key (user_liked_id, msg_id), as in models.py?
+
+    Databases made before it was have a surrogate id key instead.
+    """
+
+    key = inspect(conn).get_pk_constraint('likes')['constrained_columns']
+    return key == ['user_liked_id', 'msg_id']
+
+
+def _constant_default(column):
+    """Can `column` be added to a table with rows in one ALTER TABLE?
+
+    It can if it's nullable or its server default is a constant; SQLite
+    refuses to add a NOT NULL column whose default is an expression such
+    as CURRENT_TIMESTAMP.
+    """
+
+    default = column.server_default
+    return column.nullable or default is None or isinstance(default.arg, str)
+
+
+def add_column(conn, table, column):
+    """ALTER TABLE `table` to add `column`, filling in existing rows.
+
+    A NOT NULL column with an expression default is added nullable, set
+    from its default in existing rows, then tightened.
+    """
+
+    if _constant_default(column):
+        definition = CreateColumn(column).compile(dialect=conn.dialect)
+        conn.execute(f"ALTER TABLE {table.name} ADD COLUMN {definition}")
+        return
+
+    name = column.name
+    kind = column.type.compile(dialect=conn.dialect)
+    default = column.server_default.arg.compile(dialect=conn.dialect)
+    conn.execute(f"ALTER TABLE {table.name} ADD COLUMN {name} {kind}")
+    conn.execute(f"UPDATE {table.name} SET {name} = {default}")
+    conn.execute(f"ALTER TABLE {table.name} ALTER COLUMN {name} "
+                 f"SET DEFAULT {default}")
+    conn.execute(f"ALTER TABLE {table.name} ALTER COLUMN {name} SET NOT NULL")
+
+
+def rebuild_sqlite_table(conn, table):
+    """Recreate `table` as in models.py on SQLite, keeping its rows.
+
+    SQLite's ALTER TABLE can't change columns, so this is its documented
+    recipe: create the new table under another name, copy the rows across,
+    drop the old table and rename the new one. Columns the old table lacked
+    get their defaults. Indexes and after_create hooks (e.g. the search
+    triggers on messages) are recreated.
+    """
+
+    old_columns = {c['name'] for c in inspect(conn).get_columns(table.name)}
+    kept = ', '.join(c.name for c in table.columns if c.name in old_columns)
+    new_name = f"{table.name}_rebuild"
+
+    ddl = str(CreateTable(table).compile(dialect=conn.dialect))
+    conn.execute(re.sub(rf"CREATE TABLE {re.escape(table.name)} ",
+                        f"CREATE TABLE {new_name} ", ddl, count=1))
+    conn.execute(f"INSERT INTO {new_name} ({kept}) "
+                 f"SELECT {kept} FROM {table.name}")
+    conn.execute(f"DROP TABLE {table.name}")
+    conn.execute(f"ALTER TABLE {new_name} RENAME TO {table.name}")
+
+    for index in table.indexes:
+        create_index(conn, index)
+    table.dispatch.after_create(table, conn, checkfirst=False,
+                                _ddl_runner=None)
+
+
+##############################################################################
+# Migrations
+
+
+@migration('0001', "create missing tables and columns")
+def create_missing(conn):
+    """Tables and columns added to models.py before migrations existed.
+
+    A new database gets the whole schema. An older one gets the tables it
+    lacks and, in existing tables, the columns it lacks (on SQLite, a table
+    missing a column it can't simply add is rebuilt). Primary keys and
+    constraints that changed aren't touched.
+    """
+
+    existing = set(inspect(conn).get_table_names())
+    db.metadata.create_all(conn)
+
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing:
+            continue
+        columns = {c['name'] for c in inspect(conn).get_columns(table.name)}
+        missing = [c for c in table.columns if c.name not in columns]
+
+        if (conn.dialect.name == 'sqlite'
+                and not all(_constant_default(c) for c in missing)):
+            rebuild_sqlite_table(conn, table)
+            continue
+
+        for column in missing:
+            add_column(conn, table, column)
+
+
+@migration('0002', "index hot query paths", transactional=False)
+def index_hot_paths(conn):
+    """Indexes for profile pages, following lists, likes, purges and search.
+
+    likes is looked up by (user, message) for "has this user liked it" and
+    by message for purges and counts. Its primary key covers the first
+    where it is (user_liked_id, msg_id); elsewhere it gets an index.
+    """
+
+    create_index(conn, _index(Message, 'ix_messages_user_timestamp'))
+    create_index(conn, _index(Follows, 'ix_follows_following'))
+    create_index(conn, _index(TimelineEntry, 'ix_timeline_entries_message'))
+    create_index(conn, _index(Like, 'ix_likes_msg_id'))
+    if not _likes_keyed_by_user_message(conn):
+        create_index_sql(conn, 'ix_likes_user_message',
+                         "CREATE INDEX ix_likes_user_message "
+                         "ON likes (user_liked_id, msg_id)")
+
+    if conn.dialect.name == 'postgresql':
+        conn.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        drop_invalid_index(conn, 'ix_users_username_trgm')
+        conn.execute(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {search.TRIGRAM_INDEX}")
+
+
+@migration('0003', "add trending tables")
+def add_trending(conn):
+    """Like buckets and precomputed rankings for trending.py."""
+
+    for model in (LikeBucket, TrendingScore, TrendingPeriod):
+        model.__table__.create(conn, checkfirst=True)
+
+
+@migration('0004', "add hashtag and mention postings")
+def add_postings(conn):
+    """Posting tables for tags.py; run `flask backfill-tags` afterwards."""
+
+    for model in (MessageTag, Mention):
+        model.__table__.create(conn, checkfirst=True)
+
+
+@migration('0005', "add full-text message search", transactional=False)
+def add_message_search(conn):
+    """The full-text index over message text, built from existing rows."""
+
+    if conn.dialect.name not in fulltext.BACKENDS:
+        return
+    backend = fulltext.backend(conn.dialect.name)
+
+    if conn.dialect.name == 'postgresql':
+        drop_invalid_index(conn, fulltext.FTS_INDEX)
+        backend.create(conn, concurrently=True)
+    else:
+        backend.create(conn)
+        backend.rebuild(conn)
+
+
+@migration('0006', "make likes unique per user and message",
+           transactional=False)
+def unique_likes(conn):
+    """A unique index on likes (user_liked_id, msg_id) for older databases.
+
+    Their likes table is keyed by a surrogate id, so nothing stopped a
+    user liking a message twice, and likes.py's insert-or-ignore relies on
+    the key to skip repeats. Duplicates are deleted first, keeping the
+    oldest; like counts include them until 0007 recounts them.
+    """
+
+    if _likes_keyed_by_user_message(conn):
+        return
+
+    conn.execute("DELETE FROM likes WHERE id NOT IN "
+                 "(SELECT min(id) FROM likes GROUP BY user_liked_id, msg_id)")
+    create_index_sql(conn, 'uq_likes_user_message',
+                     "CREATE UNIQUE INDEX uq_likes_user_message "
+                     "ON likes (user_liked_id, msg_id)")
+
+    # the unique index does ix_likes_user_message's job
+    how = "CONCURRENTLY " if conn.dialect.name == 'postgresql' else ""
+    conn.execute(f"DROP INDEX {how}IF EXISTS ix_likes_user_message")
+
+
+@migration('0007', "recount counters and rebuild home timelines")
+def fill_denormalized(conn):
+    """Counters and timelines for data written before they existed.
+
+    The counter columns were added as 0 and timeline_entries empty, so
+    profiles showed no messages or followers and home pages only the
+    read-time authors. Both are recomputed from the follows, likes and
+    messages tables, counters first, since timelines depend on them.
+    """
+
+    counters.reconcile()
+    timeline.rebuild_all()
@@ -2,11 +2,12 @@
 
 from datetime import datetime
 
-from flask_bcrypt import Bcrypt
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
-bcrypt = Bcrypt()
-db = SQLAlchemy()
+import hashing
+from routing import RoutingSQLAlchemy
+
+db = RoutingSQLAlchemy()
 
 
 class Follows(db.Model):
@@ -30,6 +31,12 @@ class Follows(db.Model):
     )
     # ondelete="cascade"; if a user's record is deleted from User table, delete the user's record in Follows table
 
+    # the primary key finds a user's followers; this finds who they follow
+    __table_args__ = (
+        db.Index('ix_follows_following',
+                 'user_following_id', 'user_being_followed_id'),
+    )
+
 class User(db.Model):
     """User in the system."""
 
@@ -76,33 +83,91 @@ class User(db.Model):
         nullable=False,
     )
 
-    # calling user.messages() will return user's message ordered by timestamp in descending order
-    # added a backref to messages table
-    messages = db.relationship('Message', 
-                                order_by='Message.timestamp.desc()')
+    # denormalized counts, kept up to date by counters.py so profile pages
+    # don't have to count related rows on every view
+    messages_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    following_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    followers_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    likes_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
 
-    # user.followers returns a list of user instances of users that follow this user
+    # when anything on the row last changed, counters included (their UPDATEs
+    # pick up the onupdate too); pages use it as a cache validator
+    updated_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow,
+        server_default=db.func.now(),
+    )
+
+    # set when the account is deleted; it is hidden at once and its rows are
+    # purged in the background (see purge.py)
+    deleted_at = db.Column(
+        db.DateTime,
+    )
+
+    # when the accounts this user follows last changed (set by counters.py);
+    # an incremental suggestions refresh recomputes only these users
+    following_changed_at = db.Column(
+        db.DateTime,
+    )
+
+    # user.messages is a query of the user's messages, newest first
+    # lazy="dynamic" so pages can filter/limit it instead of loading every row
+    # the database cascades the delete (ondelete="CASCADE" on Message.user_id)
+    messages = db.relationship('Message',
+                                order_by='Message.timestamp.desc()',
+                                lazy='dynamic',
+                                cascade='all, delete-orphan',
+                                passive_deletes=True)
+
+    # user.followers is a query of users that follow this user
     # primaryjoin & secondaryjoin to connect two-component primary key to access the user table twice
     followers = db.relationship(
         "User",
         secondary="follows",
         primaryjoin=(Follows.user_being_followed_id == id),
-        secondaryjoin=(Follows.user_following_id == id)
+        secondaryjoin=(Follows.user_following_id == id),
+        lazy='dynamic',
     )
 
-    # user.following returns a list of user instances that this user is following
+    # user.following is a query of users that this user is following
     following = db.relationship(
         "User",
         secondary="follows",
         primaryjoin=(Follows.user_following_id == id),
-        secondaryjoin=(Follows.user_being_followed_id == id)
+        secondaryjoin=(Follows.user_being_followed_id == id),
+        lazy='dynamic',
     )
 
-    #TODO: Complete this relationship   
     liked_messages = db.relationship(
-        "Message", 
-        secondary="likes", 
-        backref="users"
+        "Message",
+        secondary="likes",
+        backref="users",
+        lazy='dynamic',
        ) #instance user -- its id
 
 
@@ -113,32 +178,29 @@ class User(db.Model):
     def is_followed_by(self, other_user):
         """Is this user followed by `other_user`?"""
 
-        found_user_list = [user for user in self.followers if user == other_user]
-        return len(found_user_list) == 1 
-    
+        return self.followers.filter(User.id == other_user.id).count() == 1
+
     # user.is_following returns T/F
     def is_following(self, other_user):
-        """Is this user following `other_user`?""" 
+        """Is this user following `other_user`?"""
+
+        return self.following.filter(User.id == other_user.id).count() == 1
 
-        found_user_list = [user for user in self.following if user == other_user]
-        return len(found_user_list) == 1
-    
     # check if a user has liked a message with user.is_message_liked(...)
     def is_message_liked(self, message):
         """Is this message `liked` by user?"""
 
-        found_message_list = [m for m in self.liked_messages if m == message]
-        return len(found_message_list) == 1
-    # TODO: current list comprehension goes over all messages. Python `any()` (equivalent to JS' some())
-    
+        return self.liked_messages.filter(Message.id == message.id).count() >= 1
+
     @classmethod
     def signup(cls, username, email, password, image_url):
         """Sign up user.
 
-        Hashes password and adds user to system.
+        Hashes password and adds user to system. Raises
+        hashing.HashingBusy if the hashing pool is full.
         """
 
-        hashed_pwd = bcrypt.generate_password_hash(password).decode('UTF-8')
+        hashed_pwd = hashing.hash_password(password)
 
         user = User(
             username=username,
@@ -159,13 +221,19 @@ class User(db.Model):
         and, if it finds such a user, returns that user object.
 
         If can't find matching user (or if password is wrong), returns False.
+
+        If the stored hash was made at a different bcrypt cost than the one
+        configured, it is replaced with a fresh hash; the caller commits.
+        Raises hashing.HashingBusy if the hashing pool is full.
         """
 
-        user = cls.query.filter_by(username=username).first()
+        user = cls.query.filter_by(username=username, deleted_at=None).first()
 
         if user:
-            is_auth = bcrypt.check_password_hash(user.password, password)
+            is_auth = hashing.check_password(user.password, password)
             if is_auth:
+                if hashing.needs_rehash(user.password):
+                    user.password = hashing.hash_password(password)
                 return user
 
         return False
@@ -192,7 +260,7 @@ class Message(db.Model):
         db.DateTime, 
         # TODO: what is the timezone for this? If our default is stored in UTC, should we programatically convert all date times to UTC?
         nullable=False,
-        default=datetime.utcnow(),
+        default=datetime.utcnow,
     )
 
     user_id = db.Column(
@@ -201,8 +269,27 @@ class Message(db.Model):
         nullable=False,
     )
 
+    # how many users like this message; kept up to date by counters.py
+    like_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    # set when the message is deleted; it is hidden at once and removed from
+    # timelines in the background (see purge.py)
+    deleted_at = db.Column(
+        db.DateTime,
+    )
+
     user = db.relationship('User')
 
+    # a user's messages, newest first (profile pages)
+    __table_args__ = (
+        db.Index('ix_messages_user_timestamp', 'user_id', 'timestamp', 'id'),
+    )
+
     def __repr__(self):
         """ Information about message instance."""
 
@@ -210,26 +297,23 @@ class Message(db.Model):
 
 class Like(db.Model):
     """ Connection of a message <-> user who liked the message. """
-    # TODO: we haven't prevented the same user from liking the same message. 
-    #  Could have a two-component primary key OR unique constraint on user & msg
+
     __tablename__ = "likes"
 
-    id = db.Column(
+    # two-component primary key, so a user can like a message only once;
+    # user first, for "what has this user liked"
+    user_liked_id = db.Column(
         db.Integer,
-        primary_key=True,
-        autoincrement=True)
+        db.ForeignKey('users.id',
+        ondelete="cascade"),
+        primary_key=True)
 
     msg_id = db.Column(
         db.Integer,
         db.ForeignKey('messages.id',
         ondelete="cascade"),
-        nullable=False)
-
-    user_liked_id =  db.Column(
-        db.Integer,
-        db.ForeignKey('users.id',
-        ondelete="cascade"),
-        nullable=False)
+        primary_key=True,
+        index=True)
 
     def __repr__(self):
         """ Information about message Liked by user."""
@@ -237,7 +321,410 @@ class Like(db.Model):
         return f"Like Message_id {self.msg_id} User_id {self.user_liked_id}"
 
 
-    
+
+class TimelineEntry(db.Model):
+    """A message materialized into a follower's home timeline.
+
+    Rows are written when a message is posted (fan-out-on-write) and when a
+    user follows someone (backfill), so reading a home page is a single range
+    scan over (user_id, timestamp).
+    """
+
+    __tablename__ = "timeline_entries"
+
+    # owner of the timeline
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete="cascade"),
+        primary_key=True,
+    )
+
+    message_id = db.Column(
+        db.Integer,
+        db.ForeignKey('messages.id', ondelete="cascade"),
+        primary_key=True,
+    )
+
+    # denormalized so unfollow can drop an author's entries without a join
+    author_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete="cascade"),
+        nullable=False,
+    )
+
+    # copied from the message so the timeline sorts without touching messages
+    timestamp = db.Column(
+        db.DateTime,
+        nullable=False,
+    )
+
+    __table_args__ = (
+        db.Index('ix_timeline_entries_user_timestamp',
+                 'user_id', 'timestamp', 'message_id'),
+        db.Index('ix_timeline_entries_user_author', 'user_id', 'author_id'),
+        # every timeline a message was written to, to purge it
+        db.Index('ix_timeline_entries_message', 'message_id'),
+    )
+
+    def __repr__(self):
+        return f"TimelineEntry User_id {self.user_id} Message_id {self.message_id}"
+
+
+class Suggestion(db.Model):
+    """An account suggested for a user to follow, from suggestions.py."""
+
+    __tablename__ = "suggestions"
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete="cascade"),
+        primary_key=True,
+    )
+
+    # 0 is the best suggestion
+    rank = db.Column(
+        db.Integer,
+        primary_key=True,
+    )
+
+    suggested_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete="cascade"),
+        nullable=False,
+    )
+
+    score = db.Column(
+        db.Float,
+        nullable=False,
+    )
+
+    # when the batch job that wrote this row started
+    computed_at = db.Column(
+        db.DateTime,
+        nullable=False,
+    )
+
+    def __repr__(self):
+        return f"Suggestion User_id {self.user_id} #{self.rank} User_id {self.suggested_id}"
+
+
+class MessageTag(db.Model):
+    """A hashtag in a message, written by tags.py."""
+
+    __tablename__ = "message_tags"
+
+    # lowercased, without the "#"
+    tag = db.Column(
+        db.Text,
+        primary_key=True,
+    )
+
+    message_id = db.Column(
+        db.Integer,
+        db.ForeignKey('messages.id', ondelete="cascade"),
+        primary_key=True,
+    )
+
+    # copied from the message so a tag's feed sorts without touching messages
+    timestamp = db.Column(
+        db.DateTime,
+        nullable=False,
+    )
+
+    __table_args__ = (
+        db.Index('ix_message_tags_tag_timestamp',
+                 'tag', 'timestamp', 'message_id'),
+        # to purge a message
+        db.Index('ix_message_tags_message', 'message_id'),
+    )
+
+    def __repr__(self):
+        return f"MessageTag #{self.tag} Message_id {self.message_id}"
+
+
+class Mention(db.Model):
+    """A user @mentioned in a message, written by tags.py."""
+
+    __tablename__ = "mentions"
+
+    # the user mentioned
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete="cascade"),
+        primary_key=True,
+    )
+
+    message_id = db.Column(
+        db.Integer,
+        db.ForeignKey('messages.id', ondelete="cascade"),
+        primary_key=True,
+    )
+
+    # copied from the message, as for MessageTag
+    timestamp = db.Column(
+        db.DateTime,
+        nullable=False,
+    )
+
+    __table_args__ = (
+        db.Index('ix_mentions_user_timestamp',
+                 'user_id', 'timestamp', 'message_id'),
+        db.Index('ix_mentions_message', 'message_id'),
+    )
+
+    def __repr__(self):
+        return f"Mention User_id {self.user_id} Message_id {self.message_id}"
+
+
+class LikeBucket(db.Model):
+    """Net likes a message got in one time bucket, for trending.py."""
+
+    __tablename__ = "like_buckets"
+
+    message_id = db.Column(
+        db.Integer,
+        db.ForeignKey('messages.id', ondelete="cascade"),
+        primary_key=True,
+    )
+
+    bucket_start = db.Column(
+        db.DateTime,
+        primary_key=True,
+    )
+
+    # likes minus unlikes; can be negative
+    likes = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+    )
+
+    __table_args__ = (
+        # buckets completed or expired since the last trending refresh
+        db.Index('ix_like_buckets_start', 'bucket_start'),
+    )
+
+    def __repr__(self):
+        return f"LikeBucket Message_id {self.message_id} {self.bucket_start} likes {self.likes}"
+
+
+class TrendingScore(db.Model):
+    """A message's decayed like score over one trending period."""
+
+    __tablename__ = "trending_scores"
+
+    # "hour", "day" or "week"
+    period = db.Column(
+        db.String(10),
+        primary_key=True,
+    )
+
+    message_id = db.Column(
+        db.Integer,
+        db.ForeignKey('messages.id', ondelete="cascade"),
+        primary_key=True,
+    )
+
+    # net likes in the period
+    likes = db.Column(
+        db.Integer,
+        nullable=False,
+    )
+
+    score = db.Column(
+        db.Float,
+        nullable=False,
+    )
+
+    __table_args__ = (
+        # the ranking, best first
+        db.Index('ix_trending_scores_period_score',
+                 'period', 'score', 'message_id'),
+        # to purge a message
+        db.Index('ix_trending_scores_message', 'message_id'),
+    )
+
+    def __repr__(self):
+        return f"TrendingScore {self.period} Message_id {self.message_id} score {self.score}"
+
+
+class TrendingPeriod(db.Model):
+    """How far trending.py's scores for a period have been brought."""
+
+    __tablename__ = "trending_periods"
+
+    period = db.Column(
+        db.String(10),
+        primary_key=True,
+    )
+
+    # scores count the buckets before this time, decayed to it
+    refreshed_through = db.Column(
+        db.DateTime,
+        nullable=False,
+    )
+
+    def __repr__(self):
+        return f"TrendingPeriod {self.period} through {self.refreshed_through}"
+
+
+class Job(db.Model):
+    """A piece of background work, run by jobs.py's workers."""
+
+    __tablename__ = "jobs"
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True,
+        autoincrement=True,
+    )
+
+    # name of the handler that runs it, e.g. "purge_user"
+    kind = db.Column(
+        db.Text,
+        nullable=False,
+    )
+
+    # JSON object of keyword arguments for the handler
+    payload = db.Column(
+        db.Text,
+        nullable=False,
+    )
+
+    # queued, running, done or failed
+    status = db.Column(
+        db.Text,
+        nullable=False,
+        default='queued',
+    )
+
+    # failed runs so far
+    attempts = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+    )
+
+    # not to be run before this
+    run_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+    )
+
+    # when a worker claimed it, while running
+    locked_at = db.Column(
+        db.DateTime,
+    )
+
+    # rows handled and seconds spent over all runs, for throughput metrics
+    processed = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+    )
+
+    seconds = db.Column(
+        db.Float,
+        nullable=False,
+        default=0.0,
+    )
+
+    last_error = db.Column(
+        db.Text,
+    )
+
+    created_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+    )
+
+    finished_at = db.Column(
+        db.DateTime,
+    )
+
+    __table_args__ = (
+        db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+    )
+
+    def __repr__(self):
+        return f"Job #{self.id} {self.kind} {self.status}"
+
+
+class SchemaMigration(db.Model):
+    """A migration from migrations.py that has been applied."""
+
+    __tablename__ = "schema_migrations"
+
+    version = db.Column(
+        db.Text,
+        primary_key=True,
+    )
+
+    name = db.Column(
+        db.Text,
+        nullable=False,
+    )
+
+    applied_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+    )
+
+    def __repr__(self):
+        return f"SchemaMigration {self.version} {self.name}"
+
+
+class LoadCheckpoint(db.Model):
+    """How far the bulk loader (loader.py) got through one input file."""
+
+    __tablename__ = "load_checkpoints"
+
+    # "<table>:<path>"
+    source = db.Column(
+        db.Text,
+        primary_key=True,
+    )
+
+    rows_loaded = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+    )
+
+    updated_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow,
+    )
+
+    def __repr__(self):
+        return f"LoadCheckpoint {self.source} rows {self.rows_loaded}"
+
+
+def insert_ignoring_duplicates(table, columns, rows):
+    """INSERT the result of the select `rows`, skipping existing keys.
+
+    One statement: ON CONFLICT DO NOTHING on Postgres, OR IGNORE on
+    SQLite. Returns how many rows were inserted.
+    """
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        stmt = (pg_insert(table)
+                .from_select(columns, rows)
+                .on_conflict_do_nothing())
+    else:
+        stmt = table.insert().from_select(columns, rows)
+        if dialect == 'sqlite':
+            stmt = stmt.prefix_with('OR IGNORE')
+
+    return db.session.execute(stmt).rowcount
+
+
 def connect_db(app):
     """Connect this database to provided Flask app.
 
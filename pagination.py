@@ -0,0 +1,196 @@
+"""Keyset (cursor) pagination for Warbler list pages.
+
+Lists are always ordered newest first by a tuple of columns, usually
+(timestamp, id) for messages or (id,) for users. Instead of an OFFSET, a
+page remembers the key of its first and last rows; the next page asks for
+rows strictly before (older) or after (newer) that key. Every page is one
+index range scan, however deep the user has scrolled.
+
+Links look like `?before=<cursor>` and `?after=<cursor>`.
+"""
+
+from datetime import datetime
+from urllib.parse import urlencode
+
+from flask import request
+from sqlalchemy import and_, or_
+
+PER_PAGE = 20
+
+CURSOR_SEPARATOR = "_"
+CURSOR_DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+
+class Page:
+    """One page of a keyset-paginated list.
+
+    `items` is ordered newest first. `older_cursor` / `newer_cursor` are the
+    cursors to pass as `before` / `after` to get the neighbouring pages, or
+    None when there is nothing in that direction.
+    """
+
+    def __init__(self, items, older_cursor=None, newer_cursor=None):
+        self.items = items
+        self.older_cursor = older_cursor
+        self.newer_cursor = newer_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def has_older(self):
+        return self.older_cursor is not None
+
+    @property
+    def has_newer(self):
+        return self.newer_cursor is not None
+
+    @property
+    def older_url(self):
+        return _page_url(before=self.older_cursor)
+
+    @property
+    def newer_url(self):
+        return _page_url(after=self.newer_cursor)
+
+
+def _page_url(**cursor):
+    """URL for the current path with its cursor args replaced by `cursor`."""
+
+    args = request.args.to_dict()
+    args.pop('before', None)
+    args.pop('after', None)
+    args.update(cursor)
+
+    return f"{request.path}?{urlencode(args)}"
+
+
+def encode_cursor(values):
+    """Turn a tuple of key values into a URL-safe cursor string."""
+
+    parts = []
+    for value in values:
+        if isinstance(value, datetime):
+            parts.append(value.strftime(CURSOR_DATETIME_FORMAT))
+        else:
+            parts.append(str(value))
+
+    return CURSOR_SEPARATOR.join(parts)
+
+
+def decode_cursor(cursor, keys):
+    """Turn a cursor string back into a tuple of values for `keys`.
+
+    Returns None if the cursor is missing or malformed, so a bad link just
+    shows the first page.
+    """
+
+    if not cursor:
+        return None
+
+    parts = cursor.split(CURSOR_SEPARATOR)
+    if len(parts) != len(keys):
+        return None
+
+    values = []
+    try:
+        for key, part in zip(keys, parts):
+            if key.type.python_type is datetime:
+                values.append(datetime.strptime(part, CURSOR_DATETIME_FORMAT))
+            else:
+                values.append(key.type.python_type(part))
+    except (ValueError, NotImplementedError):
+        return None
+
+    return tuple(values)
+
+
+def keyset_filter(keys, values, older):
+    """SQL criterion for rows strictly older (or newer) than `values`.
+
+    Expanded into `a < x OR (a = x AND b < y)` rather than a row-value
+    comparison so it works the same on Postgres and SQLite.
+    """
+
+    key, *rest_keys = keys
+    value, *rest_values = values
+    beyond = key < value if older else key > value
+
+    if not rest_keys:
+        return beyond
+
+    return or_(beyond,
+               and_(key == value, keyset_filter(rest_keys, rest_values, older)))
+
+
+def keyset_query(query, keys, before=None, after=None, per_page=PER_PAGE):
+    """Filter, order and limit `query` for one page.
+
+    Fetches one extra row so the caller can tell whether more rows exist.
+    Rows for an `after` page come back oldest first.
+    """
+
+    if after is not None:
+        query = query.filter(keyset_filter(keys, after, older=False))
+        order = [key.asc() for key in keys]
+    else:
+        if before is not None:
+            query = query.filter(keyset_filter(keys, before, older=True))
+        order = [key.desc() for key in keys]
+
+    return query.order_by(None).order_by(*order).limit(per_page + 1)
+
+
+def make_page(rows, key, before=None, after=None, per_page=PER_PAGE):
+    """Build a `Page` from rows fetched by `keyset_query`.
+
+    `key(row)` returns the tuple of sort values for a row.
+    """
+
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    if after is not None:
+        rows.reverse()
+        has_newer, has_older = has_more, True
+    else:
+        has_older, has_newer = has_more, before is not None
+
+    if not rows:
+        return Page([])
+
+    return Page(
+        rows,
+        older_cursor=encode_cursor(key(rows[-1])) if has_older else None,
+        newer_cursor=encode_cursor(key(rows[0])) if has_newer else None,
+    )
+
+
+def cursor_args(keys):
+    """Decoded `before` and `after` cursors from the request's querystring."""
+
+    before = decode_cursor(request.args.get('before'), keys)
+    after = decode_cursor(request.args.get('after'), keys)
+
+    return before, after
+
+
+def paginate(query, keys, key=None, per_page=PER_PAGE):
+    """Return the page of `query` selected by the request's cursor args.
+
+    `keys` are the columns to order by, newest first. `key(row)` returns a
+    row's values for those columns; by default it reads the attributes with
+    the same names as the columns.
+    """
+
+    if key is None:
+        names = [column.key for column in keys]
+        key = lambda row: tuple(getattr(row, name) for name in names)
+
+    before, after = cursor_args(keys)
+    rows = keyset_query(query, keys, before, after, per_page).all()
+
+    return make_page(rows, key, before, after, per_page)
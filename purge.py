@@ -0,0 +1,106 @@
+"""Background purges of deleted accounts and messages.
+
+Deleting a prolific account in the request would cascade through thousands
+of messages, likes, follows and timeline rows while holding their locks.
+Instead the request only sets `deleted_at`, which hides the account or
+message at once (see loading.py), and enqueues a job here. The job deletes
+the dependent rows BATCH_SIZE at a time and uncounts them in the same
+transaction, so counters stay right whether or not a batch is retried.
+
+Deleting an account also sets `deleted_at` on all of its messages in the
+same transaction, so they vanish from every page at once too; the job
+then deletes them along with everything else of the account's.
+"""
+
+from sqlalchemy import and_, or_, select, tuple_
+
+from models import (db, Follows, Like, LikeBucket, Mention, Message,
+                    MessageTag, Suggestion, TimelineEntry, TrendingScore,
+                    User)
+import counters
+import jobs
+
+BATCH_SIZE = 500
+
+
+def _delete_some(model, *conditions):
+    """Delete up to BATCH_SIZE `model` rows matching `conditions`.
+
+    Returns the primary keys of the deleted rows.
+    """
+
+    key = list(model.__table__.primary_key.columns)
+    rows = db.session.execute(
+        select(key).where(and_(*conditions)).limit(BATCH_SIZE)).fetchall()
+    if not rows:
+        return []
+
+    if len(key) == 1:
+        matching = key[0].in_([row[0] for row in rows])
+    else:
+        matching = tuple_(*key).in_([tuple(row) for row in rows])
+    db.session.execute(model.__table__.delete().where(matching))
+
+    return rows
+
+
+@jobs.handler('purge_message')
+def purge_message(message_id):
+    """Delete a batch of a deleted message's rows; the message row last."""
+
+    removed = _delete_some(TimelineEntry,
+                           TimelineEntry.message_id == message_id)
+    if removed:
+        return len(removed)
+
+    removed = _delete_some(Like, Like.msg_id == message_id)
+    if removed:
+        counters.likes_deleted(removed)
+        return len(removed)
+
+    for model in (LikeBucket, TrendingScore, MessageTag, Mention):
+        removed = _delete_some(model, model.message_id == message_id)
+        if removed:
+            return len(removed)
+
+    return len(_delete_some(Message, Message.id == message_id,
+                            Message.deleted_at.isnot(None)))
+
+
+@jobs.handler('purge_user')
+def purge_user(user_id):
+    """Delete a batch of a deleted account's rows; the user row last."""
+
+    own_messages = select([Message.id]).where(Message.user_id == user_id)
+
+    steps = [
+        # their messages, from other users' home timelines
+        (TimelineEntry, [TimelineEntry.message_id.in_(own_messages)], None),
+        # other users' likes of their messages
+        (Like, [Like.msg_id.in_(own_messages)], counters.likes_deleted),
+        (LikeBucket, [LikeBucket.message_id.in_(own_messages)], None),
+        (TrendingScore, [TrendingScore.message_id.in_(own_messages)], None),
+        (MessageTag, [MessageTag.message_id.in_(own_messages)], None),
+        (Mention, [Mention.message_id.in_(own_messages)], None),
+        (Message, [Message.user_id == user_id], None),
+        # their likes of other users' messages
+        (Like, [Like.user_liked_id == user_id], counters.likes_deleted),
+        (Follows, [or_(Follows.user_following_id == user_id,
+                       Follows.user_being_followed_id == user_id)],
+         counters.follows_deleted),
+        (TimelineEntry, [TimelineEntry.user_id == user_id], None),
+        # other users' mentions of them
+        (Mention, [Mention.user_id == user_id], None),
+        (Suggestion, [or_(Suggestion.user_id == user_id,
+                          Suggestion.suggested_id == user_id)], None),
+        (User, [User.id == user_id, User.deleted_at.isnot(None)], None),
+    ]
+
+    for model, conditions, uncount in steps:
+        removed = _delete_some(model, *conditions)
+        if removed:
+            if uncount:
+                uncount(removed)
+            return len(removed)
+
+    return 0
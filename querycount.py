@@ -0,0 +1,29 @@
+"""Count the SQL statements a block of code runs.
+
+Used by the tests to hold each route to a query budget:
+
+    with count_queries(db.engine) as statements:
+        client.get("/")
+    assert len(statements) <= 5
+"""
+
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+
+@contextmanager
+def count_queries(engine):
+    """Collect the SQL of every statement `engine` runs inside the block."""
+
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context,
+                              executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
@@ -0,0 +1,117 @@
+"""Send reads to read replicas.
+
+`RoutingSQLAlchemy` is Flask-SQLAlchemy with a session that picks an engine
+per statement:
+
+- During a GET / HEAD request, SELECTs go to a read replica from
+  SQLALCHEMY_REPLICA_URIS, one chosen per request (round-robin, or the
+  replica with the fewest connections checked out when
+  SQLALCHEMY_REPLICA_STRATEGY is "least_loaded").
+- Everything else goes to the primary: writes, other requests' queries,
+  CLI commands and anything outside a request.
+- Once a request writes, the rest of it reads from the primary, and so does
+  the same browser for READ_YOUR_WRITES_SECONDS after it (kept in the
+  Flask session), so users see their own changes despite replica lag.
+
+With no replicas configured every statement goes to the primary.
+"""
+
+import itertools
+import threading
+import time
+
+from flask import g, has_request_context, request, session
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import create_engine, orm
+from sqlalchemy.sql.expression import CompoundSelect, Select
+
+# seconds after a write during which a browser only reads from the primary
+READ_YOUR_WRITES_SECONDS = 5
+
+READ_METHODS = ('GET', 'HEAD')
+
+
+class RoutingSession(SignallingSession):
+    """Session sending SELECTs in read requests to a replica."""
+
+    def __init__(self, db, **options):
+        self.db = db
+        super().__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        is_read = isinstance(clause, (Select, CompoundSelect))
+
+        if not is_read and (self._flushing or clause is not None):
+            # a write; everything after it should see it
+            self.info['wrote'] = True
+
+        if is_read and not self.info.get('wrote'):
+            replica = self.db.replica_for_request(self.app)
+            if replica is not None:
+                return replica
+
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """Flask-SQLAlchemy with read replicas (see the module docstring)."""
+
+    def __init__(self, *args, **kwargs):
+        self._replica_engines = {}
+        self._replica_lock = threading.Lock()
+        self._round_robin = itertools.count()
+        super().__init__(*args, **kwargs)
+
+    def init_app(self, app):
+        app.config.setdefault('SQLALCHEMY_REPLICA_URIS', [])
+        app.config.setdefault('SQLALCHEMY_REPLICA_STRATEGY', 'round_robin')
+        super().init_app(app)
+
+        @app.after_request
+        def remember_writes(response):
+            if self.session.info.get('wrote'):
+                session['primary_until'] = (time.time()
+                                            + READ_YOUR_WRITES_SECONDS)
+            return response
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def replica_engines(self, app=None):
+        """Engines for every configured replica, created on first use."""
+
+        app = self.get_app(app)
+        uris = app.config['SQLALCHEMY_REPLICA_URIS']
+
+        with self._replica_lock:
+            for uri in uris:
+                if uri not in self._replica_engines:
+                    self._replica_engines[uri] = create_engine(uri)
+            return [self._replica_engines[uri] for uri in uris]
+
+    def replica_for_request(self, app):
+        """The replica this request reads from, or None for the primary."""
+
+        if not has_request_context() or request.method not in READ_METHODS:
+            return None
+        if session.get('primary_until', 0) > time.time():
+            return None
+
+        if 'replica_engine' not in g:
+            g.replica_engine = self._choose_replica(app)
+        return g.replica_engine
+
+    def _choose_replica(self, app):
+        engines = self.replica_engines(app)
+        if not engines:
+            return None
+
+        if app.config['SQLALCHEMY_REPLICA_STRATEGY'] == 'least_loaded':
+            return min(engines, key=_checked_out)
+        return engines[next(self._round_robin) % len(engines)]
+
+
+def _checked_out(engine):
+    # pools that don't keep connections (NullPool) have no count
+    checkedout = getattr(engine.pool, 'checkedout', None)
+    return checkedout() if checkedout else 0
@@ -0,0 +1,233 @@
+"""Username search for the users list and typeahead.
+
+Substring search (`LIKE '%term%'`) can't use an ordinary index, so:
+
+- on Postgres, a pg_trgm GIN index on users.username answers `ILIKE`
+  substring and prefix queries (created along with the users table);
+- elsewhere (SQLite in development), an in-process trigram index maps each
+  three-letter chunk of every username to the users containing it, and a
+  search only checks the users whose names contain all of the term's
+  trigrams.
+
+Results are ranked exact match, then prefix match, then substring match,
+then by follower count, and paged with the usual keyset cursors.
+"""
+
+import threading
+import time
+from collections import defaultdict
+
+from sqlalchemy import DDL, case, event, func
+
+from loading import user_query
+from models import db, User
+from pagination import paginate
+
+NGRAM = 3
+
+# name and definition of the pg_trgm index (see also migrations.py)
+TRIGRAM_INDEX = ("ix_users_username_trgm "
+                 "ON users USING gin (lower(username) gin_trgm_ops)")
+
+TYPEAHEAD_LIMIT = 10
+
+# past this many candidates, filtering by id list costs more than a scan
+MAX_CANDIDATES = 1000
+
+# seconds before the in-process index is rebuilt, picking up renames and
+# deletes made by other workers
+MAX_AGE = 60
+
+event.listen(
+    User.__table__,
+    'after_create',
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm; "
+        f"CREATE INDEX IF NOT EXISTS {TRIGRAM_INDEX}"
+        ).execute_if(dialect='postgresql'),
+)
+
+
+def _escape_like(term):
+    return (term
+            .replace('\\', '\\\\')
+            .replace('%', '\\%')
+            .replace('_', '\\_'))
+
+
+def ngrams(text):
+    """The set of NGRAM-letter chunks of `text` (lowercased)."""
+
+    text = text.lower()
+    return {text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+
+class NgramIndex:
+    """In-process trigram index over usernames.
+
+    Built from the users table on first use. Other workers' signups are
+    picked up by reading users with ids above the highest one seen; their
+    renames and deletes when the index is rebuilt, once it is `max_age`
+    seconds old. Every candidate is re-checked against the database, so
+    until then a stale entry can only cost a missing result, not a wrong
+    one.
+    """
+
+    def __init__(self, max_age=MAX_AGE):
+        self.max_age = max_age
+        self._postings = defaultdict(set)
+        self._usernames = {}
+        self._max_id = 0
+        self._built_at = None
+        self._lock = threading.Lock()
+
+    def _add(self, user_id, username):
+        self._remove(user_id)
+        username = username.lower()
+        self._usernames[user_id] = username
+        for gram in ngrams(username):
+            self._postings[gram].add(user_id)
+        self._max_id = max(self._max_id, user_id)
+
+    def _remove(self, user_id):
+        username = self._usernames.pop(user_id, None)
+        if username is None:
+            return
+        for gram in ngrams(username):
+            self._postings[gram].discard(user_id)
+
+    def _catch_up(self):
+        now = time.monotonic()
+        if self._built_at is None or now - self._built_at >= self.max_age:
+            self._postings.clear()
+            self._usernames.clear()
+            self._max_id = 0
+            self._built_at = now
+
+        rows = (db.session
+                .query(User.id, User.username)
+                .filter(User.id > self._max_id,
+                        User.deleted_at.is_(None))
+                .all())
+        for user_id, username in rows:
+            self._add(user_id, username)
+
+    def add(self, user_id, username):
+        with self._lock:
+            if self._built_at is not None:
+                self._add(user_id, username)
+
+    def remove(self, user_id):
+        with self._lock:
+            self._remove(user_id)
+
+    def clear(self):
+        with self._lock:
+            self.__init__(self.max_age)
+
+    def candidates(self, term):
+        """Ids of users whose username contains `term`."""
+
+        term = term.lower()
+
+        with self._lock:
+            self._catch_up()
+
+            grams = ngrams(term)
+            if grams:
+                postings = sorted((self._postings.get(gram, set())
+                                   for gram in grams), key=len)
+                ids = set.intersection(*postings)
+            else:
+                # too short for a trigram; the names themselves are in memory
+                ids = self._usernames.keys()
+
+            return [user_id for user_id in ids
+                    if term in self._usernames[user_id]]
+
+
+ngram_index = NgramIndex()
+
+
+def uses_trigram_index():
+    """Is the database Postgres (so pg_trgm does the work)?"""
+
+    return db.engine.dialect.name == 'postgresql'
+
+
+def rank(term):
+    """SQL expression ranking exact > prefix > substring username matches."""
+
+    username = func.lower(User.username)
+    term = term.lower()
+
+    return case(
+        [
+            (username == term, 2),
+            (username.like(f"{_escape_like(term)}%", escape='\\'), 1),
+        ],
+        else_=0,
+    )
+
+
+def rank_of(term, username):
+    """Python twin of `rank()`, for building cursors from result rows."""
+
+    term, username = term.lower(), username.lower()
+    if username == term:
+        return 2
+    if username.startswith(term):
+        return 1
+    return 0
+
+
+def matching_users(term, query=None):
+    """`query` (default: user cards) narrowed to usernames containing `term`."""
+
+    if query is None:
+        query = user_query('card')
+
+    substring = func.lower(User.username).like(
+        f"%{_escape_like(term.lower())}%", escape='\\')
+
+    if not uses_trigram_index():
+        ids = ngram_index.candidates(term)
+        if len(ids) <= MAX_CANDIDATES:
+            query = query.filter(User.id.in_(ids))
+
+    return query.filter(substring)
+
+
+def search_page(term):
+    """One page of users matching `term`, best matches first."""
+
+    return paginate(
+        matching_users(term),
+        [rank(term), User.followers_count, User.id],
+        key=lambda user: (rank_of(term, user.username),
+                          user.followers_count,
+                          user.id),
+    )
+
+
+def typeahead(term, limit=TYPEAHEAD_LIMIT):
+    """Up to `limit` users whose username starts with `term`.
+
+    Most-followed first.
+    """
+
+    prefix = func.lower(User.username).like(
+        f"{_escape_like(term.lower())}%", escape='\\')
+    query = (db.session
+             .query(User.id, User.username, User.image_url)
+             .filter(User.deleted_at.is_(None)))
+
+    if not uses_trigram_index():
+        ids = ngram_index.candidates(term)
+        if len(ids) <= MAX_CANDIDATES:
+            query = query.filter(User.id.in_(ids))
+
+    return (query
+            .filter(prefix)
+            .order_by(User.followers_count.desc(), User.id)
+            .limit(limit)
+            .all())
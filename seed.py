@@ -1,19 +1,17 @@
-"""Seed database with sample data from CSV Files."""
+"""Seed database with sample data from CSV Files.
+
+Wipes the database; see loader.py for loading into an existing one.
+"""
 
-from csv import DictReader
 from app import db
-from models import User, Message, Follows
+import loader
+import migrations
 
 db.drop_all()
-db.create_all()
-
-with open('generator/users.csv') as users:
-    db.session.bulk_insert_mappings(User, DictReader(users))
-
-with open('generator/messages.csv') as messages:
-    db.session.bulk_insert_mappings(Message, DictReader(messages))
-
-with open('generator/follows.csv') as follows:
-    db.session.bulk_insert_mappings(Follows, DictReader(follows))
+migrations.upgrade()
 
-db.session.commit()
+loader.main([
+    'users=generator/users.csv',
+    'messages=generator/messages.csv',
+    'follows=generator/follows.csv',
+])
@@ -0,0 +1,164 @@
+"""Per-request SQL statistics.
+
+For a sample of requests (SQL_STATS_SAMPLE_RATE), engine events record how
+many statements the request ran, how long they took and which were slowest.
+Statements that run again and again with the same shape, differing only in
+their parameters, are flagged as a likely N+1: a query per row where one
+query for all rows would do.
+
+Sampled requests that are slow (SQL_STATS_SLOW_MS) or look like an N+1 are
+logged as one JSON line; others are logged at INFO. With SQL_STATS_HEADERS
+on, the numbers are also sent as response headers, including a
+Server-Timing header browsers' dev tools can show.
+
+Only statement text and timings are kept, never parameter values, so the
+log is safe to ship from production.
+"""
+
+import json
+import random
+import re
+import time
+from collections import Counter
+
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# statements of one shape a request may run before it looks like an N+1
+REPEAT_THRESHOLD = 5
+
+# how many of the slowest statements to report
+SLOWEST_COUNT = 3
+
+# truncate statements in the log to this many characters
+MAX_STATEMENT_LENGTH = 300
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PARAM_LISTS = re.compile(r"\((?:\s*(?:\?|%\(\w+\)s|%s)\s*,?)+\)")
+_SPACES = re.compile(r"\s+")
+
+
+def shape(statement):
+    """`statement` with literals and IN-lists replaced by placeholders."""
+
+    statement = _LITERALS.sub('?', statement)
+    statement = _PARAM_LISTS.sub('(?)', statement)
+    return _SPACES.sub(' ', statement).strip()
+
+
+class RequestStats:
+    """Statements and timings collected during one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = []
+
+    def record(self, statement, seconds):
+        self.statements.append((statement, seconds))
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    @property
+    def db_seconds(self):
+        return sum(seconds for _, seconds in self.statements)
+
+    def slowest(self, n=SLOWEST_COUNT):
+        return sorted(self.statements, key=lambda s: s[1], reverse=True)[:n]
+
+    def repeated(self, threshold=REPEAT_THRESHOLD):
+        """[(shape, count)] of shapes run at least `threshold` times."""
+
+        counts = Counter(shape(statement) for statement, _ in self.statements)
+        return [(sql, n) for sql, n in counts.most_common() if n >= threshold]
+
+
+def _current():
+    return g.get('sql_stats') if has_app_context() else None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    if _current() is not None:
+        conn.info.setdefault('sql_stats_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    stats = _current()
+    if stats is not None and conn.info.get('sql_stats_start'):
+        started = conn.info['sql_stats_start'].pop()
+        stats.record(statement, time.perf_counter() - started)
+
+
+def _truncate(statement):
+    statement = _SPACES.sub(' ', statement).strip()
+    if len(statement) > MAX_STATEMENT_LENGTH:
+        return statement[:MAX_STATEMENT_LENGTH] + '...'
+    return statement
+
+
+def init_app(app, engine=Engine):
+    """Collect SQL statistics for `app`'s requests to `engine`.
+
+    By default that's every engine, read replicas included.
+
+    Call before registering other before_request handlers, so their queries
+    are counted too.
+    """
+
+    app.config.setdefault('SQL_STATS_SAMPLE_RATE', 0.0)
+    app.config.setdefault('SQL_STATS_SLOW_MS', 500)
+    app.config.setdefault('SQL_STATS_HEADERS', False)
+
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def start_sql_stats():
+        if random.random() < app.config['SQL_STATS_SAMPLE_RATE']:
+            g.sql_stats = RequestStats()
+
+    @app.after_request
+    def report_sql_stats(response):
+        stats = g.pop('sql_stats', None)
+        if stats is None:
+            return response
+
+        request_ms = (time.perf_counter() - stats.started) * 1000
+        db_ms = stats.db_seconds * 1000
+        repeated = stats.repeated()
+
+        if app.config['SQL_STATS_HEADERS']:
+            response.headers['X-SQL-Queries'] = str(stats.count)
+            response.headers['X-SQL-Time-Ms'] = f"{db_ms:.1f}"
+            response.headers['Server-Timing'] = (
+                f"db;dur={db_ms:.1f};desc=\"{stats.count} queries\", "
+                f"app;dur={request_ms:.1f}")
+            if repeated:
+                response.headers['X-SQL-Repeated'] = str(repeated[0][1])
+
+        line = json.dumps(dict(
+            event='sql_stats',
+            method=request.method,
+            path=request.path,
+            endpoint=request.endpoint,
+            status=response.status_code,
+            request_ms=round(request_ms, 1),
+            queries=stats.count,
+            db_ms=round(db_ms, 1),
+            slowest=[dict(ms=round(seconds * 1000, 1),
+                          sql=_truncate(statement))
+                     for statement, seconds in stats.slowest()],
+            repeated=[dict(count=n, sql=_truncate(sql))
+                      for sql, n in repeated],
+        ))
+
+        if repeated or request_ms >= app.config['SQL_STATS_SLOW_MS']:
+            app.logger.warning(line)
+        else:
+            app.logger.info(line)
+
+        return response
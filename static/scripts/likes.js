@@ -0,0 +1,33 @@
+// Like/unlike in place: submit the like forms with fetch and update the
+// button from the JSON answer. Without JavaScript, or if the request fails,
+// the form posts normally and the page reloads.
+
+document.addEventListener('submit', async function (evt) {
+  const form = evt.target;
+  if (!form.closest('.messages-like, .messages-like-bottom')) return;
+
+  evt.preventDefault();
+
+  let data;
+  try {
+    const resp = await fetch(form.action, {
+      method: 'POST',
+      headers: { Accept: 'application/json' },
+      credentials: 'same-origin',
+    });
+    if (!resp.ok) throw new Error(resp.statusText);
+    data = await resp.json();
+  } catch (err) {
+    form.submit();
+    return;
+  }
+
+  const button = form.querySelector('button');
+  const icon = form.querySelector('i');
+
+  form.action = `/messages/${data.message_id}/${data.liked ? 'unlike' : 'like'}`;
+  button.classList.toggle('fabutton', data.liked);
+  button.title = `${data.like_count} like${data.like_count === 1 ? '' : 's'}`;
+  icon.classList.toggle('fas', data.liked);
+  icon.classList.toggle('far', !data.liked);
+});
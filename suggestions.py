@@ -0,0 +1,271 @@
+"""Offline "who to follow" suggestions.
+
+Counting friends-of-friends against the follows table on every page view
+would be far too expensive, so suggestions are computed by a batch job
+(`flask refresh-suggestions`) and the best SUGGESTIONS_PER_USER for each
+user are stored in the suggestions table. Reading them is one index range
+scan.
+
+The job loads every follow into a compact adjacency list (`Graph`) and
+scores each user's candidates as:
+
+- one point for each account the user follows that follows the candidate
+  (friends-of-friends), plus
+- POPULARITY_WEIGHT * log(1 + the candidate's followers),
+
+leaving out the user and anyone they already follow. Users are split into
+shards that are scored on a process pool.
+
+A full refresh recomputes everyone. An incremental refresh recomputes only
+users whose own follows changed (User.following_changed_at) since their
+suggestions were computed. The bulk loader doesn't set that column, so run
+a full refresh after loading data. Run one now and then anyway, to pick up
+changes further out in the graph.
+"""
+
+import heapq
+import math
+from array import array
+from collections import Counter
+from datetime import datetime
+from itertools import islice
+from multiprocessing import Pool
+
+from sqlalchemy import func, or_, select
+
+from models import db, Follows, Suggestion, User
+
+# suggestions stored per user
+SUGGESTIONS_PER_USER = 50
+
+# how much a candidate's follower count counts next to mutual follows
+POPULARITY_WEIGHT = 0.25
+
+# users per process pool task
+SHARD_SIZE = 2000
+
+# rows fetched at a time while loading the graph
+LOAD_BATCH = 10000
+
+# users whose suggestions are replaced per transaction
+WRITE_BATCH = 1000
+
+
+class Graph:
+    """Who follows whom, as compressed sparse rows.
+
+    Users are numbered 0..n-1 in id order (`ids`, `index`). The accounts
+    user i follows are `targets[offsets[i]:offsets[i + 1]]`, as numbers;
+    `followers[i]` is how many accounts follow user i, and `popular` lists
+    every user, most followed first.
+    """
+
+    def __init__(self, ids, offsets, targets, followers):
+        self.ids = ids
+        self.index = {user_id: i for i, user_id in enumerate(ids)}
+        self.offsets = offsets
+        self.targets = targets
+        self.followers = followers
+        self.popular = sorted(range(len(ids)), key=lambda i: -followers[i])
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def edge_count(self):
+        return len(self.targets)
+
+    @classmethod
+    def from_edges(cls, user_ids, edges):
+        """Build from user ids and (follower_id, followed_id) pairs."""
+
+        ids = array('q', sorted(user_ids))
+        index = {user_id: i for i, user_id in enumerate(ids)}
+
+        sources = array('l')
+        dests = array('l')
+        for follower_id, followed_id in edges:
+            sources.append(index[follower_id])
+            dests.append(index[followed_id])
+
+        # counting sort of the edges by follower
+        offsets = array('l', [0]) * (len(ids) + 1)
+        followers = array('l', [0]) * len(ids)
+        for source, dest in zip(sources, dests):
+            offsets[source + 1] += 1
+            followers[dest] += 1
+        for i in range(len(ids)):
+            offsets[i + 1] += offsets[i]
+
+        targets = array('l', [0]) * len(sources)
+        position = offsets[:-1]
+        for source, dest in zip(sources, dests):
+            targets[position[source]] = dest
+            position[source] += 1
+
+        return cls(ids, offsets, targets, followers)
+
+    def following(self, i):
+        return self.targets[self.offsets[i]:self.offsets[i + 1]]
+
+
+def load_graph():
+    """The follows table as a `Graph`."""
+
+    user_ids = [user_id for (user_id,) in
+                db.session.query(User.id).yield_per(LOAD_BATCH)]
+    edges = (db.session
+             .query(Follows.user_following_id, Follows.user_being_followed_id)
+             .yield_per(LOAD_BATCH))
+
+    return Graph.from_edges(user_ids, edges)
+
+
+def recommend(graph, i, k=SUGGESTIONS_PER_USER):
+    """[(user number, score)] of the best `k` candidates for user `i`."""
+
+    followed = graph.following(i)
+    excluded = set(followed)
+    excluded.add(i)
+
+    mutual = Counter()
+    for j in followed:
+        mutual.update(graph.following(j))
+
+    # popular accounts round out the list for users who follow few people
+    for candidate in islice((c for c in graph.popular if c not in excluded),
+                            k):
+        mutual[candidate] += 0
+
+    for j in excluded:
+        mutual.pop(j, None)
+
+    def score(candidate):
+        return (mutual[candidate]
+                + POPULARITY_WEIGHT * math.log1p(graph.followers[candidate]))
+
+    best = heapq.nlargest(k, mutual, key=lambda c: (score(c), -c))
+    return [(candidate, score(candidate)) for candidate in best]
+
+
+def shards(items, size=SHARD_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+_graph = None
+
+
+def _init_worker(graph):
+    global _graph
+    _graph = graph
+
+
+def _score_shard(users):
+    return [(_graph.ids[i],
+             [(_graph.ids[c], score) for c, score in recommend(_graph, i)])
+            for i in users]
+
+
+def compute(graph, user_ids=None, workers=1):
+    """Yield (user_id, [(suggested_id, score)]) for `user_ids` (all users).
+
+    With more than one worker, shards are scored on a process pool.
+    """
+
+    if user_ids is None:
+        users = list(range(len(graph)))
+    else:
+        users = [graph.index[user_id] for user_id in user_ids
+                 if user_id in graph.index]
+
+    if workers <= 1:
+        _init_worker(graph)
+        for shard in shards(users):
+            yield from _score_shard(shard)
+        return
+
+    with Pool(workers, initializer=_init_worker, initargs=(graph,)) as pool:
+        for results in pool.imap_unordered(_score_shard, shards(users)):
+            yield from results
+
+
+def stale_user_ids():
+    """Users whose follows changed since their suggestions were computed."""
+
+    computed_at = (select([func.max(Suggestion.computed_at)])
+                   .where(Suggestion.user_id == User.id)
+                   .as_scalar())
+
+    return [user_id for (user_id,) in db.session
+            .query(User.id)
+            .filter(User.following_changed_at.isnot(None))
+            .filter(or_(computed_at.is_(None),
+                        computed_at < User.following_changed_at))]
+
+
+def save(results, computed_at):
+    """Replace the suggestions of each user in `results`; commits."""
+
+    def write(batch):
+        (Suggestion
+            .query
+            .filter(Suggestion.user_id.in_([user_id for user_id, _ in batch]))
+            .delete(synchronize_session=False))
+        rows = [dict(user_id=user_id, rank=rank, suggested_id=suggested_id,
+                     score=score, computed_at=computed_at)
+                for user_id, suggested in batch
+                for rank, (suggested_id, score) in enumerate(suggested)]
+        if rows:
+            db.session.execute(Suggestion.__table__.insert(), rows)
+        db.session.commit()
+
+    count = 0
+    batch = []
+    for result in results:
+        batch.append(result)
+        if len(batch) == WRITE_BATCH:
+            write(batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        write(batch)
+        count += len(batch)
+
+    return count
+
+
+def refresh(full=False, workers=1):
+    """Recompute suggestions for everyone, or (default) stale users.
+
+    Commits as it goes; returns how many users were refreshed.
+    """
+
+    # changes made while the job runs must leave their users stale
+    started = datetime.utcnow()
+
+    user_ids = None if full else stale_user_ids()
+    if user_ids == []:
+        return 0
+
+    graph = load_graph()
+    # done reading; don't hold a transaction open while scoring
+    db.session.commit()
+
+    return save(compute(graph, user_ids, workers), started)
+
+
+def for_user(users, user_id):
+    """Narrow `users`, a query over User, to `user_id`'s suggestions.
+
+    Best first, leaving out anyone followed since they were computed.
+    """
+
+    followed = (select([Follows.user_being_followed_id])
+                .where(Follows.user_following_id == user_id))
+
+    return (users
+            .join(Suggestion, Suggestion.suggested_id == User.id)
+            .filter(Suggestion.user_id == user_id)
+            .filter(~User.id.in_(followed))
+            .order_by(Suggestion.rank))
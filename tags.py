@@ -0,0 +1,119 @@
+"""Hashtags and @mentions, pulled out of message text into posting tables.
+
+Finding the messages that mention `#topic` or `@someone` in the text itself
+would take a LIKE '%...%' scan of every message. Instead each message's
+hashtags go in message_tags and the users it mentions in mentions, written
+in the same transaction as the message. A tag's or user's feed is then one
+range scan over (tag or user, timestamp, message_id).
+
+Tags are matched case-insensitively and stored lowercased. A mention is
+resolved to a user id when the message is indexed, so it is kept if the
+user renames, and an @name that isn't a user yet never becomes a mention.
+
+Messages posted before postings existed are indexed by
+`flask backfill-tags`, which is safe to rerun.
+"""
+
+import re
+
+from models import db, Mention, Message, MessageTag, User
+
+# "#" or "@" at the start of a word: not "a#b", "me@example.com" or "##x"
+HASHTAG = re.compile(r"(?<![\w#@&])#(\w+)")
+MENTION = re.compile(r"(?<![\w#@])@(\w+)")
+
+# longer "tags" are left out
+MAX_TAG_LENGTH = 50
+
+# messages indexed per transaction by backfill()
+BACKFILL_BATCH = 1000
+
+
+def normalize(tag):
+    """A tag as stored: lowercased, without a leading "#"."""
+
+    return tag.lstrip('#').lower()
+
+
+def hashtags(text):
+    """The distinct tags in `text`."""
+
+    return {normalize(tag) for tag in HASHTAG.findall(text)
+            if len(tag) <= MAX_TAG_LENGTH}
+
+
+def mentioned_usernames(text):
+    """The distinct usernames @mentioned in `text`."""
+
+    return set(MENTION.findall(text))
+
+
+def index_messages(messages):
+    """Write postings for `messages` (anything with id, text, timestamp).
+
+    Returns how many were written.
+    """
+
+    tag_rows = [dict(tag=tag, message_id=msg.id, timestamp=msg.timestamp)
+                for msg in messages
+                for tag in hashtags(msg.text)]
+
+    names = {msg.id: mentioned_usernames(msg.text) for msg in messages}
+    all_names = set().union(*names.values())
+    user_ids = {}
+    if all_names:
+        user_ids = dict(db.session
+                          .query(User.username, User.id)
+                          .filter(User.username.in_(all_names),
+                                  User.deleted_at.is_(None)))
+
+    mention_rows = [dict(user_id=user_ids[name], message_id=msg.id,
+                         timestamp=msg.timestamp)
+                    for msg in messages
+                    for name in names[msg.id]
+                    if name in user_ids]
+
+    if tag_rows:
+        db.session.execute(MessageTag.__table__.insert(), tag_rows)
+    if mention_rows:
+        db.session.execute(Mention.__table__.insert(), mention_rows)
+
+    return len(tag_rows) + len(mention_rows)
+
+
+def index_message(message):
+    """Write postings for a new message; it must already be flushed."""
+
+    return index_messages([message])
+
+
+def backfill(after_id=0):
+    """Reindex every message with an id above `after_id`; commits.
+
+    Goes BACKFILL_BATCH messages at a time, replacing their postings, and
+    yields (last message id, postings written) after each batch.
+    """
+
+    while True:
+        batch = (db.session
+                   .query(Message.id, Message.text, Message.timestamp)
+                   .filter(Message.id > after_id,
+                           Message.deleted_at.is_(None))
+                   .order_by(Message.id)
+                   .limit(BACKFILL_BATCH)
+                   .all())
+        if not batch:
+            return
+
+        message_ids = [msg.id for msg in batch]
+        for model in (MessageTag, Mention):
+            (model
+                .query
+                .filter(model.message_id.in_(message_ids))
+                .delete(synchronize_session=False))
+
+        written = index_messages(batch)
+        db.session.commit()
+
+        after_id = message_ids[-1]
+        yield after_id, written
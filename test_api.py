@@ -0,0 +1,90 @@
+"""JSON API tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_api.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, Follows, Like, TimelineEntry
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app, CURR_USER_KEY
+import current_user
+import follows
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class ApiTestCase(TestCase):
+    """Test the v1 timeline and follow list endpoints."""
+
+    def setUp(self):
+        TimelineEntry.query.delete()
+        Like.query.delete()
+        Follows.query.delete()
+        Message.query.delete()
+        User.query.delete()
+        current_user.snapshots.clear()
+
+        reader = User(email="r@test.com", username="reader",
+                      password="HASHED_PASSWORD")
+        author = User(email="a@test.com", username="author",
+                      password="HASHED_PASSWORD")
+        db.session.add_all([reader, author])
+        db.session.commit()
+        self.reader_id, self.author_id = reader.id, author.id
+
+        for i in range(3):
+            db.session.add(Message(text=f"msg {i}", user_id=self.author_id))
+            db.session.commit()
+        follows.follow(self.reader_id, self.author_id)
+        db.session.commit()
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.reader_id
+
+    def test_home_timeline(self):
+        resp = self.client.get("/api/v1/timeline?fields=text,user.username")
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json['data'][0],
+                         dict(text="msg 2", user=dict(username="author")))
+        self.assertEqual(len(resp.json['data']), 3)
+
+    def test_paging(self):
+        url = f"/api/v1/users/{self.author_id}/messages?fields=text&limit=2"
+        first = self.client.get(url).json
+        second = self.client.get(
+            f"{url}&before={first['paging']['older']}").json
+
+        self.assertEqual([m['text'] for m in first['data']],
+                         ["msg 2", "msg 1"])
+        self.assertEqual([m['text'] for m in second['data']], ["msg 0"])
+        self.assertIsNone(second['paging']['older'])
+
+    def test_follow_lists(self):
+        resp = self.client.get(
+            f"/api/v1/users/{self.author_id}/followers?fields=id,username")
+
+        self.assertEqual(resp.json['data'],
+                         [dict(id=self.reader_id, username="reader")])
+
+    def test_errors(self):
+        resp = self.client.get("/api/v1/timeline?fields=password")
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn("password", resp.json['error'])
+
+        resp = self.client.get("/api/v1/users/999999/liked")
+        self.assertEqual(resp.status_code, 404)
+
+        with self.client.session_transaction() as sess:
+            del sess[CURR_USER_KEY]
+        resp = self.client.get("/api/v1/timeline")
+        self.assertEqual(resp.status_code, 401)
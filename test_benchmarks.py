@@ -0,0 +1,48 @@
+"""Route benchmark baseline tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_benchmarks.py
+
+
+from unittest import TestCase
+
+from benchmarks.routes import compare, percentile, summarize
+
+
+def results(p95_ms=10.0, queries=3):
+    return dict(scale='1k', dialect='sqlite',
+                routes={'home:user': dict(p95_ms=p95_ms, queries=queries)})
+
+
+class BaselineTestCase(TestCase):
+    """Test percentiles and regression checks."""
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile([7], 99), 7)
+
+    def test_summarize(self):
+        stats = summarize([0.01] * 9 + [0.1], [3, 4])
+
+        self.assertEqual(stats['p50_ms'], 10)
+        self.assertEqual(stats['p99_ms'], 100)
+        self.assertEqual(stats['queries'], 4)
+
+    def test_within_tolerance(self):
+        self.assertEqual(compare(results(), results(p95_ms=12), 0.25), [])
+        # small absolute changes are noise
+        self.assertEqual(compare(results(p95_ms=1), results(p95_ms=1.9), 0.25),
+                         [])
+
+    def test_regressions(self):
+        self.assertEqual(len(compare(results(), results(p95_ms=20), 0.25)), 1)
+        self.assertEqual(len(compare(results(), results(queries=4), 0.25)), 1)
+
+    def test_different_scale(self):
+        other = dict(results(), scale='100k')
+
+        self.assertIn("scale", compare(results(), other, 0.25)[0])
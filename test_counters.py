@@ -0,0 +1,75 @@
+"""Counter cache tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_counters.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, Follows, Like
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app
+import counters
+
+db.create_all()
+
+
+class CountersTestCase(TestCase):
+    """Test counter updates and reconciliation."""
+
+    def setUp(self):
+        """Create two users and a message."""
+
+        Like.query.delete()
+        Follows.query.delete()
+        Message.query.delete()
+        User.query.delete()
+
+        self.u1 = User(email="u1@test.com", username="u1",
+                       password="HASHED_PASSWORD")
+        self.u2 = User(email="u2@test.com", username="u2",
+                       password="HASHED_PASSWORD")
+        db.session.add_all([self.u1, self.u2])
+        db.session.commit()
+
+        self.msg = Message(text="hello", user_id=self.u2.id)
+        db.session.add(self.msg)
+        db.session.flush()
+        counters.message_posted(self.msg)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def test_follow_and_like(self):
+        db.session.add(Follows(user_being_followed_id=self.u2.id,
+                               user_following_id=self.u1.id))
+        counters.followed(self.u1.id, self.u2.id)
+        db.session.add(Like(user_liked_id=self.u1.id, msg_id=self.msg.id))
+        counters.liked(self.u1.id, self.msg.id)
+        db.session.commit()
+
+        self.assertEqual(self.u1.following_count, 1)
+        self.assertEqual(self.u1.likes_count, 1)
+        self.assertEqual(self.u2.followers_count, 1)
+        self.assertEqual(self.u2.messages_count, 1)
+        self.assertEqual(self.msg.like_count, 1)
+
+    def test_reconcile(self):
+        db.session.add(Follows(user_being_followed_id=self.u2.id,
+                               user_following_id=self.u1.id))
+        self.u2.messages_count = 7
+        self.u1.likes_count = 3
+        db.session.commit()
+
+        counters.reconcile()
+        db.session.commit()
+
+        self.assertEqual(self.u2.messages_count, 1)
+        self.assertEqual(self.u2.followers_count, 1)
+        self.assertEqual(self.u1.following_count, 1)
+        self.assertEqual(self.u1.likes_count, 0)
@@ -0,0 +1,74 @@
+"""Current-user snapshot and cache tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_current_user.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app
+from cache import LRUCache
+import current_user
+
+db.create_all()
+
+
+class LRUCacheTestCase(TestCase):
+    """Test eviction and expiry of the in-process cache."""
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_expires(self):
+        cache = LRUCache(ttl=0)
+        cache.set("a", 1)
+
+        self.assertIsNone(cache.get("a"))
+
+
+class CurrentUserTestCase(TestCase):
+    """Test loading and invalidating current-user snapshots."""
+
+    def setUp(self):
+        User.query.delete()
+        current_user.snapshots.clear()
+
+        user = User(email="test@test.com", username="testuser",
+                    password="HASHED_PASSWORD")
+        db.session.add(user)
+        db.session.commit()
+        self.user_id = user.id
+
+    def test_snapshot_and_record(self):
+        snapshot = current_user.load(self.user_id)
+
+        self.assertEqual(snapshot.username, "testuser")
+        self.assertEqual(snapshot.email, "test@test.com")
+        self.assertIsInstance(snapshot.record, User)
+
+    def test_stale_snapshot_evicted_on_commit(self):
+        current_user.load(self.user_id)
+
+        user = User.query.get(self.user_id)
+        user.username = "renamed"
+        current_user.mark_stale(self.user_id)
+        db.session.commit()
+
+        self.assertEqual(current_user.load(self.user_id).username, "renamed")
+
+    def test_missing_user(self):
+        self.assertIsNone(current_user.load(self.user_id + 1000))
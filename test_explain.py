@@ -0,0 +1,220 @@
+"""Query plan regression tests.
+
+Each hot query from app.py is EXPLAINed against a seeded dataset large
+enough that the planner uses whatever indexes exist; a test fails if a
+query reads a whole table instead.
+"""
+
+# run these tests like:
+#
+#    python -m unittest test_explain.py
+
+
+import os
+from datetime import datetime
+from unittest import TestCase
+
+from sqlalchemy import text
+
+from models import (db, User, Message, Follows, Like, TimelineEntry, Job,
+                    Suggestion, LikeBucket, TrendingScore, MessageTag,
+                    Mention)
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app
+from explain import full_scans
+from loading import message_query, user_query
+from pagination import cursor_args, keyset_query
+import fulltext
+import search
+import trending
+
+db.create_all()
+
+USERS = 20000
+MESSAGES = 100000
+FOLLOWS = 100000
+LIKES = 50000
+
+NUMBERS = ("WITH RECURSIVE n(i) AS "
+           "(SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < :count) ")
+
+
+def seed():
+    """Bulk-insert USERS users and their messages, follows and likes."""
+
+    ts = datetime(2025, 1, 1)
+    execute = db.session.execute
+
+    execute(text(
+        "INSERT INTO users (email, username, password, messages_count, "
+        "following_count, followers_count, likes_count, updated_at) "
+        + NUMBERS +
+        "SELECT 'u' || i || '@test.com', 'user' || i, 'x', 0, 0, 0, 0, :ts "
+        "FROM n"), dict(count=USERS, ts=ts))
+    first_user = db.session.query(db.func.min(User.id)).scalar()
+
+    execute(text(
+        "INSERT INTO messages (text, timestamp, user_id, like_count) "
+        + NUMBERS +
+        "SELECT 'hello', :ts, :first + i % :users, 0 FROM n"),
+        dict(count=MESSAGES, ts=ts, first=first_user, users=USERS))
+    first_message = db.session.query(db.func.min(Message.id)).scalar()
+
+    # each user follows the next few users round the circle
+    execute(text(
+        "INSERT INTO follows (user_following_id, user_being_followed_id) "
+        + NUMBERS +
+        "SELECT :first + i % :users, "
+        ":first + (i % :users + 1 + i / :users) % :users FROM n"),
+        dict(count=FOLLOWS, first=first_user, users=USERS))
+
+    execute(text(
+        "INSERT INTO likes (user_liked_id, msg_id) "
+        + NUMBERS +
+        "SELECT :first + i % :users, :first_message + i FROM n"),
+        dict(count=LIKES, first=first_user, users=USERS,
+             first_message=first_message))
+
+    execute(text(
+        "INSERT INTO timeline_entries (user_id, message_id, author_id, "
+        "timestamp) "
+        "SELECT f.user_following_id, m.id, m.user_id, m.timestamp "
+        "FROM follows f JOIN messages m ON m.user_id = f.user_being_followed_id "
+        "WHERE m.id % 5 = 0"))
+
+    execute(text(
+        "INSERT INTO trending_scores (period, message_id, likes, score) "
+        "SELECT 'day', msg_id, count(*), count(*) FROM likes GROUP BY msg_id"))
+
+    execute(text(
+        "INSERT INTO message_tags (tag, message_id, timestamp) "
+        "SELECT 'tag' || (id % 1000), id, timestamp FROM messages"))
+
+    execute(text(
+        "INSERT INTO mentions (user_id, message_id, timestamp) "
+        "SELECT :first + (id * 7) % :users, id, timestamp FROM messages"),
+        dict(first=first_user, users=USERS))
+
+    db.session.commit()
+    execute(text("ANALYZE"))
+    db.session.commit()
+
+    return first_user + USERS // 2, first_message + MESSAGES // 2
+
+
+def clear():
+    for model in (Job, Suggestion, TrendingScore, LikeBucket, MessageTag,
+                  Mention, TimelineEntry, Like, Follows, Message, User):
+        model.query.delete()
+    db.session.commit()
+    search.ngram_index.clear()
+
+
+class QueryPlanTestCase(TestCase):
+    """Test that hot queries are answered from indexes."""
+
+    @classmethod
+    def setUpClass(cls):
+        clear()
+        cls.user_id, cls.message_id = seed()
+
+    @classmethod
+    def tearDownClass(cls):
+        clear()
+
+    def assertIndexed(self, query):
+        self.assertEqual(full_scans(query), [])
+
+    def test_profile_messages(self):
+        messages = (message_query('profile')
+                    .filter(Message.user_id == self.user_id))
+        keys = [Message.timestamp, Message.id]
+
+        self.assertIndexed(keyset_query(messages, keys))
+        with app.test_request_context(
+                f"/?before=2025-01-01T00:00:00.000000_{self.message_id}"):
+            before, _ = cursor_args(keys)
+        self.assertIndexed(keyset_query(messages, keys, before=before))
+
+    def test_following(self):
+        self.assertIndexed(keyset_query(
+            user_query('card')
+                .join(Follows, Follows.user_being_followed_id == User.id)
+                .filter(Follows.user_following_id == self.user_id),
+            [User.id]))
+
+    def test_followers(self):
+        self.assertIndexed(keyset_query(
+            user_query('card')
+                .join(Follows, Follows.user_following_id == User.id)
+                .filter(Follows.user_being_followed_id == self.user_id),
+            [User.id]))
+
+    def test_liked(self):
+        self.assertIndexed(keyset_query(
+            message_query('feed')
+                .join(Like, Like.msg_id == Message.id)
+                .filter(Like.user_liked_id == self.user_id),
+            [Message.timestamp, Message.id]))
+
+    def test_home_timeline(self):
+        self.assertIndexed(keyset_query(
+            message_query('feed')
+                .join(TimelineEntry, TimelineEntry.message_id == Message.id)
+                .filter(TimelineEntry.user_id == self.user_id),
+            [TimelineEntry.timestamp, TimelineEntry.message_id]))
+
+    def test_viewer_following(self):
+        self.assertIndexed(
+            db.session
+              .query(Follows.user_being_followed_id)
+              .filter(Follows.user_following_id == self.user_id,
+                      Follows.user_being_followed_id.in_(
+                          [self.user_id + 1, self.user_id + 2])))
+
+    def test_like_lookup(self):
+        self.assertIndexed(
+            db.session
+              .query(Like.msg_id)
+              .filter(Like.user_liked_id == self.user_id,
+                      Like.msg_id == self.message_id))
+
+    def test_message_likes(self):
+        self.assertIndexed(
+            db.session
+              .query(Like.user_liked_id)
+              .filter(Like.msg_id == self.message_id))
+
+    def test_message_timeline_entries(self):
+        self.assertIndexed(
+            db.session
+              .query(TimelineEntry.user_id)
+              .filter(TimelineEntry.message_id == self.message_id))
+
+    def test_username_search(self):
+        self.assertIndexed(search.matching_users("user12345"))
+
+    def test_trending(self):
+        self.assertIndexed(
+            trending.ranked(message_query('feed'), 'day')
+                    .limit(trending.TRENDING_SIZE))
+
+    def test_tag_feed(self):
+        self.assertIndexed(keyset_query(
+            message_query('feed')
+                .join(MessageTag, MessageTag.message_id == Message.id)
+                .filter(MessageTag.tag == 'tag123'),
+            [MessageTag.timestamp, MessageTag.message_id]))
+
+    def test_mentions_feed(self):
+        self.assertIndexed(keyset_query(
+            message_query('feed')
+                .join(Mention, Mention.message_id == Message.id)
+                .filter(Mention.user_id == self.user_id),
+            [Mention.timestamp, Mention.message_id]))
+
+    def test_message_search(self):
+        query, _ = fulltext.search_query("hello", message_query('feed'))
+        self.assertIndexed(query)
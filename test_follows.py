@@ -0,0 +1,107 @@
+"""Follow / unfollow tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_follows.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, Follows, TimelineEntry
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app, CURR_USER_KEY
+import current_user
+import follows
+import timeline
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class FollowsTestCase(TestCase):
+    """Test direct, idempotent and bulk follows."""
+
+    def setUp(self):
+        TimelineEntry.query.delete()
+        Follows.query.delete()
+        Message.query.delete()
+        User.query.delete()
+        current_user.snapshots.clear()
+
+        users = [User(email=f"u{i}@test.com", username=f"user{i}",
+                      password="HASHED_PASSWORD") for i in range(4)]
+        db.session.add_all(users)
+        db.session.commit()
+
+        self.reader_id, *self.author_ids = [u.id for u in users]
+        db.session.add(Message(text="hello", user_id=self.author_ids[0]))
+        db.session.commit()
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.reader_id
+
+    def counts(self, user_id):
+        user = User.query.get(user_id)
+        db.session.refresh(user)
+        return user.following_count, user.followers_count
+
+    def test_follow_many(self):
+        followed = follows.follow_many(self.reader_id,
+                                       self.author_ids + [self.reader_id])
+        db.session.commit()
+
+        self.assertEqual(sorted(followed), self.author_ids)
+        self.assertEqual(self.counts(self.reader_id), (3, 0))
+        self.assertEqual(self.counts(self.author_ids[0]), (0, 1))
+        self.assertEqual(
+            [m.text for m in timeline.home_timeline(self.reader_id).items],
+            ["hello"])
+
+    def test_idempotent(self):
+        follows.follow_many(self.reader_id, self.author_ids[:2])
+        followed = follows.follow_many(self.reader_id, self.author_ids)
+        db.session.commit()
+
+        self.assertEqual(followed, [self.author_ids[2]])
+        self.assertEqual(Follows.query.count(), 3)
+        self.assertEqual(self.counts(self.reader_id), (3, 0))
+
+    def test_unfollow_many(self):
+        follows.follow_many(self.reader_id, self.author_ids)
+        unfollowed = follows.unfollow_many(self.reader_id,
+                                           self.author_ids[:1] + [999999])
+        db.session.commit()
+
+        self.assertEqual(unfollowed, self.author_ids[:1])
+        self.assertEqual(self.counts(self.reader_id), (2, 0))
+        self.assertEqual(self.counts(self.author_ids[0]), (0, 0))
+        self.assertEqual(timeline.home_timeline(self.reader_id).items, [])
+
+    def test_bulk_api(self):
+        resp = self.client.post("/users/follow",
+                                json=dict(user_ids=self.author_ids))
+
+        self.assertEqual(resp.json, dict(followed=self.author_ids))
+
+        resp = self.client.post("/users/stop-following",
+                                json=dict(user_ids=self.author_ids[1:]))
+
+        self.assertEqual(resp.json, dict(unfollowed=self.author_ids[1:]))
+        self.assertEqual(Follows.query.count(), 1)
+
+    def test_bulk_api_rejects_bad_input(self):
+        resp = self.client.post("/users/follow", json=dict(user_ids="1,2"))
+
+        self.assertEqual(resp.status_code, 400)
+
+    def test_missing_users(self):
+        resp = self.client.post("/users/follow/999999")
+        self.assertEqual(resp.status_code, 404)
+
+        resp = self.client.post("/users/stop-following/999999")
+        self.assertEqual(resp.status_code, 302)
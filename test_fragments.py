@@ -0,0 +1,94 @@
+"""Template fragment cache tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_fragments.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app, CURR_USER_KEY
+import fragments
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+TEMPLATE = "{% cache key, version %}{{ render() }}{% endcache %}"
+
+
+class FragmentCacheTestCase(TestCase):
+    """Test the {% cache %} tag."""
+
+    def setUp(self):
+        fragments.fragments.clear()
+        self.template = app.jinja_env.from_string(TEMPLATE)
+        self.renders = 0
+
+    def render(self, version, key="k", html="<b>hi</b>"):
+        def render():
+            self.renders += 1
+            return html
+        return self.template.render(key=key, version=version, render=render)
+
+    def test_reuses_fragment(self):
+        first = self.render(1)
+        second = self.render(1)
+
+        self.assertEqual(first, second)
+        self.assertEqual(first, "&lt;b&gt;hi&lt;/b&gt;")
+        self.assertEqual(self.renders, 1)
+
+    def test_new_version_rerenders(self):
+        self.render(1)
+        self.render(2)
+        self.render(2)
+
+        self.assertEqual(self.renders, 2)
+
+
+class MessageFragmentTestCase(TestCase):
+    """Test message list items in real pages."""
+
+    def setUp(self):
+        Message.query.delete()
+        User.query.delete()
+        fragments.fragments.clear()
+
+        user = User(email="a@test.com", username="author",
+                    password="HASHED_PASSWORD")
+        db.session.add(user)
+        db.session.commit()
+        msg = Message(text="hello", user_id=user.id)
+        db.session.add(msg)
+        db.session.commit()
+
+        self.user_id, self.msg_id = user.id, msg.id
+        self.client = app.test_client()
+
+    def test_author_change(self):
+        self.client.get(f"/users/{self.user_id}")
+
+        user = User.query.get(self.user_id)
+        user.username = "renamed"
+        db.session.commit()
+
+        resp = self.client.get(f"/users/{self.user_id}")
+
+        self.assertIn(b"@renamed", resp.data)
+
+    def test_deleted_message(self):
+        self.client.get(f"/users/{self.user_id}")
+        key = fragments.message_key(self.msg_id)
+        self.assertIsNotNone(fragments.fragments.get(key))
+
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.user_id
+        self.client.post(f"/messages/{self.msg_id}/delete")
+
+        self.assertIsNone(fragments.fragments.get(key))
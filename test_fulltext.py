@@ -0,0 +1,123 @@
+"""Full-text message search tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_fulltext.py
+
+
+import html
+import os
+import re
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from models import db, User, Message, TimelineEntry, Job
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app, CURR_USER_KEY
+import current_user
+import fulltext
+import jobs
+from loading import message_query
+from pagination import PER_PAGE
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+NOW = datetime(2025, 6, 1)
+
+
+class FullTextTestCase(TestCase):
+    """Test matching, ranking, paging and index upkeep."""
+
+    def setUp(self):
+        for model in (Job, TimelineEntry, Message, User):
+            model.query.delete()
+        db.session.commit()
+        current_user.snapshots.clear()
+
+        user = User(email="test@test.com", username="testuser",
+                    password="HASHED_PASSWORD")
+        db.session.add(user)
+        db.session.commit()
+        self.user_id = user.id
+
+        self.client = app.test_client()
+
+    def add(self, text, days_ago=0):
+        msg = Message(text=text, user_id=self.user_id,
+                      timestamp=NOW - timedelta(days=days_ago))
+        db.session.add(msg)
+        db.session.commit()
+        return msg.id
+
+    def found(self, q):
+        with app.test_request_context():
+            page = fulltext.search_page(q, message_query('feed'))
+        return [row.Message.id for row in page.items]
+
+    def test_terms(self):
+        self.assertEqual(fulltext.terms('Hello, "world" OR NOT*'),
+                         ["hello", "world", "or", "not"])
+
+    def test_matches_every_word(self):
+        both = self.add("the quick brown fox")
+        self.add("a quick hare")
+        self.add("unrelated")
+
+        self.assertEqual(self.found("Quick FOX"), [both])
+        self.assertEqual(self.found("nothing"), [])
+        self.assertIsNone(fulltext.search_query("  ?! ", message_query('feed')))
+
+    def test_stemming(self):
+        msg_id = self.add("my dogs were running")
+
+        self.assertEqual(self.found("dog run"), [msg_id])
+
+    def test_recency_outweighs_small_relevance_gap(self):
+        old = self.add("birds birds birds", days_ago=30)
+        new = self.add("birds and more", days_ago=0)
+        older = self.add("birds again", days_ago=60)
+
+        self.assertEqual(self.found("birds"), [new, old, older])
+
+    def test_deleted_hidden_and_purged(self):
+        msg_id = self.add("secret plans")
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.user_id
+        self.client.post(f"/messages/{msg_id}/delete")
+
+        self.assertEqual(self.found("secret"), [])
+
+        with app.app_context():
+            jobs.work(burst=True)
+        self.assertIsNone(Message.query.get(msg_id))
+        self.assertEqual(self.found("secret"), [])
+
+    def test_rebuild(self):
+        msg_id = self.add("rebuilt index")
+
+        fulltext.rebuild()
+
+        self.assertEqual(self.found("rebuilt"), [msg_id])
+
+    def test_search_page(self):
+        for i in range(PER_PAGE + 1):
+            self.add(f"paged message {i}.", days_ago=i)
+
+        text = self.client.get("/search/messages?q=paged").get_data(
+            as_text=True)
+        self.assertIn("paged message 0.", text)
+        self.assertNotIn(f"paged message {PER_PAGE}.", text)
+
+        older = html.unescape(
+            re.search(r'href="([^"]*before=[^"]*)"', text).group(1))
+        text = self.client.get(older).get_data(as_text=True)
+        self.assertIn(f"paged message {PER_PAGE}.", text)
+        self.assertNotIn(f"paged message {PER_PAGE - 1}.", text)
+
+        resp = self.client.get("/search/messages?q=zebra")
+        self.assertIn('No messages match "zebra"', resp.get_data(as_text=True))
+        self.assertEqual(self.client.get("/search/messages").status_code, 200)
@@ -0,0 +1,149 @@
+"""Follow graph index tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_graphindex.py
+
+
+import os
+from datetime import datetime
+from unittest import TestCase
+
+from models import db, User, Follows, TimelineEntry
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app, CURR_USER_KEY
+import current_user
+import follows
+from graphindex import GraphIndex, graph_index
+from querycount import count_queries
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class GraphIndexTestCase(TestCase):
+    """Test lookups and updates on an index built from rows."""
+
+    def setUp(self):
+        # 1 and 2 follow each other; 1 follows 3; 4 follows 1
+        self.index = GraphIndex()
+        self.index.rebuild([(1, 2), (2, 1), (1, 3), (4, 1)])
+
+    def test_lookups(self):
+        index = self.index
+
+        self.assertTrue(index.is_following(1, 3))
+        self.assertFalse(index.is_following(3, 1))
+        self.assertTrue(index.is_followed_by(1, 4))
+        self.assertFalse(index.is_followed_by(1, 3))
+        self.assertEqual(index.mutuals(1), [2])
+        self.assertEqual(index.counts(1), (2, 2))
+        self.assertEqual(index.counts(99), (0, 0))
+
+    def test_changes(self):
+        index = self.index
+
+        index.apply(('follow', 3, [1, 4]))
+        index.apply(('follow', 3, [1]))
+        index.apply(('unfollow', 1, [2]))
+
+        self.assertEqual(list(index.following(3)), [1, 4])
+        self.assertEqual(index.mutuals(1), [3])
+        self.assertFalse(index.is_followed_by(2, 1))
+
+        index.apply(('delete', 1, []))
+
+        self.assertEqual(index.counts(1), (0, 0))
+        self.assertEqual(list(index.following(3)), [4])
+        self.assertFalse(index.is_following(4, 1))
+
+    def test_changes_during_rebuild(self):
+        index = self.index
+
+        def rows():
+            yield (1, 2)
+            # committed after the table was read
+            index.apply(('follow', 5, [1]))
+            yield (2, 1)
+
+        index.rebuild(rows())
+
+        self.assertTrue(index.is_followed_by(1, 5))
+        self.assertFalse(index.is_following(1, 3))
+
+    def test_footprint(self):
+        footprint = self.index.footprint()
+
+        self.assertEqual(footprint['users'], 4)
+        self.assertEqual(footprint['edges'], 4)
+        self.assertGreater(footprint['bytes'], 0)
+
+
+class GraphIndexViewTestCase(TestCase):
+    """Test that pages use the index and follows keep it current."""
+
+    def setUp(self):
+        TimelineEntry.query.delete()
+        Follows.query.delete()
+        User.query.delete()
+        current_user.snapshots.clear()
+        graph_index.clear()
+        app.config['GRAPH_INDEX'] = True
+
+        users = [User(email=f"u{i}@test.com", username=f"user{i}",
+                      password="HASHED_PASSWORD") for i in range(3)]
+        db.session.add_all(users)
+        db.session.commit()
+        self.ids = [u.id for u in users]
+
+        follows.follow(self.ids[0], self.ids[1])
+        db.session.commit()
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.ids[0]
+
+    def tearDown(self):
+        app.config['GRAPH_INDEX'] = False
+        graph_index.clear()
+
+    def test_follow_routes_update_index(self):
+        self.client.get("/users")
+        self.assertTrue(graph_index.is_following(self.ids[0], self.ids[1]))
+
+        self.client.post(f"/users/follow/{self.ids[2]}")
+        self.assertTrue(graph_index.is_following(self.ids[0], self.ids[2]))
+
+        self.client.post(f"/users/stop-following/{self.ids[1]}")
+        self.assertFalse(graph_index.is_following(self.ids[0], self.ids[1]))
+
+    def test_rebuild_skips_deleted_users(self):
+        follows.follow(self.ids[2], self.ids[0])
+        User.query.get(self.ids[1]).deleted_at = datetime.utcnow()
+        db.session.commit()
+
+        graph_index.rebuild()
+
+        self.assertFalse(graph_index.is_following(self.ids[0], self.ids[1]))
+        self.assertTrue(graph_index.is_following(self.ids[2], self.ids[0]))
+        self.assertEqual(graph_index.counts(self.ids[0]), (0, 1))
+
+    def test_rollback_discards_changes(self):
+        graph_index.rebuild()
+
+        follows.follow(self.ids[0], self.ids[2])
+        db.session.rollback()
+
+        self.assertFalse(graph_index.is_following(self.ids[0], self.ids[2]))
+
+    def test_no_follow_queries(self):
+        graph_index.rebuild()
+
+        with count_queries(db.engine) as statements:
+            resp = self.client.get("/users")
+
+        self.assertIn(b"Unfollow", resp.data)
+        self.assertFalse([sql for sql in statements if "follows" in sql])
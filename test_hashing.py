@@ -0,0 +1,127 @@
+"""Password hashing tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_hashing.py
+
+
+import os
+import threading
+from unittest import TestCase
+
+from models import db, User
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app
+import hashing
+
+db.create_all()
+
+
+class HashingPoolTestCase(TestCase):
+    """Test the bounded hashing pool."""
+
+    def test_hash_and_check(self):
+        pool = hashing.HashingPool(rounds=4)
+        hashed = pool.hash_password("secret")
+
+        self.assertEqual(hashing.cost_of(hashed), 4)
+        self.assertTrue(pool.check_password(hashed, "secret"))
+        self.assertFalse(pool.check_password(hashed, "wrong"))
+        pool.shutdown()
+
+    def test_rejects_when_full(self):
+        pool = hashing.HashingPool(rounds=4, workers=1, queue_size=0)
+        started, release = threading.Event(), threading.Event()
+
+        def block():
+            started.set()
+            release.wait()
+
+        worker = threading.Thread(target=pool._run, args=(block,))
+        worker.start()
+        started.wait()
+
+        with self.assertRaises(hashing.HashingBusy):
+            pool.hash_password("secret")
+
+        release.set()
+        worker.join()
+        self.assertTrue(pool.hash_password("secret"))
+        pool.shutdown()
+
+    def test_busy_on_timeout(self):
+        pool = hashing.HashingPool(rounds=4, workers=1, timeout=0.01)
+        release = threading.Event()
+
+        with self.assertRaises(hashing.HashingBusy):
+            pool._run(release.wait)
+
+        release.set()
+        self.assertTrue(pool.hash_password("secret"))
+        pool.shutdown()
+
+
+class BusyRouteTestCase(TestCase):
+    """Test that a slow hash gets a "try again" page, not an error."""
+
+    def setUp(self):
+        User.query.delete()
+        db.session.commit()
+        app.config['WTF_CSRF_ENABLED'] = False
+        started, self.release = threading.Event(), threading.Event()
+        hashing.configure(rounds=4, workers=1, queue_size=1, timeout=0.01)
+
+        def block():
+            started.set()
+            self.release.wait()
+
+        def hold():
+            try:
+                hashing.pool._run(block)
+            except hashing.HashingBusy:
+                pass
+
+        # a hash that never finishes in time holds the only worker, so the
+        # signup's hash waits in the queue until it times out
+        self.holder = threading.Thread(target=hold)
+        self.holder.start()
+        started.wait()
+
+    def tearDown(self):
+        self.release.set()
+        self.holder.join()
+        hashing.configure(rounds=app.config['BCRYPT_LOG_ROUNDS'])
+
+    def test_signup_times_out(self):
+        with app.test_client() as client:
+            resp = client.post("/signup", data={
+                "username": "slow", "email": "slow@test.com",
+                "password": "password"})
+
+        self.assertEqual(resp.status_code, 503)
+        self.assertIn("try again", resp.get_data(as_text=True))
+        self.assertIn("Retry-After", resp.headers)
+
+
+class RehashTestCase(TestCase):
+    """Test upgrading stored hashes when the configured cost changes."""
+
+    def setUp(self):
+        User.query.delete()
+        hashing.configure(rounds=4)
+        User.signup("testuser", "test@test.com", "password", None)
+        db.session.commit()
+
+    def tearDown(self):
+        hashing.configure(rounds=app.config['BCRYPT_LOG_ROUNDS'])
+
+    def test_rehash_on_login(self):
+        hashing.configure(rounds=5)
+
+        user = User.authenticate("testuser", "password")
+        db.session.commit()
+
+        self.assertEqual(hashing.cost_of(user.password), 5)
+        self.assertTrue(User.authenticate("testuser", "password"))
@@ -0,0 +1,149 @@
+"""HTTP caching tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_httpcache.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, Follows, Like
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app, CURR_USER_KEY
+import current_user
+import follows
+import httpcache
+from querycount import count_queries
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class ConditionalGetTestCase(TestCase):
+    """Test ETags and 304s on user and message pages."""
+
+    def setUp(self):
+        Like.query.delete()
+        Follows.query.delete()
+        Message.query.delete()
+        User.query.delete()
+        current_user.snapshots.clear()
+
+        self.viewer = User(email="v@test.com", username="viewer",
+                           password="HASHED_PASSWORD")
+        self.author = User(email="a@test.com", username="author",
+                           password="HASHED_PASSWORD")
+        db.session.add_all([self.viewer, self.author])
+        db.session.commit()
+
+        self.msg = Message(text="hello", user_id=self.author.id)
+        db.session.add(self.msg)
+        db.session.commit()
+
+        self.viewer_id, self.author_id = self.viewer.id, self.author.id
+        self.msg_id = self.msg.id
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.viewer_id
+
+    def revalidate(self, url):
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('no-cache', first.headers['Cache-Control'])
+        return first, self.client.get(
+            url, headers={"If-None-Match": first.headers['ETag']})
+
+    def test_not_modified(self):
+        for url in [f"/users/{self.author_id}",
+                    f"/users/{self.author_id}/followers",
+                    f"/messages/{self.msg_id}"]:
+            _, second = self.revalidate(url)
+
+            self.assertEqual(second.status_code, 304, url)
+            self.assertEqual(second.data, b"")
+
+    def test_changed_by_viewer(self):
+        """Liking something changes the like buttons on other pages."""
+
+        url = f"/users/{self.author_id}"
+        first = self.client.get(url)
+        self.client.post(f"/messages/{self.msg_id}/like")
+
+        second = self.client.get(
+            url, headers={"If-None-Match": first.headers['ETag']})
+
+        self.assertEqual(second.status_code, 200)
+
+    def test_changed_by_listed_user(self):
+        follows.follow(self.author_id, self.viewer_id)
+        db.session.commit()
+        url = f"/users/{self.viewer_id}/followers"
+        first = self.client.get(url)
+
+        author = User.query.get(self.author_id)
+        author.bio = "new bio"
+        db.session.commit()
+
+        second = self.client.get(
+            url, headers={"If-None-Match": first.headers['ETag']})
+
+        self.assertEqual(second.status_code, 200)
+
+    def test_follow_list_queried_once(self):
+        """The validator's page of users is the one the view renders."""
+
+        follows.follow(self.author_id, self.viewer_id)
+        db.session.commit()
+
+        with count_queries(db.engine) as statements:
+            resp = self.client.get(f"/users/{self.viewer_id}/followers")
+
+        self.assertIn(b"@author", resp.data)
+        self.assertEqual(
+            len([sql for sql in statements if "JOIN follows" in sql]), 1)
+
+    def test_per_viewer(self):
+        url = f"/users/{self.author_id}"
+        first = self.client.get(url)
+
+        with self.client.session_transaction() as sess:
+            del sess[CURR_USER_KEY]
+        second = self.client.get(
+            url, headers={"If-None-Match": first.headers['ETag']})
+
+        self.assertEqual(second.status_code, 200)
+        self.assertIn('public', second.headers['Cache-Control'])
+        self.assertIn('Last-Modified', second.headers)
+
+    def test_other_pages_not_stored(self):
+        resp = self.client.get("/")
+
+        self.assertIn('no-store', resp.headers['Cache-Control'])
+
+
+class StaticAssetTestCase(TestCase):
+    """Test content-hashed static URLs."""
+
+    def test_hashed_url_is_immutable(self):
+        with app.test_request_context():
+            url = app.jinja_env.globals['static_url']('stylesheets/style.css')
+        digest = httpcache.static_digest(app, 'stylesheets/style.css')
+
+        self.assertTrue(url.endswith(f"?v={digest}"))
+
+        resp = app.test_client().get(url)
+        self.assertIn('immutable', resp.headers['Cache-Control'])
+        self.assertIn(f"max-age={httpcache.STATIC_MAX_AGE}",
+                      resp.headers['Cache-Control'])
+        resp.close()
+
+    def test_stale_hash_not_immutable(self):
+        resp = app.test_client().get("/static/stylesheets/style.css?v=old")
+
+        self.assertNotIn('immutable', resp.headers['Cache-Control'])
+        resp.close()
@@ -0,0 +1,211 @@
+"""Background job queue and purge tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_jobs.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, Follows, Like, Job, TimelineEntry
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app, CURR_USER_KEY
+import current_user
+import follows
+import jobs
+import likes
+import purge
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+calls = []
+
+
+@jobs.handler('test_countdown')
+def countdown(batches, failures=0):
+    """Fail `failures` times, then handle a row per run for `batches` runs."""
+
+    calls.append(batches)
+    if len(calls) <= failures:
+        raise ValueError("flaky")
+    return 1 if len(calls) - failures < batches else 0
+
+
+class JobQueueTestCase(TestCase):
+    """Test claiming, batching, retries and stats."""
+
+    def setUp(self):
+        Job.query.delete()
+        db.session.commit()
+        calls.clear()
+        self.retry_delay = jobs.RETRY_DELAY
+        jobs.RETRY_DELAY = 0
+        self.context = app.app_context()
+        self.context.push()
+
+    def tearDown(self):
+        jobs.RETRY_DELAY = self.retry_delay
+        self.context.pop()
+
+    def test_batches_until_done(self):
+        jobs.enqueue('test_countdown', batches=3)
+        db.session.commit()
+
+        jobs.work(burst=True)
+
+        job = Job.query.one()
+        self.assertEqual(job.status, jobs.DONE)
+        self.assertEqual(job.processed, 2)
+        self.assertEqual(len(calls), 3)
+
+    def test_retries(self):
+        jobs.enqueue('test_countdown', batches=1, failures=2)
+        db.session.commit()
+
+        jobs.work(burst=True)
+
+        job = Job.query.one()
+        self.assertEqual(job.status, jobs.DONE)
+        self.assertEqual(job.attempts, 2)
+        self.assertIn("flaky", job.last_error)
+
+    def test_gives_up(self):
+        jobs.enqueue('test_countdown', batches=1, failures=jobs.MAX_ATTEMPTS)
+        db.session.commit()
+
+        jobs.work(burst=True)
+
+        job = Job.query.one()
+        self.assertEqual(job.status, jobs.FAILED)
+        self.assertEqual(job.attempts, jobs.MAX_ATTEMPTS)
+
+    def test_claimed_once(self):
+        jobs.enqueue('test_countdown', batches=1)
+        db.session.commit()
+
+        self.assertIsNotNone(jobs.claim())
+        self.assertIsNone(jobs.claim())
+
+    def test_stats(self):
+        jobs.enqueue('test_countdown', batches=2)
+        jobs.enqueue('test_countdown', batches=1)
+        db.session.commit()
+        self.assertEqual(jobs.stats()['test_countdown']['queued'], 2)
+
+        jobs.work(burst=True)
+
+        stats = jobs.stats()['test_countdown']
+        self.assertEqual(stats['queued'], 0)
+        self.assertEqual(stats['done'], 2)
+        self.assertEqual(stats['rows'], 1)
+
+
+class PurgeTestCase(TestCase):
+    """Test soft deletes and the background purges."""
+
+    def setUp(self):
+        Job.query.delete()
+        TimelineEntry.query.delete()
+        Like.query.delete()
+        Follows.query.delete()
+        Message.query.delete()
+        User.query.delete()
+        current_user.snapshots.clear()
+
+        users = [User(email=f"u{i}@test.com", username=f"user{i}",
+                      password="HASHED_PASSWORD") for i in range(2)]
+        db.session.add_all(users)
+        db.session.commit()
+        self.gone_id, self.other_id = [u.id for u in users]
+
+        follows.follow(self.other_id, self.gone_id)
+        follows.follow(self.gone_id, self.other_id)
+        db.session.commit()
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.gone_id
+        for i in range(3):
+            self.client.post("/messages/new", data={"text": f"msg {i}"})
+        self.msg_ids = [m.id for m in Message.query.all()]
+
+        other_msg = Message(text="other", user_id=self.other_id)
+        db.session.add(other_msg)
+        db.session.commit()
+        likes.like(self.other_id, self.msg_ids[0])
+        likes.like(self.gone_id, other_msg.id)
+        db.session.commit()
+        self.other_msg_id = other_msg.id
+
+        self.batch_size = purge.BATCH_SIZE
+        purge.BATCH_SIZE = 2
+        self.context = app.app_context()
+        self.context.push()
+
+    def tearDown(self):
+        purge.BATCH_SIZE = self.batch_size
+        self.context.pop()
+
+    def other(self):
+        user = User.query.get(self.other_id)
+        db.session.refresh(user)
+        return user
+
+    def test_delete_user(self):
+        resp = self.client.post("/users/delete")
+        self.assertEqual(resp.status_code, 302)
+
+        # hidden at once, purged later
+        self.assertEqual(self.client.get(f"/users/{self.gone_id}").status_code,
+                         404)
+        self.assertIsNotNone(User.query.get(self.gone_id))
+        self.assertEqual(Job.query.one().kind, 'purge_user')
+        # and so are their messages, wherever they were linked from
+        self.assertEqual(
+            self.client.get(f"/messages/{self.msg_ids[0]}").status_code, 404)
+        self.assertNotIn("msg 0", self.client.get(
+            f"/users/{self.other_id}/liked").get_data(as_text=True))
+
+        jobs.work(burst=True)
+
+        self.assertIsNone(User.query.get(self.gone_id))
+        self.assertEqual(Message.query.count(), 1)
+        self.assertEqual(Follows.query.count(), 0)
+        self.assertEqual(Like.query.count(), 0)
+        self.assertEqual(TimelineEntry.query.count(), 0)
+
+        other = self.other()
+        self.assertEqual(other.following_count, 0)
+        self.assertEqual(other.followers_count, 0)
+        self.assertEqual(other.likes_count, 0)
+        self.assertEqual(Message.query.get(self.other_msg_id).like_count, 0)
+
+        job = Job.query.one()
+        self.assertEqual(job.status, jobs.DONE)
+        # 3 timeline entries, 1 like of theirs and its trending bucket,
+        # 3 messages, 1 like by them, 2 follows and the user
+        self.assertEqual(job.processed, 12)
+
+    def test_delete_message(self):
+        msg_id = self.msg_ids[0]
+        self.client.post(f"/messages/{msg_id}/delete")
+
+        self.assertEqual(self.client.get(f"/messages/{msg_id}").status_code,
+                         404)
+        self.assertEqual(
+            TimelineEntry.query.filter_by(message_id=msg_id).count(), 1)
+
+        jobs.work(burst=True)
+
+        self.assertIsNone(Message.query.get(msg_id))
+        self.assertEqual(
+            TimelineEntry.query.filter_by(message_id=msg_id).count(), 0)
+        self.assertEqual(self.other().likes_count, 0)
+
+        # a purge that runs again finds nothing to do
+        self.assertEqual(purge.purge_message(msg_id), 0)
@@ -0,0 +1,74 @@
+"""Bulk loader tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_loader.py
+
+
+import io
+import os
+import tempfile
+from unittest import TestCase
+
+from models import db, User, LoadCheckpoint, Message, MessageTag, Mention
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app
+from loader import Loader, rebuild_derived
+
+db.create_all()
+
+USERS_CSV = "email,username,password\n" + "".join(
+    f"u{i}@test.com,user{i},HASHED_PASSWORD\n" for i in range(25))
+
+
+class LoaderTestCase(TestCase):
+    """Test chunked, resumable loading."""
+
+    def setUp(self):
+        for model in (MessageTag, Mention, Message, User):
+            model.query.delete()
+        LoadCheckpoint.query.delete()
+        db.session.commit()
+
+        fd, self.path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(fd, 'w') as f:
+            f.write(USERS_CSV)
+
+        self.loader = Loader(db.engine, chunk_size=10, out=io.StringIO())
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_load_in_chunks(self):
+        loaded = self.loader.load(User.__table__, self.path)
+
+        self.assertEqual(loaded, 25)
+        self.assertEqual(User.query.count(), 25)
+        self.assertEqual(
+            self.loader.rows_done(f"users:{self.path}"), 25)
+
+    def test_resume(self):
+        db.session.add(LoadCheckpoint(source=f"users:{self.path}",
+                                      rows_loaded=20))
+        db.session.commit()
+
+        loaded = self.loader.load(User.__table__, self.path)
+
+        self.assertEqual(loaded, 5)
+        self.assertEqual([u.username for u in User.query.order_by(User.id)],
+                         [f"user{i}" for i in range(20, 25)])
+
+    def test_derived_postings(self):
+        self.loader.load(User.__table__, self.path)
+        user_id = User.query.filter_by(username="user1").one().id
+
+        with open(self.path, 'w') as f:
+            f.write("text,timestamp,user_id\n"
+                    f"hi @user1 #Loaded,2025-01-01 00:00:00,{user_id}\n")
+        self.loader.load(Message.__table__, self.path)
+        rebuild_derived()
+
+        self.assertEqual([t.tag for t in MessageTag.query], ["loaded"])
+        self.assertEqual([m.user_id for m in Mention.query], [user_id])
@@ -8,7 +8,7 @@
 import os
 from unittest import TestCase
 
-from models import db, connect_db, Message, User
+from models import db, connect_db, Message, User, Like
 
 # BEFORE we import our app, let's set an environmental variable
 # to use a different database for tests (we need to do this
@@ -70,3 +70,71 @@ class MessageViewTestCase(TestCase):
 
             msg = Message.query.one()
             self.assertEqual(msg.text, "Hello")
+
+
+class LikeViewTestCase(TestCase):
+    """Test liking and unliking messages."""
+
+    def setUp(self):
+        Like.query.delete()
+        Message.query.delete()
+        User.query.delete()
+
+        self.client = app.test_client()
+
+        self.testuser = User.signup(username="testuser",
+                                    email="test@test.com",
+                                    password="testuser",
+                                    image_url=None)
+        self.msg = Message(text="Hello", user=self.testuser)
+        db.session.add(self.msg)
+        db.session.commit()
+
+        self.msg_id = self.msg.id
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.testuser.id
+
+    def post_json(self, url):
+        return self.client.post(url, headers={"Accept": "application/json"})
+
+    def test_like_twice(self):
+        """Liking again neither duplicates the like nor double counts it."""
+
+        for _ in range(2):
+            resp = self.post_json(f"/messages/{self.msg_id}/like")
+            self.assertEqual(resp.json, dict(message_id=self.msg_id,
+                                             liked=True, like_count=1))
+
+        self.assertEqual(Like.query.count(), 1)
+        self.assertEqual(User.query.get(self.testuser.id).likes_count, 1)
+
+    def test_unlike(self):
+        self.post_json(f"/messages/{self.msg_id}/like")
+
+        for _ in range(2):
+            resp = self.post_json(f"/messages/{self.msg_id}/unlike")
+            self.assertEqual(resp.json, dict(message_id=self.msg_id,
+                                             liked=False, like_count=0))
+
+        self.assertEqual(Like.query.count(), 0)
+
+    def test_redirect_fallback(self):
+        resp = self.client.post(f"/messages/{self.msg_id}/like",
+                                headers={"Referer": "/users/1"})
+
+        self.assertEqual(resp.status_code, 302)
+        self.assertTrue(resp.location.endswith("/users/1"))
+
+    def test_missing_message(self):
+        resp = self.post_json("/messages/999999/like")
+
+        self.assertEqual(resp.status_code, 404)
+        self.assertEqual(Like.query.count(), 0)
+
+    def test_logged_out(self):
+        with self.client.session_transaction() as sess:
+            del sess[CURR_USER_KEY]
+
+        resp = self.post_json(f"/messages/{self.msg_id}/like")
+
+        self.assertEqual(resp.status_code, 401)
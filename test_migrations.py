@@ -0,0 +1,166 @@
+"""Schema migration tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_migrations.py
+
+
+import os
+from datetime import datetime
+from unittest import TestCase
+
+import sqlalchemy as sa
+
+from models import db, User, Message, Like, TimelineEntry
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app
+import current_user
+import likes
+import migrations
+
+db.create_all()
+
+
+def baseline_metadata():
+    """The tables as they were before migrations existed."""
+
+    metadata = sa.MetaData()
+    sa.Table(
+        'users', metadata,
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('email', sa.Text, nullable=False, unique=True),
+        sa.Column('username', sa.Text, nullable=False, unique=True),
+        sa.Column('image_url', sa.Text),
+        sa.Column('header_image_url', sa.Text),
+        sa.Column('bio', sa.Text),
+        sa.Column('location', sa.Text),
+        sa.Column('password', sa.Text, nullable=False))
+    sa.Table(
+        'follows', metadata,
+        sa.Column('user_being_followed_id', sa.Integer,
+                  sa.ForeignKey('users.id', ondelete='cascade'),
+                  primary_key=True),
+        sa.Column('user_following_id', sa.Integer,
+                  sa.ForeignKey('users.id', ondelete='cascade'),
+                  primary_key=True))
+    sa.Table(
+        'messages', metadata,
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('text', sa.String(140), nullable=False),
+        sa.Column('timestamp', sa.DateTime, nullable=False),
+        sa.Column('user_id', sa.Integer,
+                  sa.ForeignKey('users.id', ondelete='CASCADE'),
+                  nullable=False))
+    sa.Table(
+        'likes', metadata,
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('msg_id', sa.Integer,
+                  sa.ForeignKey('messages.id', ondelete='cascade'),
+                  nullable=False),
+        sa.Column('user_liked_id', sa.Integer,
+                  sa.ForeignKey('users.id', ondelete='cascade'),
+                  nullable=False))
+    return metadata
+
+
+def drop_everything():
+    if db.engine.dialect.name == 'sqlite':
+        db.engine.execute("DROP TABLE IF EXISTS messages_fts")
+    db.drop_all()
+
+
+class UpgradeTestCase(TestCase):
+    """Test `flask migrate` against a database with the baseline schema."""
+
+    def setUp(self):
+        db.session.remove()
+        drop_everything()
+
+        baseline = baseline_metadata()
+        baseline.create_all(db.engine)
+        with db.engine.begin() as conn:
+            conn.execute(baseline.tables['users'].insert(), [
+                dict(id=1, email="alice@test.com", username="alice",
+                     password="HASHED_PASSWORD"),
+                dict(id=2, email="bob@test.com", username="bob",
+                     password="HASHED_PASSWORD"),
+            ])
+            conn.execute(baseline.tables['follows'].insert(),
+                         user_being_followed_id=1, user_following_id=2)
+            conn.execute(baseline.tables['messages'].insert(),
+                         id=1, text="hello from before",
+                         timestamp=datetime(2024, 1, 1), user_id=1)
+            # liked twice: nothing stopped that before likes were unique
+            conn.execute(baseline.tables['likes'].insert(), [
+                dict(msg_id=1, user_liked_id=2),
+                dict(msg_id=1, user_liked_id=2),
+            ])
+
+    def tearDown(self):
+        db.session.remove()
+        drop_everything()
+        db.create_all()
+        current_user.snapshots.clear()
+
+    def upgrade(self):
+        logged = []
+        with app.app_context():
+            applied = migrations.upgrade(log=logged.append)
+        self.assertEqual(applied, len(migrations.MIGRATIONS))
+        return logged
+
+    def test_upgrade_baseline(self):
+        self.upgrade()
+
+        columns = {c['name'] for c in sa.inspect(db.engine).get_columns('users')}
+        self.assertTrue({'updated_at', 'messages_count', 'deleted_at'}
+                        <= columns)
+
+        alice = User.query.get(1)
+        self.assertEqual(alice.username, "alice")
+        self.assertIsNotNone(alice.updated_at)
+        self.assertEqual(Message.query.get(1).text, "hello from before")
+
+        # the rebuilt table still works, and fills in its defaults
+        db.session.add(User(email="carol@test.com", username="carol",
+                            password="HASHED_PASSWORD"))
+        db.session.commit()
+        self.assertIsNotNone(User.query.filter_by(username="carol")
+                             .one().updated_at)
+
+    def test_counters_and_timelines_filled(self):
+        self.upgrade()
+
+        alice, bob = User.query.get(1), User.query.get(2)
+        self.assertEqual((alice.messages_count, alice.followers_count),
+                         (1, 1))
+        self.assertEqual((bob.following_count, bob.likes_count), (1, 1))
+        self.assertEqual(Message.query.get(1).like_count, 1)
+        self.assertEqual(
+            [e.message_id for e in TimelineEntry.query.filter_by(user_id=2)],
+            [1])
+
+    def test_likes_deduplicated(self):
+        self.upgrade()
+
+        self.assertEqual(Like.query.count(), 1)
+        with app.app_context():
+            self.assertFalse(likes.like(2, 1))
+            self.assertTrue(likes.like(1, 1))
+            db.session.commit()
+        self.assertEqual(Like.query.count(), 2)
+
+    def test_likes_indexed(self):
+        self.upgrade()
+
+        indexes = {tuple(i['column_names']): i['unique']
+                   for i in sa.inspect(db.engine).get_indexes('likes')}
+        self.assertIn(('msg_id',), indexes)
+        self.assertTrue(indexes[('user_liked_id', 'msg_id')])
+
+    def test_upgrade_is_idempotent(self):
+        self.upgrade()
+        with app.app_context():
+            self.assertEqual(migrations.upgrade(log=lambda line: None), 0)
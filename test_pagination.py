@@ -0,0 +1,81 @@
+"""Keyset pagination tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_pagination.py
+
+
+import os
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from models import db, User, Message
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app
+from pagination import (encode_cursor, decode_cursor, keyset_query,
+                        make_page)
+
+db.create_all()
+
+
+class PaginationTestCase(TestCase):
+    """Test cursors and paging over a user's messages."""
+
+    def setUp(self):
+        """Create a user with five messages a minute apart."""
+
+        Message.query.delete()
+        User.query.delete()
+
+        user = User(email="test@test.com", username="testuser",
+                    password="HASHED_PASSWORD")
+        db.session.add(user)
+        db.session.commit()
+
+        start = datetime(2020, 1, 1)
+        self.messages = [
+            Message(text=f"msg {i}", user_id=user.id,
+                    timestamp=start + timedelta(minutes=i))
+            for i in range(5)
+        ]
+        db.session.add_all(self.messages)
+        db.session.commit()
+
+        self.keys = [Message.timestamp, Message.id]
+
+    def page(self, before=None, after=None):
+        rows = keyset_query(Message.query, self.keys, before, after,
+                            per_page=2).all()
+        return make_page(rows, lambda m: (m.timestamp, m.id),
+                         before, after, per_page=2)
+
+    def test_cursor_round_trip(self):
+        msg = self.messages[0]
+        cursor = encode_cursor((msg.timestamp, msg.id))
+
+        self.assertEqual(decode_cursor(cursor, self.keys),
+                         (msg.timestamp, msg.id))
+        self.assertIsNone(decode_cursor("not-a-cursor", self.keys))
+
+    def test_older_and_newer(self):
+        first = self.page()
+        self.assertEqual(first.items, self.messages[:2:-1])
+        self.assertFalse(first.has_newer)
+
+        before = decode_cursor(first.older_cursor, self.keys)
+        second = self.page(before=before)
+        self.assertEqual(second.items, self.messages[2:0:-1])
+        self.assertTrue(second.has_older)
+
+        after = decode_cursor(second.newer_cursor, self.keys)
+        self.assertEqual(self.page(after=after).items, first.items)
+
+    def test_last_page(self):
+        last = self.messages[1]
+        page = self.page(before=(last.timestamp, last.id))
+
+        self.assertEqual(page.items, [self.messages[0]])
+        self.assertFalse(page.has_older)
+        self.assertTrue(page.has_newer)
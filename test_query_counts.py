@@ -0,0 +1,113 @@
+"""Query budget tests for the list and detail routes."""
+
+# run these tests like:
+#
+#    python -m unittest test_query_counts.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, Follows, Like, TimelineEntry
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app, CURR_USER_KEY
+from querycount import count_queries
+import counters
+import current_user
+import timeline
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class QueryCountTestCase(TestCase):
+    """Each route runs a fixed number of SELECTs, however many rows it shows."""
+
+    def setUp(self):
+        """Reader follows three authors who have posted 30 messages."""
+
+        TimelineEntry.query.delete()
+        Like.query.delete()
+        Follows.query.delete()
+        Message.query.delete()
+        User.query.delete()
+
+        self.reader = User(email="r@test.com", username="reader",
+                           password="HASHED_PASSWORD")
+        self.authors = [User(email=f"a{i}@test.com", username=f"author{i}",
+                             password="HASHED_PASSWORD")
+                        for i in range(3)]
+        db.session.add_all([self.reader] + self.authors)
+        db.session.commit()
+
+        for author in self.authors:
+            db.session.add(Follows(user_being_followed_id=author.id,
+                                   user_following_id=self.reader.id))
+            counters.followed(self.reader.id, author.id)
+
+        for i in range(30):
+            msg = Message(text=f"msg {i}", user_id=self.authors[i % 3].id)
+            db.session.add(msg)
+            db.session.flush()
+            timeline.fan_out_message(msg)
+            db.session.add(Like(user_liked_id=self.reader.id, msg_id=msg.id))
+
+        db.session.commit()
+
+        self.reader_id = self.reader.id
+        self.author_id = self.authors[0].id
+        self.message_id = msg.id
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.reader_id
+
+        # start every request with an empty identity map and a cold
+        # current-user cache, so budgets count the worst case
+        db.session.remove()
+        current_user.snapshots.clear()
+
+    def assertQueryBudget(self, url, budget, headers=None, status=200):
+        """GET `url` and check it ran at most `budget` statements."""
+
+        with count_queries(db.engine) as statements:
+            resp = self.client.get(url, headers=headers)
+
+        self.assertEqual(resp.status_code, status)
+        self.assertLessEqual(len(statements), budget,
+                             "\n\n".join(statements))
+
+    def test_homepage(self):
+        self.assertQueryBudget("/", 5)
+
+    # pages answering conditional GETs (httpcache.py) spend two or three
+    # small queries on their validator, and only those on a 304
+
+    def test_users_show(self):
+        self.assertQueryBudget(f"/users/{self.author_id}", 7)
+
+    def test_users_show_not_modified(self):
+        etag = self.client.get(f"/users/{self.author_id}").headers['ETag']
+        db.session.remove()
+        current_user.snapshots.clear()
+
+        self.assertQueryBudget(f"/users/{self.author_id}", 3,
+                               headers={"If-None-Match": etag}, status=304)
+
+    def test_users_liked_show(self):
+        self.assertQueryBudget(f"/users/{self.reader_id}/liked", 5)
+
+    def test_show_following(self):
+        self.assertQueryBudget(f"/users/{self.reader_id}/following", 7)
+
+    def test_users_followers(self):
+        self.assertQueryBudget(f"/users/{self.author_id}/followers", 7)
+
+    def test_list_users(self):
+        self.assertQueryBudget("/users", 3)
+
+    def test_messages_show(self):
+        self.assertQueryBudget(f"/messages/{self.message_id}", 6)
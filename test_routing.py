@@ -0,0 +1,111 @@
+"""Read replica routing tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_routing.py
+#
+# The replica is a second, empty database, so a test can tell which one
+# answered a query.
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+REPLICA_URL = "postgresql:///warbler-test-replica"
+
+from app import app, CURR_USER_KEY
+import current_user
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class RoutingTestCase(TestCase):
+    """Test which engine requests read from."""
+
+    def setUp(self):
+        app.config['SQLALCHEMY_REPLICA_URIS'] = [REPLICA_URL]
+        (replica,) = db.replica_engines(app)
+        db.metadata.drop_all(replica)
+        db.metadata.create_all(replica)
+
+        Message.query.delete()
+        User.query.delete()
+        current_user.snapshots.clear()
+
+        user = User(email="u@test.com", username="primary_only",
+                    password="HASHED_PASSWORD")
+        db.session.add(user)
+        db.session.commit()
+        self.user_id = user.id
+        # requests in this thread would otherwise share this session, which
+        # has written
+        db.session.remove()
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        app.config['SQLALCHEMY_REPLICA_URIS'] = []
+
+    def test_get_reads_replica(self):
+        resp = self.client.get(f"/users/{self.user_id}")
+
+        self.assertEqual(resp.status_code, 404)
+
+    def test_no_replicas(self):
+        app.config['SQLALCHEMY_REPLICA_URIS'] = []
+
+        resp = self.client.get(f"/users/{self.user_id}")
+
+        self.assertEqual(resp.status_code, 200)
+
+    def test_reads_own_writes(self):
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.user_id
+
+        # the POST reads and writes the primary...
+        resp = self.client.post("/messages/new", data={"text": "hello"})
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(Message.query.count(), 1)
+
+        # ...and for a while after it, so does this browser's GETs
+        resp = self.client.get(f"/users/{self.user_id}")
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn(b"hello", resp.data)
+
+        with self.client.session_transaction() as sess:
+            sess['primary_until'] = 0
+        resp = self.client.get(f"/users/{self.user_id}")
+        self.assertEqual(resp.status_code, 404)
+
+    def test_round_robin(self):
+        app.config['SQLALCHEMY_REPLICA_URIS'] = [REPLICA_URL, REPLICA_URL + "2"]
+
+        with app.test_request_context():
+            first = db.replica_for_request(app)
+        with app.test_request_context():
+            second = db.replica_for_request(app)
+        with app.test_request_context(method='POST'):
+            self.assertIsNone(db.replica_for_request(app))
+
+        self.assertNotEqual(first.url, second.url)
+
+    def test_least_loaded(self):
+        app.config['SQLALCHEMY_REPLICA_URIS'] = [REPLICA_URL, REPLICA_URL + "2"]
+        app.config['SQLALCHEMY_REPLICA_STRATEGY'] = 'least_loaded'
+        busy, idle = db.replica_engines(app)
+
+        try:
+            with busy.connect():
+                with app.test_request_context():
+                    chosen = db.replica_for_request(app)
+        finally:
+            app.config['SQLALCHEMY_REPLICA_STRATEGY'] = 'round_robin'
+
+        if callable(getattr(busy.pool, 'checkedout', None)):
+            self.assertIs(chosen, idle)
+        self.assertIn(chosen, (busy, idle))
@@ -0,0 +1,119 @@
+"""User search tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_search.py
+
+
+import os
+from datetime import datetime
+from unittest import TestCase
+
+from models import db, User
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app
+from pagination import PER_PAGE
+import search
+
+db.create_all()
+
+
+class NgramIndexTestCase(TestCase):
+    """Test the in-process trigram index."""
+
+    def setUp(self):
+        User.query.delete()
+        for username in ["warbler", "warble", "marble", "bird"]:
+            db.session.add(User(email=f"{username}@test.com",
+                                username=username,
+                                password="HASHED_PASSWORD"))
+        db.session.commit()
+
+        self.index = search.NgramIndex()
+
+    def usernames(self, ids):
+        return {u.username for u in User.query.filter(User.id.in_(ids))}
+
+    def test_substring(self):
+        self.assertEqual(self.usernames(self.index.candidates("arbl")),
+                         {"warbler", "warble", "marble"})
+
+    def test_short_term(self):
+        self.assertEqual(self.usernames(self.index.candidates("bi")),
+                         {"bird"})
+
+    def test_rename_and_remove(self):
+        bird = User.query.filter_by(username="bird").one()
+        self.index.candidates("x")
+
+        self.index.add(bird.id, "marbled")
+        self.assertIn(bird.id, self.index.candidates("marb"))
+
+        self.index.remove(bird.id)
+        self.assertNotIn(bird.id, self.index.candidates("marb"))
+
+    def test_rebuilt_when_old(self):
+        """Renames and deletes by other workers show up after a rebuild."""
+
+        self.index.candidates("x")
+        bird = User.query.filter_by(username="bird").one()
+        bird.username = "sparrow"
+        User.query.filter_by(username="marble").one().deleted_at = (
+            datetime.utcnow())
+        db.session.commit()
+
+        self.assertEqual(self.usernames(self.index.candidates("arbl")),
+                         {"warbler", "warble", "marble"})
+
+        self.index.max_age = 0
+        self.assertEqual(self.usernames(self.index.candidates("arbl")),
+                         {"warbler", "warble"})
+        self.assertEqual(self.index.candidates("sparrow"), [bird.id])
+
+
+class SearchRankingTestCase(TestCase):
+    """Test result ranking."""
+
+    def setUp(self):
+        User.query.delete()
+        search.ngram_index.clear()
+
+        for username, followers in [("xbird", 50), ("birdy", 0),
+                                    ("bird", 0), ("birdie", 9)]:
+            db.session.add(User(email=f"{username}@test.com",
+                                username=username,
+                                password="HASHED_PASSWORD",
+                                followers_count=followers))
+        db.session.commit()
+
+    def test_rank_order(self):
+        with app.test_request_context("/users?q=bird"):
+            page = search.search_page("bird")
+
+        self.assertEqual([u.username for u in page.items],
+                         ["bird", "birdie", "birdy", "xbird"])
+
+    def test_pages_through_ties(self):
+        """Users with the same rank and follower count page by id."""
+
+        for i in range(PER_PAGE + 1):
+            db.session.add(User(email=f"tie{i}@test.com",
+                                username=f"birdtie{i}",
+                                password="HASHED_PASSWORD"))
+        db.session.commit()
+
+        seen, url = [], "/users?q=birdtie"
+        while url:
+            with app.test_request_context(url):
+                page = search.search_page("birdtie")
+                url = page.older_url if page.has_older else None
+            seen.extend(u.username for u in page.items)
+
+        self.assertEqual(sorted(seen),
+                         sorted(f"birdtie{i}" for i in range(PER_PAGE + 1)))
+
+    def test_typeahead(self):
+        self.assertEqual([username for _, username, _ in search.typeahead("bir")],
+                         ["birdie", "birdy", "bird"])
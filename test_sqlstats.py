@@ -0,0 +1,98 @@
+"""Per-request SQL statistics tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_sqlstats.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app, CURR_USER_KEY
+import current_user
+import sqlstats
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class ShapeTestCase(TestCase):
+    """Test grouping statements by shape."""
+
+    def test_literals_and_lists(self):
+        self.assertEqual(
+            sqlstats.shape("SELECT * FROM users WHERE id = 12 AND name = 'x'"),
+            sqlstats.shape("SELECT * FROM users WHERE id = 7 AND name = 'y'"))
+        self.assertEqual(
+            sqlstats.shape("SELECT * FROM users WHERE id IN (%s, %s, %s)"),
+            "SELECT * FROM users WHERE id IN (?)")
+
+    def test_repeated(self):
+        stats = sqlstats.RequestStats()
+        for i in range(sqlstats.REPEAT_THRESHOLD):
+            stats.record(f"SELECT * FROM messages WHERE user_id = {i}", 0.001)
+        stats.record("SELECT * FROM users", 0.01)
+
+        self.assertEqual(stats.count, sqlstats.REPEAT_THRESHOLD + 1)
+        self.assertEqual(stats.slowest(1)[0][0], "SELECT * FROM users")
+        self.assertEqual(stats.repeated(),
+                         [("SELECT * FROM messages WHERE user_id = ?",
+                           sqlstats.REPEAT_THRESHOLD)])
+
+
+class RequestStatsTestCase(TestCase):
+    """Test the headers and log line for sampled requests."""
+
+    def setUp(self):
+        Message.query.delete()
+        User.query.delete()
+        current_user.snapshots.clear()
+
+        self.user = User.signup("testuser", "test@test.com", "password", None)
+        db.session.commit()
+
+        app.config['SQL_STATS_SAMPLE_RATE'] = 1.0
+        app.config['SQL_STATS_HEADERS'] = True
+        self.client = app.test_client()
+
+    def tearDown(self):
+        app.config['SQL_STATS_SAMPLE_RATE'] = 0.0
+        app.config['SQL_STATS_HEADERS'] = False
+
+    def test_headers(self):
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.user.id
+
+        resp = self.client.get(f"/users/{self.user.id}")
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertGreater(int(resp.headers['X-SQL-Queries']), 0)
+        self.assertIn("db;dur=", resp.headers['Server-Timing'])
+        self.assertNotIn('X-SQL-Repeated', resp.headers)
+
+    def test_not_sampled(self):
+        app.config['SQL_STATS_SAMPLE_RATE'] = 0.0
+
+        resp = self.client.get(f"/users/{self.user.id}")
+
+        self.assertNotIn('X-SQL-Queries', resp.headers)
+
+    def test_logs_repeated_statements(self):
+        @app.route('/_test_n_plus_one')
+        def n_plus_one():
+            for _ in range(sqlstats.REPEAT_THRESHOLD):
+                User.query.get(self.user.id)
+                db.session.expire_all()
+            return "ok"
+
+        with self.assertLogs(app.logger, 'WARNING') as logs:
+            resp = self.client.get('/_test_n_plus_one')
+
+        self.assertEqual(resp.headers['X-SQL-Repeated'],
+                         str(sqlstats.REPEAT_THRESHOLD))
+        self.assertIn('"repeated": [{"count"', logs.output[0])
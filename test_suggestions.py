@@ -0,0 +1,129 @@
+"""Follow suggestion tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_suggestions.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Follows, Suggestion, TimelineEntry
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app, CURR_USER_KEY
+import current_user
+import follows
+import suggestions
+from suggestions import Graph
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class RecommendTestCase(TestCase):
+    """Test scoring on an in-memory graph."""
+
+    def setUp(self):
+        # 1 follows 2 and 3, who both follow 4; 5 is followed by 2 and 6
+        self.graph = Graph.from_edges(range(1, 7), [
+            (1, 2), (1, 3), (2, 4), (3, 4), (2, 5), (6, 5), (6, 2),
+        ])
+
+    def suggested_ids(self, user_id, k=10):
+        graph = self.graph
+        return [graph.ids[c]
+                for c, _ in suggestions.recommend(graph, graph.index[user_id],
+                                                  k)]
+
+    def test_adjacency(self):
+        graph = self.graph
+
+        self.assertEqual(graph.edge_count, 7)
+        self.assertEqual(
+            sorted(graph.ids[c] for c in graph.following(graph.index[2])),
+            [4, 5])
+        self.assertEqual(graph.followers[graph.index[5]], 2)
+
+    def test_friends_of_friends_first(self):
+        suggested = self.suggested_ids(1)
+
+        self.assertEqual(suggested[:2], [4, 5])
+        self.assertNotIn(1, suggested)
+        self.assertNotIn(2, suggested)
+        self.assertNotIn(3, suggested)
+
+    def test_popular_for_newcomers(self):
+        # 4 follows nobody; the most followed accounts fill the list
+        self.assertEqual(self.suggested_ids(4, k=2), [2, 5])
+
+    def test_workers_agree(self):
+        serial = dict(suggestions.compute(self.graph, workers=1))
+        pooled = dict(suggestions.compute(self.graph, workers=2))
+
+        self.assertEqual(serial, pooled)
+        self.assertEqual(len(serial), 6)
+
+
+class RefreshTestCase(TestCase):
+    """Test the batch job and the read endpoint."""
+
+    def setUp(self):
+        Suggestion.query.delete()
+        TimelineEntry.query.delete()
+        Follows.query.delete()
+        User.query.delete()
+        current_user.snapshots.clear()
+
+        users = [User(email=f"u{i}@test.com", username=f"user{i}",
+                      password="HASHED_PASSWORD") for i in range(4)]
+        db.session.add_all(users)
+        db.session.commit()
+        self.ids = [u.id for u in users]
+
+        follows.follow(self.ids[0], self.ids[1])
+        follows.follow(self.ids[1], self.ids[2])
+        follows.follow(self.ids[3], self.ids[2])
+        db.session.commit()
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.ids[0]
+
+    def suggested_ids(self, user_id):
+        return [s.suggested_id for s in
+                Suggestion.query.filter_by(user_id=user_id)
+                                .order_by(Suggestion.rank)]
+
+    def test_full_refresh(self):
+        self.assertEqual(suggestions.refresh(full=True), 4)
+
+        self.assertEqual(self.suggested_ids(self.ids[0])[0], self.ids[2])
+        self.assertEqual(suggestions.stale_user_ids(), [])
+
+    def test_incremental_refresh(self):
+        suggestions.refresh(full=True)
+
+        follows.follow(self.ids[0], self.ids[2])
+        db.session.commit()
+        self.assertEqual(suggestions.stale_user_ids(), [self.ids[0]])
+
+        self.assertEqual(suggestions.refresh(), 1)
+        self.assertNotIn(self.ids[2], self.suggested_ids(self.ids[0]))
+        self.assertEqual(suggestions.refresh(), 0)
+
+    def test_endpoint(self):
+        suggestions.refresh(full=True)
+
+        resp = self.client.get("/api/v1/suggestions?fields=id,username")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json['data'][0],
+                         dict(id=self.ids[2], username="user2"))
+
+        # followed since the job ran
+        follows.follow(self.ids[0], self.ids[2])
+        db.session.commit()
+        resp = self.client.get("/api/v1/suggestions?fields=id")
+        self.assertNotIn(dict(id=self.ids[2]), resp.json['data'])
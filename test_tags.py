@@ -0,0 +1,140 @@
+"""Hashtag and mention tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_tags.py
+
+
+import os
+import re
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from models import (db, User, Message, Mention, MessageTag, TimelineEntry,
+                    Job)
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app, CURR_USER_KEY
+import current_user
+import jobs
+from pagination import PER_PAGE
+import tags
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class ExtractTestCase(TestCase):
+    """Test pulling tags and mentions out of text."""
+
+    def test_hashtags(self):
+        self.assertEqual(
+            tags.hashtags("#Flask and #flask, #py3! a#b ##x &#39; #" + "x" * 51),
+            {"flask", "py3"})
+
+    def test_mentions(self):
+        self.assertEqual(
+            tags.mentioned_usernames("hi @alice, @bob_2! mail me@example.com"),
+            {"alice", "bob_2"})
+
+    def test_normalize(self):
+        self.assertEqual(tags.normalize("#Python"), "python")
+
+
+class PostingTestCase(TestCase):
+    """Test writing postings and reading tag and mention feeds."""
+
+    def setUp(self):
+        for model in (Job, MessageTag, Mention, TimelineEntry, Message, User):
+            model.query.delete()
+        db.session.commit()
+        current_user.snapshots.clear()
+
+        users = [User(email=f"{name}@test.com", username=name,
+                      password="HASHED_PASSWORD")
+                 for name in ("alice", "bob")]
+        db.session.add_all(users)
+        db.session.commit()
+        self.alice_id, self.bob_id = [u.id for u in users]
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.alice_id
+
+    def post(self, text):
+        self.client.post("/messages/new", data={"text": text})
+        return Message.query.order_by(Message.id.desc()).first().id
+
+    def test_posting_writes_postings(self):
+        msg_id = self.post("hey @bob and @nobody, see #Flask #flask")
+
+        self.assertEqual([(t.tag, t.message_id) for t in MessageTag.query],
+                         [("flask", msg_id)])
+        self.assertEqual([(m.user_id, m.message_id) for m in Mention.query],
+                         [(self.bob_id, msg_id)])
+
+    def test_tag_feed(self):
+        self.post("#python is neat")
+        self.post("nothing to see")
+        self.post("more #Python")
+
+        resp = self.client.get("/tags/PYTHON")
+        html = resp.get_data(as_text=True)
+        self.assertEqual(resp.status_code, 200)
+        self.assertLess(html.index("more #Python"), html.index("#python is neat"))
+        self.assertNotIn("nothing to see", html)
+
+        self.assertIn("No messages with #unknown",
+                      self.client.get("/tags/unknown").get_data(as_text=True))
+
+    def test_mentions_feed_pages(self):
+        start = datetime(2025, 1, 1)
+        messages = [Message(text=f"@bob number {i}.", user_id=self.alice_id,
+                            timestamp=start + timedelta(minutes=i))
+                    for i in range(PER_PAGE + 1)]
+        db.session.add_all(messages)
+        db.session.flush()
+        tags.index_messages(messages)
+        db.session.commit()
+
+        html = self.client.get(f"/users/{self.bob_id}/mentions").get_data(
+            as_text=True)
+        self.assertIn(f"@bob number {PER_PAGE}.", html)
+        self.assertNotIn("@bob number 0.", html)
+
+        older = re.search(r'href="([^"]*before=[^"]*)"', html).group(1)
+        html = self.client.get(older).get_data(as_text=True)
+        self.assertIn("@bob number 0.", html)
+        self.assertNotIn("@bob number 1.", html)
+
+        self.assertEqual(
+            self.client.get(f"/users/{self.alice_id}/mentions").status_code,
+            200)
+        self.assertEqual(self.client.get("/users/0/mentions").status_code, 404)
+
+    def test_backfill(self):
+        msg = Message(text="old #news for @alice", user_id=self.bob_id)
+        db.session.add(msg)
+        db.session.commit()
+
+        self.assertEqual(list(tags.backfill()), [(msg.id, 2)])
+        # rerunning replaces rather than duplicates
+        self.assertEqual(list(tags.backfill()), [(msg.id, 2)])
+        self.assertEqual(MessageTag.query.count(), 1)
+        self.assertEqual(Mention.query.count(), 1)
+        self.assertEqual(list(tags.backfill(after_id=msg.id)), [])
+
+    def test_deleted_message_purged(self):
+        msg_id = self.post("#gone @bob")
+        self.client.post(f"/messages/{msg_id}/delete")
+
+        self.assertNotIn("#gone @bob",
+                         self.client.get("/tags/gone").get_data(as_text=True))
+
+        with app.app_context():
+            jobs.work(burst=True)
+
+        self.assertEqual(MessageTag.query.count(), 0)
+        self.assertEqual(Mention.query.count(), 0)
@@ -0,0 +1,138 @@
+"""Home timeline tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_timeline.py
+
+
+import os
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from models import db, User, Message, Follows, TimelineEntry
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app
+import counters
+from pagination import PER_PAGE
+import timeline
+
+db.create_all()
+
+
+class TimelineTestCase(TestCase):
+    """Test fan-out, backfill and trim of materialized timelines."""
+
+    def setUp(self):
+        """Create two users, one following the other."""
+
+        TimelineEntry.query.delete()
+        Follows.query.delete()
+        Message.query.delete()
+        User.query.delete()
+
+        self.reader = User(email="r@test.com", username="reader",
+                           password="HASHED_PASSWORD")
+        self.author = User(email="a@test.com", username="author",
+                           password="HASHED_PASSWORD")
+        db.session.add_all([self.reader, self.author])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.rollback()
+        timeline.FANOUT_FOLLOWER_LIMIT = 10000
+
+    def post(self, text):
+        msg = Message(text=text, user_id=self.author.id)
+        db.session.add(msg)
+        db.session.flush()
+        timeline.fan_out_message(msg)
+        db.session.commit()
+        return msg
+
+    def follow(self):
+        db.session.add(Follows(user_being_followed_id=self.author.id,
+                               user_following_id=self.reader.id))
+        db.session.flush()
+        counters.followed(self.reader.id, self.author.id)
+        timeline.backfill_follow(self.reader.id, self.author.id)
+        db.session.commit()
+
+    def test_fan_out_on_post(self):
+        self.follow()
+        msg = self.post("hello")
+
+        self.assertEqual(timeline.home_timeline(self.reader.id).items, [msg])
+
+    def test_backfill_and_unfollow(self):
+        msg = self.post("before the follow")
+        self.follow()
+
+        self.assertEqual(timeline.home_timeline(self.reader.id).items, [msg])
+
+        Follows.query.delete()
+        timeline.trim_unfollow(self.reader.id, self.author.id)
+        db.session.commit()
+
+        self.assertEqual(timeline.home_timeline(self.reader.id).items, [])
+
+    def test_trim(self):
+        self.follow()
+        msgs = [self.post(f"msg {i}") for i in range(5)]
+
+        timeline.trim(self.reader.id, length=2)
+        db.session.commit()
+
+        self.assertEqual(TimelineEntry.query.count(), 2)
+        # the trimmed messages are still read, just not from entries
+        self.assertEqual(timeline.home_timeline(self.reader.id).items,
+                         msgs[::-1])
+
+    def test_trim_all(self):
+        self.follow()
+        msgs = [self.post(f"msg {i}") for i in range(5)]
+
+        self.assertEqual(timeline.trim_all(length=2), 3)
+        db.session.commit()
+
+        self.assertEqual({e.message_id for e in TimelineEntry.query},
+                         {m.id for m in msgs[-2:]})
+
+    def test_pages_past_materialized_entries(self):
+        self.follow()
+        start = datetime(2025, 1, 1)
+        db.session.add_all([
+            Message(text=f"msg {i}", user_id=self.author.id,
+                    timestamp=start + timedelta(minutes=i))
+            for i in range(timeline.HOME_TIMELINE_LENGTH + 50)])
+        db.session.commit()
+        timeline.rebuild(self.reader.id)
+        db.session.commit()
+        self.assertEqual(TimelineEntry.query.count(),
+                         timeline.HOME_TIMELINE_LENGTH)
+
+        seen = []
+        page = timeline.home_timeline(self.reader.id)
+        while True:
+            seen.extend(page.items)
+            if not page.has_older:
+                break
+            page = timeline.home_timeline(
+                self.reader.id, before=(seen[-1].timestamp, seen[-1].id))
+        self.assertEqual([m.text for m in seen],
+                         [f"msg {i}" for i in reversed(range(150))])
+
+        # and back again from the oldest page
+        oldest = seen[-1]
+        page = timeline.home_timeline(
+            self.reader.id, after=(oldest.timestamp, oldest.id))
+        self.assertEqual(page.items, seen[-PER_PAGE - 1:-1])
+
+    def test_high_follower_author_merged_at_read(self):
+        timeline.FANOUT_FOLLOWER_LIMIT = 1
+        self.follow()
+        msg = self.post("from a big account")
+
+        self.assertEqual(TimelineEntry.query.count(), 0)
+        self.assertEqual(timeline.home_timeline(self.reader.id).items, [msg])
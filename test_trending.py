@@ -0,0 +1,175 @@
+"""Trending message tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_trending.py
+
+
+import os
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from models import (db, User, Message, Like, LikeBucket, TrendingPeriod,
+                    TrendingScore, TimelineEntry, Job)
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app, CURR_USER_KEY
+import current_user
+import likes
+import trending
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+NOW = datetime(2025, 6, 1, 12, 0)
+
+
+class TrendingTestCase(TestCase):
+    """Test like buckets, scoring and the trending page."""
+
+    def setUp(self):
+        for model in (TrendingPeriod, TrendingScore, LikeBucket, Job,
+                      TimelineEntry, Like, Message, User):
+            model.query.delete()
+        db.session.commit()
+        current_user.snapshots.clear()
+
+        user = User(email="test@test.com", username="testuser",
+                    password="HASHED_PASSWORD")
+        db.session.add(user)
+        db.session.commit()
+        self.user_id = user.id
+
+        messages = [Message(text=f"msg {i}", user_id=user.id)
+                    for i in range(3)]
+        db.session.add_all(messages)
+        db.session.commit()
+        self.msg_ids = [m.id for m in messages]
+
+        self.client = app.test_client()
+
+    def add_likes(self, message_id, ago, likes=1):
+        db.session.add(LikeBucket(message_id=message_id,
+                                  bucket_start=trending.bucket_start(NOW - ago),
+                                  likes=likes))
+        db.session.commit()
+
+    def scores(self, period):
+        return {row.message_id: (row.likes, row.score)
+                for row in TrendingScore.query.filter_by(period=period)}
+
+    def ranking(self, period):
+        return [m.id for m in trending.ranked(Message.query, period)]
+
+    def test_count_likes(self):
+        msg_id = self.msg_ids[0]
+        likes.like(self.user_id, msg_id)
+        likes.like(self.user_id, msg_id)
+        db.session.commit()
+
+        self.assertEqual(LikeBucket.query.one().likes, 1)
+
+        likes.unlike(self.user_id, msg_id)
+        db.session.commit()
+
+        self.assertEqual(LikeBucket.query.one().likes, 0)
+
+    def test_recent_likes_count_more(self):
+        old, recent, _ = self.msg_ids
+        self.add_likes(old, timedelta(hours=20), likes=3)
+        self.add_likes(recent, timedelta(minutes=10))
+
+        trending.refresh(NOW)
+
+        self.assertEqual(self.ranking('hour'), [recent])
+        self.assertEqual(self.ranking('day'), [recent, old])
+        self.assertEqual(self.scores('day')[old][0], 3)
+
+    def test_incremental_matches_full(self):
+        a, b, c = self.msg_ids
+        self.add_likes(a, timedelta(hours=30), likes=4)
+        self.add_likes(a, timedelta(hours=2))
+        self.add_likes(b, timedelta(hours=23), likes=2)
+        self.add_likes(c, timedelta(hours=-3))
+        self.add_likes(a, timedelta(hours=-5), likes=-1)
+
+        for hours in range(0, 12, 3):
+            trending.refresh(NOW + timedelta(hours=hours))
+        incremental = {period: self.scores(period)
+                       for period in trending.PERIODS}
+
+        TrendingPeriod.query.delete()
+        db.session.commit()
+        trending.refresh(NOW + timedelta(hours=9))
+
+        for period in trending.PERIODS:
+            full = self.scores(period)
+            self.assertEqual(incremental[period].keys(), full.keys())
+            for message_id, (likes_in_period, score) in full.items():
+                self.assertEqual(incremental[period][message_id][0],
+                                 likes_in_period)
+                self.assertAlmostEqual(incremental[period][message_id][1],
+                                       score)
+
+        # b's likes left the day; c's like arrived
+        self.assertEqual(self.scores('day').keys(), {a, c})
+
+    def test_expired_scores_dropped(self):
+        msg_id = self.msg_ids[0]
+        self.add_likes(msg_id, timedelta(minutes=30))
+
+        trending.refresh(NOW)
+        self.assertEqual(self.ranking('hour'), [msg_id])
+
+        trending.refresh(NOW + timedelta(hours=1))
+        self.assertEqual(self.ranking('hour'), [])
+        self.assertEqual(self.scores('hour'), {})
+        self.assertEqual(self.ranking('day'), [msg_id])
+
+    def test_prune_buckets(self):
+        self.add_likes(self.msg_ids[0], timedelta(days=8))
+        self.add_likes(self.msg_ids[1], timedelta(days=1))
+
+        trending.refresh(NOW)
+
+        self.assertEqual([b.message_id for b in LikeBucket.query],
+                         [self.msg_ids[1]])
+
+    def test_trending_page(self):
+        msg_id = self.msg_ids[1]
+        self.add_likes(msg_id, timedelta(minutes=10))
+        trending.refresh(NOW)
+
+        resp = self.client.get("/trending?period=hour")
+        html = resp.get_data(as_text=True)
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("msg 1", html)
+        self.assertNotIn("msg 0", html)
+
+        self.assertEqual(self.client.get("/trending?period=year").status_code,
+                         404)
+
+    def test_trending_api(self):
+        msg_id = self.msg_ids[2]
+        self.add_likes(msg_id, timedelta(minutes=10))
+        trending.refresh(NOW)
+
+        resp = self.client.get("/api/v1/trending?period=week&fields=id")
+        self.assertEqual(resp.json['data'], [{'id': msg_id}])
+
+        resp = self.client.get("/api/v1/trending?period=year")
+        self.assertEqual(resp.status_code, 400)
+
+    def test_deleted_message_hidden(self):
+        msg_id = self.msg_ids[0]
+        self.add_likes(msg_id, timedelta(minutes=10))
+        trending.refresh(NOW)
+
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.user_id
+        self.client.post(f"/messages/{msg_id}/delete")
+
+        resp = self.client.get("/api/v1/trending?fields=id")
+        self.assertEqual(resp.json['data'], [])
@@ -53,5 +53,5 @@ class UserModelTestCase(TestCase):
         db.session.commit()
 
         # User should have no messages & no followers
-        self.assertEqual(len(u.messages), 0)
-        self.assertEqual(len(u.followers), 0)
+        self.assertEqual(u.messages.count(), 0)
+        self.assertEqual(u.followers.count(), 0)
@@ -0,0 +1,70 @@
+"""Viewer context tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_viewer.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Message, Follows, Like
+
+os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
+
+from app import app
+from viewer import ViewerContext
+
+db.create_all()
+
+
+class ViewerContextTestCase(TestCase):
+    """Test batched liked / following lookups."""
+
+    def setUp(self):
+        """Viewer follows the author and likes one of two messages."""
+
+        Like.query.delete()
+        Follows.query.delete()
+        Message.query.delete()
+        User.query.delete()
+
+        self.viewer = User(email="v@test.com", username="viewer",
+                           password="HASHED_PASSWORD")
+        self.author = User(email="a@test.com", username="author",
+                           password="HASHED_PASSWORD")
+        db.session.add_all([self.viewer, self.author])
+        db.session.commit()
+
+        self.liked = Message(text="liked", user_id=self.author.id)
+        self.other = Message(text="not liked", user_id=self.author.id)
+        db.session.add_all([self.liked, self.other])
+        db.session.commit()
+
+        db.session.add(Like(user_liked_id=self.viewer.id,
+                            msg_id=self.liked.id))
+        db.session.add(Follows(user_being_followed_id=self.author.id,
+                               user_following_id=self.viewer.id))
+        db.session.commit()
+
+    def test_loaded_page(self):
+        ctx = ViewerContext(self.viewer.id)
+        ctx.load(messages=[self.liked, self.other])
+
+        self.assertTrue(ctx.has_liked(self.liked))
+        self.assertFalse(ctx.has_liked(self.other))
+        self.assertTrue(ctx.is_following(self.author))
+        self.assertFalse(ctx.is_following(self.viewer))
+
+    def test_unloaded_falls_back_to_lookup(self):
+        ctx = ViewerContext(self.viewer.id)
+
+        self.assertTrue(ctx.has_liked(self.liked))
+        self.assertTrue(ctx.is_following(self.author))
+
+    def test_anonymous(self):
+        ctx = ViewerContext()
+        ctx.load(messages=[self.liked])
+
+        self.assertFalse(ctx.has_liked(self.liked))
+        self.assertFalse(ctx.is_following(self.author))
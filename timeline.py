@@ -0,0 +1,347 @@
+"""Materialized home timelines for Warbler.
+
+Every user has a list of `TimelineEntry` rows holding the newest messages of
+the people they follow. The rows are written when a message is posted
+(fan-out-on-write) and when someone follows an author (backfill), and removed
+when an author is unfollowed, or in the background (purge.py) when a
+message is deleted.
+
+Authors with a very large following are not fanned out -- writing one row per
+follower for every message they post would be too expensive. Their messages
+are merged into the timeline when it is read instead (hybrid mode).
+
+The entries only hold the newest part of a timeline: backfills and
+`flask trim-timelines` cut each one to HOME_TIMELINE_LENGTH, and fan-out
+adds to it in between. Pages past the oldest entry are read from the
+followed authors' messages instead, so a user can scroll back as far as
+those go whatever the length of their materialized timeline.
+"""
+
+import heapq
+
+from sqlalchemy import and_, exists, func, or_, select, tuple_
+
+from models import db, Follows, Message, TimelineEntry, User
+from loading import message_query
+from pagination import PER_PAGE, keyset_filter, keyset_query, make_page
+
+# how many entries each timeline keeps after a backfill or trim
+HOME_TIMELINE_LENGTH = 100
+
+# authors with at least this many followers are merged in at read time
+FANOUT_FOLLOWER_LIMIT = 10000
+
+
+def is_fanout_author(user_id):
+    """Should messages by `user_id` be written into followers' timelines?"""
+
+    (followers_count,) = (db.session
+                          .query(User.followers_count)
+                          .filter(User.id == user_id)
+                          .one())
+
+    return followers_count < FANOUT_FOLLOWER_LIMIT
+
+
+def read_time_authors(user_id):
+    """Ids of the high-follower authors that `user_id` follows."""
+
+    rows = (db.session
+            .query(User.id)
+            .join(Follows, Follows.user_being_followed_id == User.id)
+            .filter(Follows.user_following_id == user_id,
+                    User.followers_count >= FANOUT_FOLLOWER_LIMIT)
+            .all())
+
+    return [author_id for (author_id,) in rows]
+
+
+def fan_out_message(message):
+    """Copy a newly-created message into each follower's timeline.
+
+    `message` must already be flushed so it has an id and timestamp.
+    """
+
+    if not is_fanout_author(message.user_id):
+        return
+
+    followers = select([
+        Follows.user_following_id,
+        db.literal(message.id),
+        db.literal(message.user_id),
+        db.literal(message.timestamp),
+    ]).where(Follows.user_being_followed_id == message.user_id)
+
+    db.session.execute(
+        TimelineEntry.__table__.insert().from_select(
+            ['user_id', 'message_id', 'author_id', 'timestamp'], followers))
+
+
+def backfill_follow(follower_id, followed_id):
+    """Add the newest messages of `followed_id` to `follower_id`'s timeline."""
+
+    backfill_follows(follower_id, [followed_id])
+
+
+def backfill_follows(follower_id, followed_ids):
+    """Add the newest messages of several new followees in one statement.
+
+    Only the newest HOME_TIMELINE_LENGTH across all of them can survive the
+    trim, so that's all that is inserted.
+    """
+
+    if not followed_ids:
+        return
+
+    already_there = exists().where(and_(
+        TimelineEntry.user_id == follower_id,
+        TimelineEntry.message_id == Message.id,
+    ))
+
+    recent = (select([
+                db.literal(follower_id),
+                Message.id,
+                Message.user_id,
+                Message.timestamp,
+              ])
+              .select_from(Message.__table__.join(
+                  User.__table__, User.id == Message.user_id))
+              .where(and_(Message.user_id.in_(followed_ids),
+                          User.followers_count < FANOUT_FOLLOWER_LIMIT,
+                          ~already_there))
+              .order_by(Message.timestamp.desc(), Message.id.desc())
+              .limit(HOME_TIMELINE_LENGTH))
+
+    inserted = db.session.execute(
+        TimelineEntry.__table__.insert().from_select(
+            ['user_id', 'message_id', 'author_id', 'timestamp'], recent))
+
+    if inserted.rowcount:
+        trim(follower_id)
+
+
+def trim_unfollow(follower_id, followed_id):
+    """Drop everything by `followed_id` from `follower_id`'s timeline."""
+
+    trim_unfollows(follower_id, [followed_id])
+
+
+def trim_unfollows(follower_id, followed_ids):
+    """Drop everything by any of `followed_ids` from the timeline."""
+
+    if not followed_ids:
+        return
+
+    (TimelineEntry
+        .query
+        .filter(TimelineEntry.user_id == follower_id,
+                TimelineEntry.author_id.in_(followed_ids))
+        .delete(synchronize_session=False))
+
+
+def trim(user_id, length=HOME_TIMELINE_LENGTH):
+    """Delete entries beyond the newest `length` in `user_id`'s timeline."""
+
+    cutoff = (db.session
+              .query(TimelineEntry.timestamp, TimelineEntry.message_id)
+              .filter(TimelineEntry.user_id == user_id)
+              .order_by(TimelineEntry.timestamp.desc(),
+                        TimelineEntry.message_id.desc())
+              .offset(length - 1)
+              .first())
+
+    if cutoff is None:
+        return
+
+    timestamp, message_id = cutoff
+
+    (TimelineEntry
+        .query
+        .filter(TimelineEntry.user_id == user_id,
+                or_(TimelineEntry.timestamp < timestamp,
+                    and_(TimelineEntry.timestamp == timestamp,
+                         TimelineEntry.message_id < message_id)))
+        .delete(synchronize_session=False))
+
+
+def trim_all(length=HOME_TIMELINE_LENGTH):
+    """Trim every timeline to its newest `length` entries in one statement.
+
+    Fan-out doesn't trim, so timelines grow between runs. Returns how many
+    entries were deleted.
+    """
+
+    newest_first = func.row_number().over(
+        partition_by=TimelineEntry.user_id,
+        order_by=(TimelineEntry.timestamp.desc(),
+                  TimelineEntry.message_id.desc()),
+    )
+
+    ranked = (select([TimelineEntry.user_id,
+                      TimelineEntry.message_id,
+                      newest_first.label('position')])
+              .alias('ranked'))
+
+    beyond = (select([ranked.c.user_id, ranked.c.message_id])
+              .where(ranked.c.position > length))
+
+    return (TimelineEntry
+              .query
+              .filter(tuple_(TimelineEntry.user_id,
+                             TimelineEntry.message_id).in_(beyond))
+              .delete(synchronize_session=False))
+
+
+def rebuild(user_id):
+    """Throw away and recompute `user_id`'s timeline from the follows table."""
+
+    (TimelineEntry
+        .query
+        .filter(TimelineEntry.user_id == user_id)
+        .delete(synchronize_session=False))
+
+    followed_ids = [followed_id for (followed_id,) in (
+        db.session
+          .query(Follows.user_being_followed_id)
+          .filter(Follows.user_following_id == user_id))]
+
+    backfill_follows(user_id, followed_ids)
+
+
+def rebuild_all():
+    """Recompute every timeline in one set-based statement.
+
+    Used after bulk loads; follower counts must be up to date first.
+    """
+
+    TimelineEntry.query.delete(synchronize_session=False)
+
+    newest_first = func.row_number().over(
+        partition_by=Follows.user_following_id,
+        order_by=(Message.timestamp.desc(), Message.id.desc()),
+    )
+
+    ranked = (select([
+                Follows.user_following_id.label('user_id'),
+                Message.id.label('message_id'),
+                Message.user_id.label('author_id'),
+                Message.timestamp.label('timestamp'),
+                newest_first.label('position'),
+              ])
+              .select_from(Follows
+                           .__table__
+                           .join(Message.__table__,
+                                 Message.user_id == Follows.user_being_followed_id)
+                           .join(User.__table__,
+                                 User.id == Follows.user_being_followed_id))
+              .where(User.followers_count < FANOUT_FOLLOWER_LIMIT)
+              .alias('ranked'))
+
+    newest = (select([ranked.c.user_id, ranked.c.message_id,
+                      ranked.c.author_id, ranked.c.timestamp])
+              .where(ranked.c.position <= HOME_TIMELINE_LENGTH))
+
+    db.session.execute(
+        TimelineEntry.__table__.insert().from_select(
+            ['user_id', 'message_id', 'author_id', 'timestamp'], newest))
+
+
+def home_timeline(user_id, before=None, after=None, per_page=PER_PAGE,
+                  messages=None, key=None):
+    """One page of `user_id`'s home timeline, newest first.
+
+    Reads the materialized entries (one indexed range scan), continues
+    with the followed authors' messages older than the oldest entry once
+    those run out, then merges in messages from any high-follower authors
+    the user follows. `before` and `after` are decoded (timestamp, message
+    id) cursors.
+
+    `messages` is the query of messages to page through, by default
+    `message_query('feed')`; pass a column query to get rows instead of
+    Message objects, along with `key(row)` returning (timestamp, id).
+    """
+
+    if messages is None:
+        messages = message_query('feed')
+    if key is None:
+        key = lambda msg: (msg.timestamp, msg.id)
+
+    materialized = keyset_query(
+        messages
+            .join(TimelineEntry, TimelineEntry.message_id == Message.id)
+            .filter(TimelineEntry.user_id == user_id),
+        [TimelineEntry.timestamp, TimelineEntry.message_id],
+        before, after, per_page).all()
+
+    rows = materialized
+
+    # past the oldest entry, the page goes on with messages read directly:
+    # an older page gets there if the entries didn't fill it, a newer one
+    # if it starts beyond them
+    if after is not None or len(materialized) <= per_page:
+        horizon = _oldest_entry(user_id)
+        if after is None or horizon is None or after < horizon:
+            rows = _merge(materialized,
+                          _older_than_entries(user_id, horizon, messages,
+                                              before, after, per_page),
+                          key, newest_first=after is None,
+                          limit=per_page + 1)
+
+    read_time = read_time_authors(user_id)
+    if read_time:
+        merged_in = keyset_query(
+            messages.filter(Message.user_id.in_(read_time)),
+            [Message.timestamp, Message.id],
+            before, after, per_page).all()
+        rows = _merge(rows, merged_in, key,
+                      newest_first=after is None, limit=per_page + 1)
+
+    return make_page(rows, key, before, after, per_page)
+
+
+def _oldest_entry(user_id):
+    """(timestamp, message id) of the oldest entry in the timeline, or None."""
+
+    oldest = (db.session
+                .query(TimelineEntry.timestamp, TimelineEntry.message_id)
+                .filter(TimelineEntry.user_id == user_id)
+                .order_by(TimelineEntry.timestamp, TimelineEntry.message_id)
+                .first())
+
+    return tuple(oldest) if oldest is not None else None
+
+
+def _older_than_entries(user_id, horizon, messages, before, after, per_page):
+    """A page of followed authors' messages older than `horizon`.
+
+    `horizon` is the timeline's oldest entry; None if it has none.
+    """
+
+    keys = [Message.timestamp, Message.id]
+    followed = (select([Follows.user_being_followed_id])
+                .where(Follows.user_following_id == user_id))
+
+    messages = messages.filter(Message.user_id.in_(followed))
+    if horizon is not None:
+        messages = messages.filter(keyset_filter(keys, horizon, older=True))
+
+    return keyset_query(messages, keys, before, after, per_page).all()
+
+
+def _merge(first, second, key, newest_first, limit):
+    """Merge two lists of messages sorted by `key`, dropping duplicates."""
+
+    # an author may have crossed the follower limit after their older
+    # messages were fanned out, so the two lists can overlap
+    ordered = heapq.merge(first, second, key=key, reverse=newest_first)
+    seen = set()
+    messages = []
+    for msg in ordered:
+        message_id = key(msg)[1]
+        if message_id not in seen:
+            seen.add(message_id)
+            messages.append(msg)
+        if len(messages) == limit:
+            break
+
+    return messages
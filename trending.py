@@ -0,0 +1,254 @@
+"""Trending messages.
+
+Counting likes per message on every request would aggregate the whole
+likes table, so the ranking is precomputed:
+
+- Each like adds one (and each unlike takes one) from the message's row in
+  like_buckets for the current BUCKET of time, in the same transaction.
+- `flask refresh-trending`, run every BUCKET or so, keeps a score for each
+  message liked in each of the PERIODS in trending_scores: its likes in
+  the period, each worth half as much for every half-life of its age.
+- The trending page and API read the top of a period's scores, one index
+  range scan.
+
+A refresh is incremental. A period's scores are decayed to its
+`refreshed_through` time; moving that forward multiplies every score by the
+decay for the time passed, adds the buckets completed since, and takes out
+the buckets that have left the period. Only those buckets are read.
+
+An unlike counts against the bucket it happens in, not the like's, so a
+message liked and unliked in different buckets nets out over time rather
+than at once. Likes purged with a deleted account stay counted until they
+age out.
+"""
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, bindparam, exists, select
+
+from models import (db, insert_ignoring_duplicates, LikeBucket, Message,
+                    TrendingPeriod, TrendingScore)
+
+# period: (length, half-life)
+PERIODS = {
+    'hour': (timedelta(hours=1), timedelta(minutes=20)),
+    'day': (timedelta(days=1), timedelta(hours=6)),
+    'week': (timedelta(weeks=1), timedelta(days=2)),
+}
+
+DEFAULT_PERIOD = 'day'
+
+BUCKET = timedelta(minutes=5)
+
+# buckets start at multiples of BUCKET from here
+EPOCH = datetime(2000, 1, 1)
+
+# a like is stamped before its transaction commits; a refresh leaves this
+# long for likes in the last bucket to land
+SETTLE = timedelta(seconds=30)
+
+# messages on the trending page
+TRENDING_SIZE = 50
+
+# scores written per statement
+WRITE_BATCH = 1000
+
+
+def bucket_start(when):
+    return when - (when - EPOCH) % BUCKET
+
+
+##############################################################################
+# Counting
+
+
+def count_like(message_id, delta=1):
+    """Count (or with delta=-1, uncount) a like of `message_id` now."""
+
+    start = bucket_start(datetime.utcnow())
+
+    def add():
+        return (LikeBucket
+                .query
+                .filter_by(message_id=message_id, bucket_start=start)
+                .update({LikeBucket.likes: LikeBucket.likes + delta},
+                        synchronize_session=False))
+
+    if add():
+        return
+
+    row = select([db.literal(message_id), db.literal(start, db.DateTime),
+                  db.literal(delta)])
+    if not insert_ignoring_duplicates(
+            LikeBucket.__table__, ['message_id', 'bucket_start', 'likes'],
+            row):
+        # another request started the bucket in the meantime
+        add()
+
+
+##############################################################################
+# Refreshing
+
+
+def bucket_totals(since, until, through, half_life):
+    """{message_id: [likes, score]} over the buckets in [since, until).
+
+    Each bucket's likes are decayed from its start to `through`.
+    """
+
+    totals = defaultdict(lambda: [0, 0.0])
+
+    rows = (db.session
+              .query(LikeBucket.message_id, LikeBucket.bucket_start,
+                     LikeBucket.likes)
+              .filter(LikeBucket.bucket_start >= since,
+                      LikeBucket.bucket_start < until)
+              .all())
+
+    for message_id, start, likes in rows:
+        total = totals[message_id]
+        total[0] += likes
+        total[1] += likes * 0.5 ** ((through - start) / half_life)
+
+    return totals
+
+
+def add_totals(period, totals, sign=1):
+    """Add (or with sign=-1, subtract) `totals` to `period`'s scores."""
+
+    table = TrendingScore.__table__
+    update = (table
+              .update()
+              .where(and_(table.c.period == period,
+                          table.c.message_id == bindparam('b_message_id')))
+              .values(likes=table.c.likes + bindparam('b_likes'),
+                      score=table.c.score + bindparam('b_score')))
+
+    message_ids = list(totals)
+    for start in range(0, len(message_ids), WRITE_BATCH):
+        batch = message_ids[start:start + WRITE_BATCH]
+        scored = {message_id for (message_id,) in db.session
+                  .query(TrendingScore.message_id)
+                  .filter(TrendingScore.period == period,
+                          TrendingScore.message_id.in_(batch))}
+
+        updates = [dict(b_message_id=message_id,
+                        b_likes=sign * totals[message_id][0],
+                        b_score=sign * totals[message_id][1])
+                   for message_id in batch if message_id in scored]
+        inserts = [dict(period=period, message_id=message_id,
+                        likes=sign * totals[message_id][0],
+                        score=sign * totals[message_id][1])
+                   for message_id in batch if message_id not in scored]
+
+        if updates:
+            db.session.execute(update, updates)
+        if inserts:
+            db.session.execute(table.insert(), inserts)
+
+
+def refresh_period(period, now=None):
+    """Bring `period`'s scores up to date; commits.
+
+    Returns how many messages' scores changed.
+    """
+
+    length, half_life = PERIODS[period]
+    through = bucket_start((now or datetime.utcnow()) - SETTLE)
+
+    # one refresh of a period at a time. The row must exist to be locked,
+    # so the first refresh inserts it, as refreshed through EPOCH: long
+    # enough ago to start over. A concurrent first refresh waits on that
+    # insert and then finds the row.
+    insert_ignoring_duplicates(
+        TrendingPeriod.__table__, ['period', 'refreshed_through'],
+        select([db.literal(period), db.literal(EPOCH)]))
+    state = (TrendingPeriod
+             .query
+             .filter_by(period=period)
+             .with_for_update()
+             .one())
+    last = state.refreshed_through
+
+    if through <= last:
+        db.session.commit()
+        return 0
+
+    scores = TrendingScore.query.filter_by(period=period)
+
+    if through - last >= length:
+        # nothing to keep; start over from the buckets in the period
+        scores.delete(synchronize_session=False)
+        last = through - length
+        expired = {}
+    else:
+        decay = 0.5 ** ((through - last) / half_life)
+        scores.update({TrendingScore.score: TrendingScore.score * decay},
+                      synchronize_session=False)
+        expired = bucket_totals(last - length, through - length, through,
+                                half_life)
+        add_totals(period, expired, sign=-1)
+
+    added = bucket_totals(last, through, through, half_life)
+    add_totals(period, added)
+
+    # messages with no likes left in the period
+    in_period = exists().where(and_(
+        LikeBucket.message_id == TrendingScore.message_id,
+        LikeBucket.bucket_start >= through - length,
+        LikeBucket.bucket_start < through))
+    (scores
+        .filter(TrendingScore.likes == 0, ~in_period)
+        .delete(synchronize_session=False))
+
+    state.refreshed_through = through
+    db.session.commit()
+
+    return len(added.keys() | expired.keys())
+
+
+def prune_buckets():
+    """Delete buckets that every period is done with; commits."""
+
+    states = TrendingPeriod.query.all()
+    if len(states) < len(PERIODS):
+        return 0
+
+    oldest = min(state.refreshed_through - PERIODS[state.period][0]
+                 for state in states if state.period in PERIODS)
+    deleted = (LikeBucket
+               .query
+               .filter(LikeBucket.bucket_start < oldest)
+               .delete(synchronize_session=False))
+    db.session.commit()
+
+    return deleted
+
+
+def refresh(now=None):
+    """Refresh every period and drop spent buckets.
+
+    Returns {period: messages rescored}.
+    """
+
+    changed = {period: refresh_period(period, now) for period in PERIODS}
+    prune_buckets()
+    return changed
+
+
+##############################################################################
+# Reading
+
+
+def ranked(messages, period):
+    """Narrow `messages`, a query over Message, to `period`'s trending ones.
+
+    Best first.
+    """
+
+    return (messages
+            .join(TrendingScore, TrendingScore.message_id == Message.id)
+            .filter(TrendingScore.period == period, TrendingScore.score > 0)
+            .order_by(TrendingScore.score.desc(),
+                      TrendingScore.message_id.desc()))
@@ -0,0 +1,96 @@
+"""What the logged-in user's relationship is to the things on a page.
+
+A `ViewerContext` is built once per request. Routes hand it the messages and
+users they are about to render; it fetches, in one query each, which of
+those messages the viewer likes and which of those users the viewer
+follows. Templates then check membership in a set instead of querying (or
+scanning the viewer's likes) once per rendered message.
+
+With GRAPH_INDEX on, following state comes from the in-process graph index
+(graphindex.py) instead, with no query at all.
+"""
+
+from models import db, Follows, Like
+import graphindex
+
+
+class ViewerContext:
+    """Liked / following state of the current viewer for one request."""
+
+    def __init__(self, user_id=None):
+        self.user_id = user_id
+
+        self._liked_ids = set()
+        self._following_ids = set()
+
+        # ids we've already asked the database about
+        self._checked_message_ids = set()
+        self._checked_user_ids = set()
+
+    def load(self, messages=(), users=()):
+        """Fetch liked / following state for `messages` and `users`.
+
+        Authors of `messages` are loaded as users too.
+        """
+
+        if self.user_id is None:
+            return
+
+        messages = list(messages)
+        message_ids = {msg.id for msg in messages}
+        user_ids = ({user.id for user in users} |
+                    {msg.user_id for msg in messages})
+
+        self._load_likes(message_ids - self._checked_message_ids)
+        self._load_following(user_ids - self._checked_user_ids)
+
+    def _load_likes(self, message_ids):
+        if not message_ids:
+            return
+
+        rows = (db.session
+                .query(Like.msg_id)
+                .filter(Like.user_liked_id == self.user_id,
+                        Like.msg_id.in_(message_ids))
+                .all())
+
+        self._liked_ids.update(msg_id for (msg_id,) in rows)
+        self._checked_message_ids.update(message_ids)
+
+    def _load_following(self, user_ids):
+        if not user_ids or graphindex.enabled():
+            return
+
+        rows = (db.session
+                .query(Follows.user_being_followed_id)
+                .filter(Follows.user_following_id == self.user_id,
+                        Follows.user_being_followed_id.in_(user_ids))
+                .all())
+
+        self._following_ids.update(user_id for (user_id,) in rows)
+        self._checked_user_ids.update(user_ids)
+
+    def has_liked(self, message):
+        """Does the viewer like `message`?"""
+
+        if self.user_id is None:
+            return False
+
+        if message.id not in self._checked_message_ids:
+            self._load_likes({message.id})
+
+        return message.id in self._liked_ids
+
+    def is_following(self, user):
+        """Does the viewer follow `user`?"""
+
+        if self.user_id is None:
+            return False
+
+        if graphindex.enabled():
+            return graphindex.graph_index.is_following(self.user_id, user.id)
+
+        if user.id not in self._checked_user_ids:
+            self._load_following({user.id})
+
+        return user.id in self._following_ids